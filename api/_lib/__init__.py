@@ -0,0 +1,5 @@
+"""Shared helpers for the api/*.py handlers.
+
+Vercel builds every api/*.py file as its own function; this package is not
+matched by that glob and is imported by the handlers instead.
+"""
@@ -0,0 +1,206 @@
+"""
+In-memory snapshot of vanzari + firme for the B2B endpoints.
+
+vanzari has only a few thousand rows, so a warm instance keeps it as column
+arrays (numbers as scaled integers, text dictionary-encoded) and answers the
+firme.html profiles with where() + one aggregate() pass instead of several
+GROUP BY round-trips. snapshot() checks a cheap data version on every call and
+reloads only when vanzari or firme changed.
+"""
+import threading
+from array import array
+from datetime import date
+
+NULL = -2 ** 63
+
+# NUMERIC columns -> scale; stored as exact integers so sums match SQL
+SCALE = {
+    'cantitate_livrata': 100, 'scazamant_kg': 100, 'scazamant_ron': 100, 'cantitate_receptionata': 100,
+    'valoare_ron': 100, 'valoare_euro': 100, 'adaos': 100, 'transport_ron': 100, 'adaos_final': 100,
+    'pret_achizitie': 10000, 'pret_vanzare': 10000,
+}
+INTS = ('id', 'firma_id', 'year', 'month')
+TEXT = ('numar_aviz', 'tip_deseu', 'numar_auto', 'nume_sofer', 'tara_destinatie', 'transportator', 'firma_name')
+
+# Bumped by triggers on vanzari / firme (migration 016)
+VERSION_SQL = """
+    SELECT COALESCE(string_agg(table_name || ':' || version, '/' ORDER BY table_name), '') AS version
+    FROM data_versions WHERE table_name IN ('firme', 'vanzari')
+"""
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+class Snapshot:
+    def __init__(self, version, rows):
+        self.version = version
+        self.n = len(rows)
+        self.cols = {}
+        self.dicts = {}      # text column -> list of distinct values (code = index)
+        self.codes = {}      # text column -> {value: code}
+        for c in INTS:
+            self.cols[c] = array('q', (NULL if r[c] is None else r[c] for r in rows))
+        for c, scale in SCALE.items():
+            self.cols[c] = array('q', (NULL if r[c] is None else int(round(r[c] * scale)) for r in rows))
+        self.cols['data'] = array('q', (r['data'].toordinal() for r in rows))
+        for c in TEXT:
+            values, codes = [], {}
+            col = array('q')
+            for r in rows:
+                v = r[c]
+                if v is None:
+                    col.append(NULL)
+                    continue
+                if v not in codes:
+                    codes[v] = len(values)
+                    values.append(v)
+                col.append(codes[v])
+            self.cols[c] = col
+            self.dicts[c] = values
+            self.codes[c] = codes
+
+    def code(self, column, value):
+        """Encoded value for filters / comparisons (None if absent)."""
+        if column in self.codes:
+            return self.codes[column].get(value)
+        if column in SCALE:
+            return int(round(value * SCALE[column]))
+        if column == 'data':
+            return value.toordinal()
+        return value
+
+    def decode(self, column, raw):
+        if raw == NULL:
+            return None
+        if column in self.dicts:
+            return self.dicts[column][raw]
+        if column in SCALE:
+            return raw / SCALE[column]
+        if column == 'data':
+            return date.fromordinal(raw)
+        return raw
+
+    def where(self, idx=None, **equals):
+        """Row indexes (optionally within idx) whose columns equal the given values."""
+        rows = range(self.n) if idx is None else idx
+        for column, value in equals.items():
+            code = self.code(column, value)
+            if code is None:
+                return []
+            col = self.cols[column]
+            rows = [i for i in rows if col[i] == code]
+        return list(rows)
+
+    def row(self, i, columns):
+        return {c: self.decode(c, self.cols[c][i]) for c in columns}
+
+    def aggregate(self, idx, groupings):
+        """Several GROUP BYs in a single pass over idx.
+
+        groupings: {name: (key, measures[, skip_blank[, when]])}
+          key      - column, tuple of columns, or None for one total row;
+                     rows with a NULL key (or '' when skip_blank) are skipped
+          measures - {out: (op, column)}, op in count / sum / distinct / min / max;
+                     count with a column counts non-NULL values, sum of nothing is 0
+          when     - optional predicate on the row index (a per-grouping WHERE)
+        Returns {name: [dict(key columns..., measures...)]} in first-seen key order.
+        """
+        plans = []
+        for name, spec in groupings.items():
+            key, measures = spec[0], spec[1]
+            key_cols = () if key is None else (key,) if isinstance(key, str) else tuple(key)
+            skip = {NULL}
+            if len(spec) > 2 and spec[2]:
+                for c in key_cols:
+                    blank = self.codes[c].get('') if c in self.codes else None
+                    if blank is not None:
+                        skip.add(blank)
+            when = spec[3] if len(spec) > 3 else None
+            ops = [(out, op, self.cols[c] if c else None) for out, (op, c) in measures.items()]
+            plans.append((name, key_cols, [self.cols[c] for c in key_cols], skip, when, ops, {}))
+
+        for i in idx:
+            for _, key_cols, key_arrays, skip, when, ops, groups in plans:
+                if when is not None and not when(i):
+                    continue
+                key = tuple(a[i] for a in key_arrays)
+                if any(k in skip for k in key):
+                    continue
+                acc = groups.get(key)
+                if acc is None:
+                    acc = groups[key] = [set() if op == 'distinct' else None if op in ('min', 'max') else 0
+                                         for _, op, _ in ops]
+                for j, (_, op, col) in enumerate(ops):
+                    if col is None:
+                        acc[j] += 1
+                        continue
+                    v = col[i]
+                    if v == NULL:
+                        continue
+                    if op == 'count':
+                        acc[j] += 1
+                    elif op == 'sum':
+                        acc[j] += v
+                    elif op == 'distinct':
+                        acc[j].add(v)
+                    elif op == 'min':
+                        acc[j] = v if acc[j] is None or v < acc[j] else acc[j]
+                    else:
+                        acc[j] = v if acc[j] is None or v > acc[j] else acc[j]
+
+        result = {}
+        for name, key_cols, _, _, _, ops, groups in plans:
+            if not key_cols and not groups:
+                groups[()] = [set() if op == 'distinct' else None if op in ('min', 'max') else 0 for _, op, _ in ops]
+            out_rows = []
+            for key, acc in groups.items():
+                out = {c: self.decode(c, k) for c, k in zip(key_cols, key)}
+                for (out_name, op, _), value in zip(ops, acc):
+                    column = groupings[name][1][out_name][1]
+                    if op == 'distinct':
+                        out[out_name] = len(value)
+                    elif op == 'count':
+                        out[out_name] = value
+                    elif value is None:
+                        out[out_name] = None
+                    else:
+                        out[out_name] = self.decode(column, value)
+                out_rows.append(out)
+            result[name] = out_rows
+        return result
+
+
+def order(rows, by, desc=True, limit=None):
+    """Sort aggregate() rows by one measure (stable, so ties keep key order)."""
+    rows = sorted(rows, key=lambda r: r[by], reverse=desc)
+    return rows[:limit] if limit else rows
+
+
+def _load(cur, version):
+    cur.execute("""
+        SELECT v.id, v.firma_id, v.data, v.year, v.month, v.numar_aviz, v.tip_deseu,
+               v.cantitate_livrata, v.pret_achizitie, v.scazamant_kg, v.scazamant_ron,
+               v.cantitate_receptionata, v.pret_vanzare, v.valoare_ron, v.valoare_euro,
+               v.adaos, v.transport_ron, v.adaos_final,
+               v.numar_auto, v.nume_sofer, v.tara_destinatie, v.transportator,
+               f.name AS firma_name
+        FROM vanzari v
+        LEFT JOIN firme f ON f.id = v.firma_id
+        ORDER BY v.id
+    """)
+    return Snapshot(version, cur.fetchall())
+
+
+def snapshot(cur):
+    """Current vanzari + firme snapshot (reloaded when the data version changes)."""
+    global _snapshot
+    cur.execute(VERSION_SQL)
+    version = cur.fetchone()['version']
+    snap = _snapshot
+    if snap is not None and snap.version == version:
+        return snap
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = _load(cur, version)
+        return _snapshot
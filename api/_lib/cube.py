@@ -0,0 +1,152 @@
+"""
+cube_activity - pre-aggregated (year, month, category, county, sex, age_group,
+age_group_now) cube. age_group is the age at transaction time, age_group_now the
+age today; both are bucketed by the SQL age_group() function.
+Built by refresh_cube_activity() (scripts/migrations/004_create_cube_activity.sql,
+redefined in 010_create_age_groups.sql).
+
+Every query takes a month subset and an optional waste category id (see
+resolve_category()) and answers from the cube instead of joining transactions x
+items x partners. Cells are per category, so exactly one category is read at a
+time; category_id=None reads the document-level cells (category_id = 0).
+"""
+
+DIMENSIONS = ('county', 'sex', 'age_group', 'age_group_now')
+AGE_ORDER = ['18-24', '25-34', '35-44', '45-54', '55-64', '65+', 'Necunoscut']
+
+
+def resolve_category(cur, name):
+    """(id, name) of the waste category called name (case-insensitive, exact).
+    ValueError when no category or more than one has that name."""
+    cur.execute("SELECT id, name FROM waste_categories WHERE lower(name) = lower(%s) ORDER BY id",
+                (name.strip(),))
+    rows = cur.fetchall()
+    if not rows:
+        raise ValueError(f'Unknown waste category: {name}')
+    if len(rows) > 1:
+        raise ValueError(f'Ambiguous waste category: {name}')
+    return rows[0]['id'], rows[0]['name']
+
+
+def _cells(months=None, category_id=None, per_category=False):
+    """WHERE clause + params selecting the cube cells for a months x category slice.
+    per_category=True (without a category) selects the per-category cells instead
+    of the document-level ones."""
+    where = []
+    params = []
+    if months:
+        where.append("c.month = ANY(%s)")
+        params.append(list(months))
+    if category_id is not None:
+        where.append("c.category_id = %s")
+        params.append(category_id)
+    elif per_category:
+        where.append("c.category_id <> 0")
+    else:
+        where.append("c.category_id = 0")
+    return ' AND '.join(where), params
+
+
+def year_totals(cur, months=None, category_id=None):
+    """Per-year measures: transactions, values, kg, avg price, distinct partners, working days."""
+    where, params = _cells(months, category_id)
+    cur.execute(f"""
+        WITH cells AS (
+            SELECT * FROM cube_activity c WHERE {where}
+        ),
+        totals AS (
+            SELECT year,
+                   SUM(transactions) AS transactions,
+                   SUM(gross_value) AS total_value,
+                   SUM(net_paid) AS total_paid,
+                   SUM(weight_kg) AS total_kg,
+                   SUM(item_value) AS item_value,
+                   ROUND(SUM(price_sum) / NULLIF(SUM(items), 0), 2) AS avg_price
+            FROM cells
+            GROUP BY year
+        ),
+        days AS (
+            SELECT year, SUM(length(replace(mask::bit(31)::text, '0', ''))) AS working_days
+            FROM (SELECT year, month, bit_or(day_mask) AS mask FROM cells GROUP BY year, month) m
+            GROUP BY year
+        ),
+        uniq AS (
+            SELECT year, COUNT(DISTINCT cnp) AS unique_partners
+            FROM cells, unnest(cells.partners) AS cnp
+            GROUP BY year
+        )
+        SELECT t.year::int AS year, t.transactions::int AS transactions, t.total_value, t.total_paid,
+               t.total_kg, t.item_value, t.avg_price,
+               COALESCE(u.unique_partners, 0) AS unique_partners,
+               COALESCE(d.working_days, 0)::int AS working_days
+        FROM totals t
+        LEFT JOIN days d ON d.year = t.year
+        LEFT JOIN uniq u ON u.year = t.year
+        ORDER BY t.year
+    """, params)
+    return cur.fetchall()
+
+
+def partners_by(cur, dim, months=None, category_id=None, per_year=True):
+    """Distinct partners per dimension value (optionally per year), largest first."""
+    if dim not in DIMENSIONS:
+        raise ValueError(f'Unknown cube dimension: {dim}')
+    where, params = _cells(months, category_id)
+    year_col = 'c.year::int AS year, ' if per_year else ''
+    group = 'c.year, ' if per_year else ''
+    cur.execute(f"""
+        SELECT {year_col}c.{dim} AS value, COUNT(DISTINCT cnp) AS cnt
+        FROM cube_activity c, unnest(c.partners) AS cnp
+        WHERE {where}
+        GROUP BY {group}c.{dim}
+        ORDER BY {group}cnt DESC
+    """, params)
+    return cur.fetchall()
+
+
+def measures_by(cur, dim, months=None, category_id=None, limit=None, known_only=False):
+    """transactions / gross value / kg / item value / distinct partners per dimension
+    value across all years, by kg desc.
+    known_only drops the 'Necunoscut' / '' sentinel values."""
+    if dim not in DIMENSIONS:
+        raise ValueError(f'Unknown cube dimension: {dim}')
+    where, params = _cells(months, category_id)
+    if known_only:
+        where += f" AND c.{dim} NOT IN ('Necunoscut', '')"
+    limit_sql = ''
+    if limit:
+        limit_sql = 'LIMIT %s'
+        params = params + [limit]
+    cur.execute(f"""
+        WITH cells AS (
+            SELECT * FROM cube_activity c WHERE {where}
+        )
+        SELECT m.value, m.transactions, m.gross_value, m.total_kg, m.total_value, p.partners
+        FROM (
+            SELECT {dim} AS value, SUM(transactions)::int AS transactions, SUM(gross_value) AS gross_value,
+                   SUM(weight_kg) AS total_kg, SUM(item_value) AS total_value
+            FROM cells GROUP BY {dim}
+        ) m
+        JOIN (
+            SELECT {dim} AS value, COUNT(DISTINCT cnp) AS partners
+            FROM cells, unnest(cells.partners) AS cnp GROUP BY {dim}
+        ) p ON p.value = m.value
+        ORDER BY m.total_kg DESC
+        {limit_sql}
+    """, params)
+    return cur.fetchall()
+
+
+def category_breakdown(cur, months=None):
+    """kg / value per (year, category) for the selected months."""
+    where, params = _cells(months, per_category=True)
+    cur.execute(f"""
+        SELECT c.year::int AS year, wc.name AS category,
+               SUM(c.weight_kg) AS total_kg, SUM(c.item_value) AS total_value
+        FROM cube_activity c
+        JOIN waste_categories wc ON wc.id = c.category_id
+        WHERE {where}
+        GROUP BY c.year, wc.name
+        ORDER BY year, total_kg DESC
+    """, params)
+    return cur.fetchall()
@@ -0,0 +1,83 @@
+"""
+geo_stats - pre-aggregated (year, county, normalized city, category) rollup.
+Built by refresh_geo_stats() (scripts/migrations/009_create_geo_stats.sql).
+
+Same conventions as cube.py: an optional category_id (cube.resolve_category())
+selects that category's cells, otherwise the document-level ones (category_id = 0)
+are read.
+"""
+
+# dim -> key columns of the cells (the first one is returned as `value`)
+DIMENSIONS = {
+    'county': ('county',),
+    'city': ('normalized_city', 'county'),
+    'category': ('category',),
+}
+ORDER = ('transactions', 'gross_value', 'total_kg', 'total_value', 'partners')
+
+
+def _cells(year=None, category_id=None, county=None, city=None, per_category=False):
+    """WHERE clause + params for a year x category x county x city slice."""
+    where = []
+    params = []
+    if year:
+        where.append("g.year = %s")
+        params.append(int(year))
+    if county:
+        where.append("g.county ILIKE %s")
+        params.append(f'%{county}%')
+    if city:
+        where.append("g.normalized_city = normalize_city(%s)")
+        params.append(city)
+    if category_id is not None:
+        where.append("g.category_id = %s")
+        params.append(category_id)
+    elif per_category:
+        where.append("g.category_id <> 0")
+    else:
+        where.append("g.category_id = 0")
+    return ' AND '.join(where), params
+
+
+def measures_by(cur, dim, year=None, category_id=None, county=None, city=None,
+                order='total_value', limit=None, known_only=True):
+    """transactions / gross value / kg / item value / distinct partners per dimension
+    value, largest `order` first. known_only drops the 'Necunoscut' / '' sentinels."""
+    if dim not in DIMENSIONS:
+        raise ValueError(f'Unknown geo dimension: {dim}')
+    if order not in ORDER:
+        raise ValueError(f'Unknown geo order: {order}')
+    keys = DIMENSIONS[dim]
+    where, params = _cells(year, category_id, county, city, per_category=(dim == 'category'))
+    if known_only and dim == 'county':
+        where += " AND g.county <> 'Necunoscut'"
+    elif known_only and dim == 'city':
+        where += " AND g.normalized_city <> ''"
+    join = 'JOIN waste_categories wc ON wc.id = g.category_id' if dim == 'category' else ''
+    category_col = ', wc.name AS category' if dim == 'category' else ''
+    group = ', '.join(keys)
+    select = ', '.join([f'm.{keys[0]} AS value'] + [f'm.{k}' for k in keys[1:]])
+    limit_sql = ''
+    if limit:
+        limit_sql = 'LIMIT %s'
+        params = params + [limit]
+    cur.execute(f"""
+        WITH cells AS (
+            SELECT g.*{category_col} FROM geo_stats g {join} WHERE {where}
+        )
+        SELECT {select}, m.transactions, m.gross_value, m.total_kg, m.total_value,
+               COALESCE(p.partners, 0) AS partners
+        FROM (
+            SELECT {group},
+                   SUM(transactions)::int AS transactions, SUM(gross_value) AS gross_value,
+                   SUM(weight_kg) AS total_kg, SUM(item_value) AS total_value
+            FROM cells GROUP BY {group}
+        ) m
+        LEFT JOIN (
+            SELECT {group}, COUNT(DISTINCT cnp)::int AS partners
+            FROM cells, unnest(cells.partners) AS cnp GROUP BY {group}
+        ) p USING ({group})
+        ORDER BY {order} DESC
+        {limit_sql}
+    """, params)
+    return cur.fetchall()
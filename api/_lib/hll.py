@@ -0,0 +1,106 @@
+"""
+HyperLogLog sketch for distinct partner (CNP) counts.
+
+Pure Python, no extension needed. p=12 -> 4096 registers, ~1.6% standard error.
+Serialized as  b'HL' | version | p | format | payload  where format 0 is the
+dense register array and format 1 is sparse (idx: uint16 BE, rho: uint8)
+triples, used while the sketch has few non-zero registers (daily sketches).
+"""
+import math
+import struct
+from functools import lru_cache
+from hashlib import blake2b
+
+P = 12
+VERSION = 1
+_DENSE, _SPARSE = 0, 1
+
+
+@lru_cache(maxsize=65536)
+def _hash64(value):
+    return int.from_bytes(blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HLL:
+    def __init__(self, p=P):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value):
+        x = _hash64(value)
+        idx = x >> (64 - self.p)
+        w = x & ((1 << (64 - self.p)) - 1)
+        rho = (64 - self.p) - w.bit_length() + 1
+        if rho > self.registers[idx]:
+            self.registers[idx] = rho
+
+    def update(self, values):
+        for v in values:
+            self.add(v)
+        return self
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError(f'HLL precision mismatch: {self.p} vs {other.p}')
+        regs = self.registers
+        for i, r in enumerate(other.registers):
+            if r > regs[i]:
+                regs[i] = r
+        return self
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        nonzero = [(i, r) for i, r in enumerate(self.registers) if r]
+        if 3 * len(nonzero) < self.m:
+            payload = b''.join(struct.pack('>HB', i, r) for i, r in nonzero)
+            return b'HL' + bytes([VERSION, self.p, _SPARSE]) + payload
+        return b'HL' + bytes([VERSION, self.p, _DENSE]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        if data[:2] != b'HL' or data[2] != VERSION:
+            raise ValueError('Not an HLL sketch (or unknown version)')
+        sketch = cls(data[3])
+        payload = data[5:]
+        if data[4] == _DENSE:
+            sketch.registers[:] = payload
+        else:
+            for i, r in struct.iter_unpack('>HB', payload):
+                sketch.registers[i] = r
+        return sketch
+
+
+def self_test():
+    exact = [f'{1800101000000 + i * 7919}' for i in range(20000)]
+    for n in (1, 10, 100, 1000, 5000, 20000):
+        est = HLL().update(exact[:n]).count()
+        err = abs(est - n) / n
+        assert err < 0.05, f'n={n}: estimate {est} off by {err:.1%}'
+    # Merge == union; duplicates don't count
+    a = HLL().update(exact[:12000])
+    b = HLL().update(exact[8000:])
+    b.update(exact[:100])
+    merged = HLL().merge(a).merge(b)
+    assert merged.registers == HLL().update(exact).registers
+    # Round-trip both encodings
+    small = HLL().update(exact[:50])
+    assert small.to_bytes()[4] == _SPARSE
+    assert HLL.from_bytes(small.to_bytes()).registers == small.registers
+    assert merged.to_bytes()[4] == _DENSE
+    assert HLL.from_bytes(merged.to_bytes()).registers == merged.registers
+    print(f'HLL OK: p={P}, 20000 distinct -> {merged.count()}, sparse {len(small.to_bytes())} bytes for 50')
+
+
+if __name__ == '__main__':
+    self_test()
@@ -0,0 +1,155 @@
+"""
+Open-Meteo 7-day forecast for Oradea, cached in weather_forecast.
+
+refresh() fetches the forecast (daily fields + hourly means) and replaces the
+cached days; scripts/fetch_weather.py --forecast runs it as a job. cached()
+serves /api/weather?type=forecast: fresh rows (younger than
+PAJU_FORECAST_TTL_MINUTES) are returned as they are, stale or missing ones
+trigger one live refresh and, if Open-Meteo is slow or down, the last good
+forecast is returned instead. After a failed live refresh the instance serves
+the cache without trying again for PAJU_FORECAST_RETRY_MINUTES. OPEN_METEO_FORECAST_URL points the client at a
+local stub for tests.
+"""
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timezone
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from psycopg2.extras import Json, execute_values
+
+from . import weatherparse
+
+FORECAST_LAT = 47.0722
+FORECAST_LON = 21.9217
+FORECAST_TZ = "Europe/Bucharest"
+FORECAST_URL = os.environ.get("OPEN_METEO_FORECAST_URL", "https://api.open-meteo.com/v1/forecast")
+TTL_MINUTES = float(os.environ.get("PAJU_FORECAST_TTL_MINUTES", "180"))
+RETRY_MINUTES = float(os.environ.get("PAJU_FORECAST_RETRY_MINUTES", "10"))
+LIVE_TIMEOUT = 5
+
+# time.monotonic() of the last failed live refresh in this instance
+_last_failure = None
+_failure_lock = threading.Lock()
+
+FORECAST_DAILY_FIELDS = [
+    "temperature_2m_max", "temperature_2m_min", "temperature_2m_mean",
+    "apparent_temperature_max", "apparent_temperature_min",
+    "precipitation_sum", "rain_sum", "snowfall_sum", "snow_depth_max",
+    "precipitation_hours", "windspeed_10m_max", "windgusts_10m_max",
+    "winddirection_10m_dominant", "weather_code",
+]
+FORECAST_HOURLY_MAP = weatherparse.HOURLY_MEANS
+FORECAST_HOURLY_FIELDS = list(FORECAST_HOURLY_MAP)
+
+FORECAST_DAILY_MAP = {
+    "temperature_2m_max": "temp_max",
+    "temperature_2m_min": "temp_min",
+    "temperature_2m_mean": "temp_mean",
+    "apparent_temperature_max": "apparent_temp_max",
+    "apparent_temperature_min": "apparent_temp_min",
+    "precipitation_sum": "precipitation_sum",
+    "rain_sum": "rain_sum",
+    "snowfall_sum": "snowfall_sum",
+    "snow_depth_max": "snow_depth_max",
+    "precipitation_hours": "precipitation_hours",
+    "windspeed_10m_max": "wind_speed_max",
+    "windgusts_10m_max": "wind_gusts_max",
+    "winddirection_10m_dominant": "wind_direction_dominant",
+    "weather_code": "weather_code",
+}
+
+
+def fetch_json(url, timeout):
+    req = Request(url, headers={"User-Agent": "paju-dashboard/1.0"})
+    with urlopen(req, timeout=timeout) as r:
+        return json.loads(r.read().decode("utf-8"))
+
+
+def fetch_forecast(forecast_days=7, timeout=10):
+    """Fetch forecast from Open-Meteo, return dict: {date -> {col: value}}.
+    Returns None on network/API failure."""
+    daily_q = {
+        "latitude": FORECAST_LAT, "longitude": FORECAST_LON,
+        "timezone": FORECAST_TZ, "forecast_days": forecast_days,
+        "daily": ",".join(FORECAST_DAILY_FIELDS),
+    }
+    hourly_q = {
+        "latitude": FORECAST_LAT, "longitude": FORECAST_LON,
+        "timezone": FORECAST_TZ, "forecast_days": forecast_days,
+        "hourly": ",".join(FORECAST_HOURLY_FIELDS),
+    }
+    try:
+        daily = fetch_json(FORECAST_URL + "?" + urlencode(daily_q), timeout)
+        hourly = fetch_json(FORECAST_URL + "?" + urlencode(hourly_q), timeout)
+    except Exception:
+        return None
+
+    per_day = weatherparse.daily_values(daily, FORECAST_DAILY_MAP)
+    weatherparse.hourly_means(hourly, FORECAST_HOURLY_MAP, per_day)
+    return per_day
+
+
+def store(cur, per_day):
+    """Upsert per_day into the cache and drop days before it (caller commits)."""
+    days = sorted(per_day)
+    now = datetime.now(timezone.utc)
+    execute_values(cur, """
+        INSERT INTO weather_forecast (date, weather, fetched_at) VALUES %s
+        ON CONFLICT (date) DO UPDATE SET weather = EXCLUDED.weather, fetched_at = EXCLUDED.fetched_at
+    """, [(d, Json(per_day[d]), now) for d in days])
+    cur.execute("DELETE FROM weather_forecast WHERE date < %s", (days[0],))
+    return len(days)
+
+
+def refresh(cur, forecast_days=7, timeout=10):
+    """Fetch and store the forecast. Returns the number of days, None if the fetch failed."""
+    per_day = fetch_forecast(forecast_days, timeout)
+    if not per_day:
+        return None
+    return store(cur, per_day)
+
+
+def _load(cur):
+    cur.execute("""
+        SELECT date, weather, fetched_at FROM weather_forecast
+        WHERE date >= %s ORDER BY date
+    """, (date.today(),))
+    rows = cur.fetchall()
+    if not rows:
+        return None, None
+    return {r["date"].isoformat(): r["weather"] for r in rows}, min(r["fetched_at"] for r in rows)
+
+
+def _backing_off():
+    with _failure_lock:
+        return _last_failure is not None and time.monotonic() - _last_failure < RETRY_MINUTES * 60
+
+
+def _record_failure():
+    global _last_failure
+    with _failure_lock:
+        _last_failure = time.monotonic()
+
+
+def cached(cur, forecast_days=7):
+    """Forecast for the API: ({date -> {col: value}} or None, fetched_at, stale)."""
+    per_day, fetched_at = _load(cur)
+    age_minutes = (datetime.now(timezone.utc) - fetched_at).total_seconds() / 60 if fetched_at else None
+    if per_day and age_minutes < TTL_MINUTES:
+        return per_day, fetched_at, False
+    if _backing_off():
+        return per_day, fetched_at, per_day is not None
+    try:
+        if refresh(cur, forecast_days, LIVE_TIMEOUT) is not None:
+            cur.connection.commit()
+            per_day, fetched_at = _load(cur)
+            return per_day, fetched_at, False
+    except Exception:
+        # refresh() returns None on network errors; this is the upsert / commit
+        # failing (e.g. a concurrent refresh). Keep serving the cache.
+        cur.connection.rollback()
+    _record_failure()
+    return per_day, fetched_at, per_day is not None
@@ -0,0 +1,107 @@
+"""
+Concurrent execution of independent query groups on pooled connections.
+
+fan_out() takes {name: fn(cur)} and runs every task on a thread pool, each on
+its own pooled connection, then returns the results plus a per-task timing
+breakdown in ms. Request latency approaches the slowest task instead of the sum.
+PAJU_FANOUT=0 (or a single task) runs them sequentially on the caller's cursor.
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+from .querylog import TimedCursor
+
+MAX_WORKERS = int(os.environ.get('PAJU_FANOUT_WORKERS', '6'))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _db_url():
+    db_url = os.environ.get('POSTGRES_URL') or os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL_NO_SSL')
+    if not db_url:
+        raise Exception("No database URL configured. Set POSTGRES_URL or DATABASE_URL environment variable.")
+    return db_url
+
+
+class _LazyPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool that opens connections on demand but keeps up to
+    maxconn of them idle. psycopg2 only keeps minconn idle connections and opens
+    all minconn eagerly, so minconn=0 would close every connection handed back."""
+
+    def __init__(self, maxconn, *args, **kwargs):
+        super().__init__(0, maxconn, *args, **kwargs)
+        self.minconn = self.maxconn
+
+
+def get_pool():
+    """Process-wide pool; survives between invocations of a warm function."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = _LazyPool(MAX_WORKERS, _db_url(), cursor_factory=TimedCursor)
+        return _pool
+
+
+class _TaskCursor(TimedCursor):
+    """TimedCursor that counts its completed execute() calls."""
+    executed = 0
+
+    def execute(self, query, vars=None):
+        result = super().execute(query, vars)
+        self.executed += 1
+        return result
+
+
+def _run(fn):
+    pool = get_pool()
+    for attempt in (0, 1):
+        conn = pool.getconn()
+        t0 = time.perf_counter()
+        cur = None
+        try:
+            with conn.cursor(cursor_factory=_TaskCursor) as cur:
+                result = fn(cur)
+            conn.rollback()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            # Only an idle connection the server dropped (dead before any query
+            # completed) is retried; timeouts / cancels and other server errors
+            # leave the connection open and are raised. Read before putconn(),
+            # which closes it.
+            dropped = conn.closed and not isinstance(e, psycopg2.extensions.QueryCanceledError)
+            pool.putconn(conn, close=True)
+            if attempt or not dropped or (cur is not None and cur.executed):
+                raise
+            continue
+        except Exception:
+            pool.putconn(conn, close=True)
+            raise
+        pool.putconn(conn)
+        return result, (time.perf_counter() - t0) * 1000
+
+
+def fan_out(tasks, cur=None):
+    """Run {name: fn(cur)} concurrently. Returns ({name: result}, {name: ms, ..., 'total': ms})."""
+    t0 = time.perf_counter()
+    results, timing = {}, {}
+    if cur is not None and (len(tasks) < 2 or os.environ.get('PAJU_FANOUT') == '0'):
+        for name, fn in tasks.items():
+            t = time.perf_counter()
+            results[name] = fn(cur)
+            timing[name] = round((time.perf_counter() - t) * 1000, 1)
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(tasks)))) as ex:
+            # Each task gets a copy of the request context so its queries reach the QueryLog
+            futures = {name: ex.submit(contextvars.copy_context().run, _run, fn) for name, fn in tasks.items()}
+            for name, future in futures.items():
+                results[name], ms = future.result()
+                timing[name] = round(ms, 1)
+    timing['total'] = round((time.perf_counter() - t0) * 1000, 1)
+    return results, timing
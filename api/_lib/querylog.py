@@ -0,0 +1,179 @@
+"""
+Per-request query timing and slow-query log.
+
+Handlers connect with cursor_factory=TimedCursor, call start() once the
+endpoint is known and finish() before closing the connection. Every execute()
+is recorded (duration, row count, normalized SQL fingerprint); finish() writes
+queries slower than PAJU_SLOW_QUERY_MS into query_log - with parameters and
+error messages redacted, no CNPs or names - and returns the Server-Timing
+header value.
+The recorder lives in a ContextVar, so parallel.fan_out() threads report into it.
+"""
+import contextvars
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
+
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
+
+SLOW_MS = float(os.environ.get('PAJU_SLOW_QUERY_MS', '500'))
+SERVER_TIMING_TOP = 3
+
+_current = contextvars.ContextVar('paju_querylog', default=None)
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+_QUOTED = re.compile(r'"(?:[^"]|"")*"')
+
+
+def normalize(sql):
+    """SQL with literals / placeholders replaced by ? and whitespace collapsed."""
+    sql = _LITERAL.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _NUMBER.sub('?', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize(sql).encode('utf-8')).hexdigest()[:12]
+
+
+def _redact_value(v):
+    if v is None or isinstance(v, (bool, int, float)):
+        return v
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    if isinstance(v, (list, tuple)):
+        return f'<{len(v)} items>'
+    return '<str>'
+
+
+def redact(params):
+    """Keep numbers and dates, hide every string (CNPs, names, addresses)."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: _redact_value(v) for k, v in params.items()}
+    return [_redact_value(v) for v in params]
+
+
+def redact_error(e):
+    """Exception type, SQLSTATE and primary message with quoted values hidden.
+
+    str(e) of a psycopg2 error carries the DETAIL line (Key (cnp)=(...) already
+    exists) and messages like 'invalid input syntax ...: "<value>"', so only
+    diag.message_primary is kept and its quoted parts become "?".
+    """
+    name = type(e).__name__
+    diag = getattr(e, 'diag', None)
+    primary = diag.message_primary if diag is not None else None
+    if not primary:
+        return name
+    code = getattr(e, 'pgcode', None)
+    if code:
+        name = f'{name} [{code}]'
+    return (f'{name}: ' + _QUOTED.sub('"?"', primary))[:500]
+
+
+class QueryLog:
+    def __init__(self, endpoint, conn):
+        self.endpoint = endpoint
+        self.conn = conn
+        self.started = time.perf_counter()
+        self.entries = []
+
+    def record(self, sql, params, ms, rows, error=None):
+        self.entries.append({'sql': sql, 'params': params, 'ms': ms, 'rows': rows, 'error': error})
+
+    def server_timing(self):
+        db_ms = sum(e['ms'] for e in self.entries)
+        parts = [f'db;dur={db_ms:.1f};desc="{len(self.entries)} queries"']
+        slowest = sorted(self.entries, key=lambda e: e['ms'], reverse=True)[:SERVER_TIMING_TOP]
+        for i, e in enumerate(slowest, 1):
+            parts.append(f'q{i};dur={e["ms"]:.1f};desc="{fingerprint(e["sql"])}"')
+        parts.append(f'app;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(parts)
+
+    def flush(self):
+        """Append slow / failed queries to query_log. Never raises."""
+        slow = [e for e in self.entries if e['ms'] >= SLOW_MS or e['error']]
+        if not slow or self.conn is None or self.conn.closed:
+            return 0
+        rows = [(self.endpoint, fingerprint(e['sql']), normalize(e['sql']),
+                 json.dumps(redact(e['params'])), round(e['ms'], 1), e['rows'], e['error'])
+                for e in slow]
+        try:
+            self.conn.rollback()
+            # Plain cursor: these inserts are not themselves recorded
+            with self.conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+                execute_values(cur, """
+                    INSERT INTO query_log (endpoint, fingerprint, query, params, duration_ms, row_count, error)
+                    VALUES %s
+                """, rows)
+            self.conn.commit()
+        except Exception:
+            try:
+                self.conn.rollback()
+            except Exception:
+                pass
+            return 0
+        return len(rows)
+
+
+class TimedCursor(RealDictCursor):
+    """RealDictCursor that reports every execute() to the current QueryLog."""
+
+    def execute(self, query, vars=None):
+        log = _current.get()
+        if log is None:
+            return super().execute(query, vars)
+        t0 = time.perf_counter()
+        error = None
+        try:
+            return super().execute(query, vars)
+        except Exception as e:
+            error = redact_error(e)
+            raise
+        finally:
+            sql = query if isinstance(query, str) else query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+            log.record(sql, vars, (time.perf_counter() - t0) * 1000, self.rowcount, error)
+
+
+def label(path):
+    """Endpoint label without parameter values: /api/analytics?type=tops, /api/partners?cnp."""
+    parsed = urlparse(path)
+    params = parse_qs(parsed.query, keep_blank_values=True)
+    keys = sorted(k for k in params if k != 'type')
+    if 'type' in params:
+        keys.insert(0, f"type={params['type'][0][:40]}")
+    return (parsed.path + ('?' + '&'.join(keys) if keys else ''))[:100]
+
+
+def start(endpoint, conn=None):
+    """Begin recording for this request. endpoint must not contain parameter values."""
+    log = QueryLog(endpoint, conn)
+    _current.set(log)
+    return log
+
+
+def current():
+    return _current.get()
+
+
+def finish():
+    """Flush slow queries and return the Server-Timing header value ('' if not started)."""
+    log = _current.get()
+    if log is None:
+        return ''
+    log.flush()
+    _current.set(None)
+    return log.server_timing()
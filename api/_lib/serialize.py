@@ -0,0 +1,114 @@
+"""
+JSON responses for the api/*.py handlers.
+
+dumps() uses orjson when it is installed (dates, datetimes and dict subclasses
+such as RealDictRow natively, Decimal through default()) and falls back to the
+stdlib json module with the same output conventions. send_json() writes the
+response and compresses it with brotli / gzip when the client accepts it and
+the body is larger than PAJU_COMPRESS_MIN_BYTES; PAJU_COMPRESS=0 turns
+compression off (e.g. when a proxy in front already does it).
+
+register_casters() makes psycopg2 return NUMERIC as float and, optionally,
+DATE as the ISO string Postgres sends, so rows need no Decimal / date
+conversion at serialization time. It is opt-in per connection: handlers that
+do date arithmetic or exact Decimal math on fetched values must not use it.
+"""
+import gzip
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+import psycopg2.extensions
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS = os.environ.get('PAJU_COMPRESS', '1') != '0'
+COMPRESS_MIN_BYTES = int(os.environ.get('PAJU_COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+DATE_OID, DATE_ARRAY_OID = 1082, 1182
+NUMERIC_ARRAY_OID = 1231
+
+
+def default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    raise TypeError(f'Not serializable: {type(obj)}')
+
+
+if orjson is not None:
+    _ORJSON_OPTS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(payload):
+        """UTF-8 JSON bytes of payload."""
+        return orjson.dumps(payload, default=default, option=_ORJSON_OPTS)
+else:
+    _encoder = json.JSONEncoder(default=default, ensure_ascii=False, separators=(',', ':'))
+
+    def dumps(payload):
+        """UTF-8 JSON bytes of payload."""
+        return _encoder.encode(payload).encode('utf-8')
+
+
+def encode(body, accept_encoding):
+    """(body, content-encoding or None) for the client's Accept-Encoding header."""
+    if not COMPRESS or len(body) < COMPRESS_MIN_BYTES or not accept_encoding:
+        return body, None
+    accepted = {part.split(';')[0].strip().lower() for part in accept_encoding.split(',')
+                if part.replace(' ', '').lower().partition(';q=')[2] not in ('0', '0.0', '0.00', '0.000')}
+    if brotli is not None and 'br' in accepted:
+        return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    if 'gzip' in accepted:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), 'gzip'
+    return body, None
+
+
+def send_json(handler, status, payload, timing=None):
+    """Write payload as the JSON response of a BaseHTTPRequestHandler."""
+    body, encoding = encode(dumps(payload), handler.headers.get('Accept-Encoding'))
+    handler.send_response(status)
+    if timing:
+        handler.send_header('Server-Timing', timing)
+    handler.send_header('Content-Type', 'application/json; charset=utf-8')
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    if COMPRESS:
+        handler.send_header('Vary', 'Accept-Encoding')
+    if encoding:
+        handler.send_header('Content-Encoding', encoding)
+    handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def _numeric(value, cur):
+    return float(value) if value is not None else None
+
+
+def _date_iso(value, cur):
+    return value
+
+
+NUMERIC_FLOAT = psycopg2.extensions.new_type(psycopg2.extensions.DECIMAL.values, 'PAJU_NUMERIC_FLOAT', _numeric)
+NUMERIC_ARRAY_FLOAT = psycopg2.extensions.new_array_type((NUMERIC_ARRAY_OID,), 'PAJU_NUMERIC_FLOAT[]', NUMERIC_FLOAT)
+DATE_ISO = psycopg2.extensions.new_type((DATE_OID,), 'PAJU_DATE_ISO', _date_iso)
+DATE_ARRAY_ISO = psycopg2.extensions.new_array_type((DATE_ARRAY_OID,), 'PAJU_DATE_ISO[]', DATE_ISO)
+
+
+def register_casters(conn, dates=True):
+    """Fetch NUMERIC as float (and DATE as 'YYYY-MM-DD' when dates) on this connection."""
+    casters = [NUMERIC_FLOAT, NUMERIC_ARRAY_FLOAT] + ([DATE_ISO, DATE_ARRAY_ISO] if dates else [])
+    for caster in casters:
+        psycopg2.extensions.register_type(caster, conn)
+    return conn
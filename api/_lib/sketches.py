@@ -0,0 +1,207 @@
+"""
+partner_sketches - distinct partners over any date range / dimension.
+
+Ranges of up to EXACT_MAX_DAYS days are counted exactly on the raw tables.
+Longer ranges are split into whole months plus edge days and answered by
+merging the stored HLL sketches (a single whole period returns n_exact); if
+any of those periods has transactions but no sketch yet, the range is
+counted exactly instead.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from psycopg2.extras import execute_values
+
+from .hll import HLL
+
+EXACT_MAX_DAYS = 31
+
+# dim -> (value expression, extra joins); also used by build()
+DIM_SQL = {
+    'all': ("''", ''),
+    'county': ("COALESCE(p.county, 'Necunoscut')", 'LEFT JOIN partners p ON p.cnp = t.cnp'),
+    'sex': ("COALESCE(p.sex, '')", 'LEFT JOIN partners p ON p.cnp = t.cnp'),
+    'category': ('wc.name', """JOIN transaction_items ti ON ti.document_id = t.document_id
+            JOIN waste_types wt ON wt.id = ti.waste_type_id
+            JOIN waste_categories wc ON wc.id = wt.category_id"""),
+}
+
+
+def _dim(dim):
+    if dim not in DIM_SQL:
+        raise ValueError(f'Unknown sketch dimension: {dim}')
+    return DIM_SQL[dim]
+
+
+def _split(date_from, date_to):
+    """Split [date_from, date_to] into (first whole month, last whole month, edge day ranges)."""
+    first = date_from if date_from.day == 1 else (date_from.replace(day=28) + timedelta(days=4)).replace(day=1)
+    after = date_to + timedelta(days=1)
+    last = (after if after.day == 1 else date_to.replace(day=1)) - timedelta(days=1)
+    last = last.replace(day=1)
+    if first > last:
+        return None, None, [(date_from, date_to)]
+    edges = []
+    if date_from < first:
+        edges.append((date_from, first - timedelta(days=1)))
+    last_end = (last.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    if last_end < date_to:
+        edges.append((last_end + timedelta(days=1), date_to))
+    return first, last, edges
+
+
+def _exact(cur, date_from, date_to, dim, value=None):
+    expr, join = _dim(dim)
+    value_sql = f'AND {expr} = %s' if value is not None else ''
+    params = [date_from, date_to] + ([value] if value is not None else [])
+    cur.execute(f"""
+        SELECT {expr} AS value, COUNT(DISTINCT t.cnp) AS cnt
+        FROM transactions t
+        {join}
+        WHERE t.cnp IS NOT NULL AND t.date BETWEEN %s AND %s {value_sql}
+        GROUP BY 1
+    """, params)
+    return {r['value']: r['cnt'] for r in cur.fetchall()}
+
+
+def _missing_cells(cur, first, last, edges):
+    """Number of months in first..last and edge days with partner transactions
+    but no dim = 'all' sketch cell (imported, sketches not rebuilt yet)."""
+    day_where = ' OR '.join(['t.date BETWEEN %s AND %s'] * len(edges)) or 'false'
+    cur.execute(f"""
+        WITH expected AS (
+          SELECT 'month' AS kind, m::date AS start
+          FROM generate_series(%s::date, %s::date, interval '1 month') m
+          WHERE EXISTS (SELECT 1 FROM transactions t
+                        WHERE t.cnp IS NOT NULL AND t.date >= m AND t.date < m + interval '1 month')
+          UNION
+          SELECT 'day', t.date FROM transactions t
+          WHERE t.cnp IS NOT NULL AND ({day_where})
+        )
+        SELECT COUNT(*) AS missing FROM expected e
+        WHERE NOT EXISTS (SELECT 1 FROM partner_sketches s
+                          WHERE s.period_kind = e.kind AND s.dim = 'all' AND s.dim_value = ''
+                            AND s.period_start = e.start)
+    """, [first, last] + [d for edge in edges for d in edge])
+    return cur.fetchone()['missing']
+
+
+def distinct_partners_by(cur, date_from, date_to, dim='all', value=None):
+    """{dim_value: distinct partners} for the inclusive date range."""
+    if date_to < date_from:
+        return {}
+    if (date_to - date_from).days < EXACT_MAX_DAYS:
+        return _exact(cur, date_from, date_to, dim, value)
+    _dim(dim)
+    first, last, edges = _split(date_from, date_to)
+    if _missing_cells(cur, first, last, edges):
+        # Sketches not (fully) built for this range yet
+        return _exact(cur, date_from, date_to, dim, value)
+    where = ["(period_kind = 'month' AND period_start BETWEEN %s AND %s)"]
+    params = [first, last]
+    for lo, hi in edges:
+        where.append("(period_kind = 'day' AND period_start BETWEEN %s AND %s)")
+        params += [lo, hi]
+    value_sql = ''
+    if value is not None:
+        value_sql = 'AND dim_value = %s'
+        params.append(value)
+    cur.execute(f"""
+        SELECT dim_value, n_exact, sketch
+        FROM partner_sketches
+        WHERE dim = %s AND ({' OR '.join(where)}) {value_sql}
+    """, [dim] + params)
+    rows = cur.fetchall()
+    grouped = defaultdict(list)
+    for r in rows:
+        grouped[r['dim_value']].append(r)
+    result = {}
+    for val, cells in grouped.items():
+        if len(cells) == 1:
+            result[val] = cells[0]['n_exact']
+            continue
+        merged = HLL()
+        for c in cells:
+            merged.merge(HLL.from_bytes(c['sketch']))
+        result[val] = merged.count()
+    return result
+
+
+def distinct_partners(cur, date_from, date_to, dim='all', value=''):
+    """Distinct partners for one dimension value (the whole population by default)."""
+    return distinct_partners_by(cur, date_from, date_to, dim, value).get(value, 0)
+
+
+def _incomplete_years(cur):
+    """Years with a month of partner transactions but no dim = 'all' sketch cell."""
+    cur.execute("""
+        SELECT DISTINCT EXTRACT(YEAR FROM m)::int AS year
+        FROM (SELECT MIN(date) AS lo, MAX(date) AS hi FROM transactions) r,
+             generate_series(date_trunc('month', r.lo)::date, r.hi, interval '1 month') m
+        WHERE EXISTS (SELECT 1 FROM transactions t
+                      WHERE t.cnp IS NOT NULL AND t.date >= m AND t.date < m + interval '1 month')
+          AND NOT EXISTS (SELECT 1 FROM partner_sketches s
+                          WHERE s.period_kind = 'month' AND s.dim = 'all' AND s.dim_value = ''
+                            AND s.period_start = m::date)
+    """)
+    return {r['year'] for r in cur.fetchall()}
+
+
+def partners_per_year(cur, dim='all', value=''):
+    """{year: distinct partners} merged from the month sketches. Years whose
+    sketches are only partly built are left out; callers count those exactly."""
+    incomplete = _incomplete_years(cur)
+    cur.execute("""
+        SELECT period_start, n_exact, sketch FROM partner_sketches
+        WHERE period_kind = 'month' AND dim = %s AND dim_value = %s
+    """, (dim, value))
+    by_year = defaultdict(list)
+    for r in cur.fetchall():
+        by_year[r['period_start'].year].append(r)
+    result = {}
+    for yr, cells in by_year.items():
+        if yr in incomplete:
+            continue
+        merged = HLL()
+        for c in cells:
+            merged.merge(HLL.from_bytes(c['sketch']))
+        result[yr] = cells[0]['n_exact'] if len(cells) == 1 else merged.count()
+    return result
+
+
+def partners_per_month(cur, year=None, dim='all', value=''):
+    """{(year, month): exact distinct partners} straight from the month cells."""
+    query = """
+        SELECT period_start, n_exact FROM partner_sketches
+        WHERE period_kind = 'month' AND dim = %s AND dim_value = %s
+    """
+    params = [dim, value]
+    if year:
+        query += " AND period_start BETWEEN %s AND %s"
+        params += [date(int(year), 1, 1), date(int(year), 12, 31)]
+    cur.execute(query, params)
+    return {(r['period_start'].year, r['period_start'].month): r['n_exact'] for r in cur.fetchall()}
+
+
+def build(cur, year_from, year_to):
+    """Rebuild the day + month sketches of a year range. Expects a plain (tuple) cursor."""
+    d_from, d_to = date(year_from, 1, 1), date(year_to, 12, 31)
+    cells = defaultdict(set)
+    for dim, (expr, join) in DIM_SQL.items():
+        cur.execute(f"""
+            SELECT DISTINCT t.date, {expr}, t.cnp
+            FROM transactions t
+            {join}
+            WHERE t.cnp IS NOT NULL AND t.date BETWEEN %s AND %s
+        """, (d_from, d_to))
+        for d, val, cnp in cur.fetchall():
+            cells[('day', d, dim, val)].add(cnp)
+            cells[('month', d.replace(day=1), dim, val)].add(cnp)
+    rows = [(kind, start, dim, val, len(cnps), HLL().update(cnps).to_bytes())
+            for (kind, start, dim, val), cnps in cells.items()]
+    cur.execute("DELETE FROM partner_sketches WHERE period_start BETWEEN %s AND %s", (d_from, d_to))
+    execute_values(cur, """
+        INSERT INTO partner_sketches (period_kind, period_start, dim, dim_value, n_exact, sketch)
+        VALUES %s
+    """, rows, page_size=1000)
+    return len(rows)
@@ -0,0 +1,126 @@
+"""
+Weather categories for the /api/weather ranking and the 7-day forecast
+(without a trained model, a forecast day's effect is the sum of the average
+residuals of the categories it falls in).
+
+Each category is a range on one weather field. MATCHER compiles them per
+field into a sorted list of boundaries plus a lookup table, so a day is
+classified into every category with one float() and one bisect per field
+instead of evaluating every rule against the row.
+"""
+from bisect import bisect_left
+
+INF = float("inf")
+
+# (emoji, name, range label, field, lo, hi, bounds)
+# bounds: "(]" = lo < v <= hi, "[)" = lo <= v < hi; None = unbounded
+CATEGORIES = [
+    # Precipitation (rain)
+    ("🌧️", "Ploaie torentiala", ">20mm", "precipitation_sum", 20, None, "(]"),
+    ("🌧️", "Ploaie puternica", "10-20mm", "precipitation_sum", 10, 20, "(]"),
+    ("🌧️", "Ploaie moderata", "5-10mm", "precipitation_sum", 5, 10, "(]"),
+    ("🌧️", "Ploaie usoara", "2-5mm", "precipitation_sum", 2, 5, "(]"),
+    ("🌧️", "Ploaie fina", "0.5-2mm", "precipitation_sum", 0.5, 2, "(]"),
+    # Snow
+    ("❄️", "Zapada abundenta", ">10cm", "snowfall_sum", 10, None, "(]"),
+    ("❄️", "Zapada medie", "3-10cm", "snowfall_sum", 3, 10, "(]"),
+    ("❄️", "Ninsoare usoara", "1-3cm", "snowfall_sum", 1, 3, "(]"),
+    # Cold
+    ("🥶", "Ger extrem", "<-10°C max", "temp_max", None, -10, "[)"),
+    ("🥶", "Ger", "-10..-5°C max", "temp_max", -10, -5, "[)"),
+    ("🥶", "Frig intens", "-5..0°C max", "temp_max", -5, 0, "[)"),
+    ("🥶", "Frig", "0..5°C max", "temp_max", 0, 5, "[)"),
+    ("🥶", "Rece", "5..10°C max", "temp_max", 5, 10, "[)"),
+    # Hot
+    ("🔥", "Canicula extrema", ">35°C max", "temp_max", 35, None, "(]"),
+    ("🔥", "Canicula", "32..35°C max", "temp_max", 32, 35, "(]"),
+    ("🔥", "Foarte cald", "30..32°C max", "temp_max", 30, 32, "(]"),
+    ("🔥", "Cald", "25..30°C max", "temp_max", 25, 30, "(]"),
+    # Wind
+    ("💨", "Furtuna", ">90km/h rafale", "wind_gusts_max", 90, None, "(]"),
+    ("💨", "Rafale mari", "70-90km/h", "wind_gusts_max", 70, 90, "(]"),
+    ("💨", "Rafale medii", "50-70km/h", "wind_gusts_max", 50, 70, "(]"),
+    # Humidity / sky
+    ("💧", "Umiditate extrema", ">92%", "humidity_mean", 92, None, "(]"),
+    ("💧", "Umiditate ridicata", "85-92%", "humidity_mean", 85, 92, "(]"),
+    ("💧", "Umiditate scazuta", "<45%", "humidity_mean", None, 45, "[)"),
+    ("☀️", "Senin", "nori <20%", "cloudcover_mean", None, 20, "[)"),
+    ("☁️", "Mohorat", "nori >90%", "cloudcover_mean", 90, None, "(]"),
+]
+
+
+def _contains(lo, hi, bounds, v):
+    lo = -INF if lo is None else lo
+    hi = INF if hi is None else hi
+    if bounds == "(]":
+        return lo < v <= hi
+    return lo <= v < hi
+
+
+class Matcher:
+    """Compiled CATEGORIES: per field, the boundary points and, for every
+    segment between / on them, the indexes of the categories it falls in."""
+
+    def __init__(self, categories):
+        self.categories = categories
+        rules = {}
+        for i, (_, _, _, field, lo, hi, bounds) in enumerate(categories):
+            rules.setdefault(field, []).append((i, lo, hi, bounds))
+        self.fields = []
+        for field, field_rules in rules.items():
+            points = sorted({p for _, lo, hi, _ in field_rules for p in (lo, hi) if p is not None})
+            # Segment 2k: strictly between points[k-1] and points[k]; 2k+1: equal to points[k]
+            probes = []
+            for k, p in enumerate(points):
+                prev = points[k - 1] if k else p - 1
+                probes += [(prev + p) / 2, p]
+            probes.append(points[-1] + 1)
+            table = [tuple(i for i, lo, hi, bounds in field_rules if _contains(lo, hi, bounds, v))
+                     for v in probes]
+            self.fields.append((field, points, table))
+
+    def match(self, row):
+        """Indexes into categories of every category the row (dict of weather fields) falls in."""
+        out = []
+        for field, points, table in self.fields:
+            v = row.get(field)
+            if v is None:
+                continue
+            v = float(v)
+            k = bisect_left(points, v)
+            out.extend(table[2 * k + 1 if k < len(points) and points[k] == v else 2 * k])
+        return out
+
+    def assign(self, rows):
+        """[[row index, ...] per category] for a list of rows, in row order."""
+        members = [[] for _ in self.categories]
+        for j, row in enumerate(rows):
+            for i in self.match(row):
+                members[i].append(j)
+        return members
+
+
+MATCHER = Matcher(CATEGORIES)
+
+
+def effects(rows, min_n=5):
+    """{category name: {emoji, name, range, effect_pct, n}}: mean residual_pct
+    of the rows in each category that has at least min_n of them."""
+    rows = [r for r in rows if r["residual_pct"] is not None]
+    out = {}
+    for (emoji, name, range_str, *_), idx in zip(CATEGORIES, MATCHER.assign(rows)):
+        if len(idx) < min_n:
+            continue
+        out[name] = {
+            "emoji": emoji,
+            "name": name,
+            "range": range_str,
+            "effect_pct": round(sum(rows[j]["residual_pct"] for j in idx) / len(idx), 2),
+            "n": len(idx),
+        }
+    return out
+
+
+def matched_effects(effects, weather):
+    """The entries of effects (see effects()) whose category the weather falls in."""
+    return [effects[CATEGORIES[i][1]] for i in MATCHER.match(weather) if CATEGORIES[i][1] in effects]
@@ -0,0 +1,112 @@
+"""
+Daily traffic per metric joined with weather_oradea, with the same-weekday
+baseline and residual of every day.
+
+daily_residuals() aggregates all METRICS in one pass over transaction_facts
+and a warm instance keeps the result per (date_from, date_to) until
+transaction_facts or weather_oradea change, so /api/weather can switch metric
+without querying again. scripts/train_weather_model.py reads the same rows.
+"""
+import threading
+from datetime import timedelta
+
+METRICS = {
+    "partners":     ("COUNT(DISTINCT t.cnp)",                     "partners"),
+    "transactions": ("COUNT(*)",                                  "transactions"),
+    "kg":           ("COALESCE(SUM(t.weight_kg), 0)",             "kg"),
+    "ron":          ("COALESCE(SUM(t.gross_value), 0)",           "ron"),
+}
+
+BASELINE_DAYS = 28
+
+
+def weekday_baseline(values, d):
+    """Median of the same weekday in the BASELINE_DAYS before d, interpolated
+    like PERCENTILE_CONT(0.5). values is {date: float} of the open days;
+    None when none of those weekdays traded."""
+    vals = [values[p] for p in (d - timedelta(days=k) for k in range(7, BASELINE_DAYS + 1, 7))
+            if p in values]
+    if not vals:
+        return None
+    vals.sort()
+    pos = 0.5 * (len(vals) - 1)
+    lo = int(pos)
+    if lo == pos:
+        return vals[lo]
+    return vals[lo] + (vals[lo + 1] - vals[lo]) * (pos - lo)
+
+
+# Version of the inputs (bumped by triggers, migration 016); a cached range is
+# reloaded when it changes
+DATA_VERSION_SQL = """
+    SELECT COALESCE(string_agg(table_name || ':' || version, '/' ORDER BY table_name), '') AS version
+    FROM data_versions WHERE table_name IN ('transaction_facts', 'weather_oradea')
+"""
+DAILY_CACHE_SIZE = 8
+_daily_lock = threading.Lock()
+_daily_cache = {}
+
+
+def _load_daily(cur, date_from, date_to):
+    where = ["EXTRACT(ISODOW FROM t.date) <> 7"]
+    args = []
+    if date_from: where.append("t.date >= %s"); args.append(date_from)
+    if date_to:   where.append("t.date <= %s"); args.append(date_to)
+    where_sql = " AND ".join(where)
+    aggs = ",\n                 ".join(f"{agg_sql} AS {name}" for name, (agg_sql, _) in METRICS.items())
+
+    cur.execute(f"""
+        WITH daily AS (
+          SELECT t.date,
+                 EXTRACT(ISODOW FROM t.date)::int AS dow,
+                 {aggs}
+          FROM transaction_facts t
+          WHERE {where_sql}
+          GROUP BY t.date
+        )
+        SELECT d.*,
+               w.temp_max, w.temp_min, w.temp_mean, w.precipitation_sum, w.rain_sum,
+               w.snowfall_sum, w.snow_depth_max, w.wind_speed_max, w.wind_gusts_max,
+               w.pressure_mean, w.humidity_mean, w.cloudcover_mean, w.weather_code
+        FROM daily d
+        LEFT JOIN weather_oradea w ON w.date = d.date
+        ORDER BY d.date
+    """, args)
+    rows = cur.fetchall()
+    weather = [{k: v for k, v in r.items() if k not in METRICS} for r in rows]
+    values, residuals = {}, {}
+    for metric in METRICS:
+        values[metric] = by_date = {r["date"]: float(r[metric]) for r in rows}
+        out = []
+        for r, w in zip(rows, weather):
+            baseline = weekday_baseline(by_date, r["date"])
+            rec = {"date": r["date"], "dow": r["dow"], "value": r[metric], "baseline": baseline}
+            rec.update(w)
+            if baseline is not None:
+                rec["residual"] = float(rec["value"]) - baseline
+                rec["residual_pct"] = (rec["residual"] / baseline * 100.0) if baseline else None
+            else:
+                rec["residual"] = None
+                rec["residual_pct"] = None
+            out.append(rec)
+        residuals[metric] = out
+    return {"values": values, "residuals": residuals}
+
+
+def daily_residuals(cur, date_from, date_to):
+    """{"values": {metric: {date: value}}, "residuals": {metric: [row]}} for
+    every metric in METRICS from one daily aggregate, so switching metric
+    reuses the same load. Rows are shared between callers: do not mutate."""
+    cur.execute(DATA_VERSION_SQL)
+    version = cur.fetchone()["version"]
+    key = (date_from, date_to)
+    hit = _daily_cache.get(key)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    with _daily_lock:
+        hit = _daily_cache.get(key)
+        if hit is None or hit[0] != version:
+            if key not in _daily_cache and len(_daily_cache) >= DAILY_CACHE_SIZE:
+                _daily_cache.pop(next(iter(_daily_cache)))
+            hit = _daily_cache[key] = (version, _load_daily(cur, date_from, date_to))
+        return hit[1]
@@ -0,0 +1,190 @@
+"""
+Ridge regression of the daily residual (% vs the same-weekday baseline) on
+weather, weekday, official-holiday proximity and season.
+
+scripts/train_weather_model.py fits one model per metric on the history in
+_lib/weatherdaily.py and stores it in weather_models; /api/weather?type=forecast
+loads it and only evaluates features() for the 7 forecast days. Inputs are
+standardized with the training means / scales; a missing weather value counts
+as the training mean. Plain Python: ~20 features, a few thousand days.
+"""
+import math
+from datetime import timedelta
+
+FEATURES = [
+    "temp_max", "temp_max_sq", "precipitation_sum", "snowfall_sum",
+    "wind_gusts_max", "humidity_mean", "cloudcover_mean",
+    "dow_1", "dow_2", "dow_3", "dow_4", "dow_5",
+    "holiday", "before_holiday", "after_holiday",
+    "season_sin", "season_cos",
+]
+WEATHER_FIELDS = ["temp_max", "precipitation_sum", "snowfall_sum",
+                  "wind_gusts_max", "humidity_mean", "cloudcover_mean"]
+DEFAULT_LAMBDA = 1.0
+TARGET_CLIP = 100.0     # residual_pct beyond +/-100% (closures, stock-taking) is clipped
+HOLIDAY_REACH = 2       # days before / after an official holiday that count as "near"
+
+# feature -> breakdown group shown by the forecast (emoji, label)
+GROUPS = {
+    "temp_max": ("🌡️", "Temperatura"), "temp_max_sq": ("🌡️", "Temperatura"),
+    "precipitation_sum": ("🌧️", "Ploaie"), "snowfall_sum": ("❄️", "Zapada"),
+    "wind_gusts_max": ("💨", "Vant"), "humidity_mean": ("💧", "Umiditate"),
+    "cloudcover_mean": ("☁️", "Nori"),
+    "dow_1": ("📅", "Ziua saptamanii"), "dow_2": ("📅", "Ziua saptamanii"),
+    "dow_3": ("📅", "Ziua saptamanii"), "dow_4": ("📅", "Ziua saptamanii"),
+    "dow_5": ("📅", "Ziua saptamanii"),
+    "holiday": ("🎉", "Sarbatori"), "before_holiday": ("🎉", "Sarbatori"),
+    "after_holiday": ("🎉", "Sarbatori"),
+    "season_sin": ("🍂", "Sezon"), "season_cos": ("🍂", "Sezon"),
+}
+
+
+def official_holidays(cur, date_from=None, date_to=None):
+    """Set of official holiday dates, optionally only those in date_from..date_to."""
+    cur.execute("""
+        SELECT DISTINCT date FROM holidays
+        WHERE is_official AND (%(f)s::date IS NULL OR date >= %(f)s) AND (%(t)s::date IS NULL OR date <= %(t)s)
+    """, {"f": date_from, "t": date_to})
+    return {r["date"] for r in cur.fetchall()}
+
+
+def features(d, weather, holidays):
+    """Feature vector (list aligned with FEATURES, None for missing weather)
+    for day d with weather {field: value} and the set of official holidays."""
+    w = {f: (float(weather[f]) if weather.get(f) is not None else None) for f in WEATHER_FIELDS}
+    tmax = w["temp_max"]
+    dow = d.isoweekday()
+    doy = 2 * math.pi * (d.timetuple().tm_yday - 1) / 365.25
+    near = range(1, HOLIDAY_REACH + 1)
+    return [
+        tmax, (tmax - 15) ** 2 if tmax is not None else None,
+        w["precipitation_sum"], w["snowfall_sum"],
+        w["wind_gusts_max"], w["humidity_mean"], w["cloudcover_mean"],
+        *(1.0 if dow == k else 0.0 for k in range(1, 6)),
+        1.0 if d in holidays else 0.0,
+        1.0 if any(d + timedelta(days=k) in holidays for k in near) else 0.0,
+        1.0 if any(d - timedelta(days=k) in holidays for k in near) else 0.0,
+        math.sin(doy), math.cos(doy),
+    ]
+
+
+def training_set(rows, holidays, date_to=None):
+    """(dates, X, y) from weatherdaily residual rows with a baseline, up to date_to."""
+    dates, X, y = [], [], []
+    for r in rows:
+        if r["residual_pct"] is None or (date_to is not None and r["date"] > date_to):
+            continue
+        dates.append(r["date"])
+        X.append(features(r["date"], r, holidays))
+        y.append(max(-TARGET_CLIP, min(TARGET_CLIP, r["residual_pct"])))
+    return dates, X, y
+
+
+def _solve(A, b):
+    """Solve A x = b (A square, symmetric positive definite here) by Gaussian elimination."""
+    n = len(b)
+    M = [row[:] + [b[i]] for i, row in enumerate(A)]
+    for c in range(n):
+        p = max(range(c, n), key=lambda r: abs(M[r][c]))
+        M[c], M[p] = M[p], M[c]
+        for r in range(c + 1, n):
+            f = M[r][c] / M[c][c]
+            if f:
+                for k in range(c, n + 1):
+                    M[r][k] -= f * M[c][k]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        x[r] = (M[r][n] - sum(M[r][k] * x[k] for k in range(r + 1, n))) / M[r][r]
+    return x
+
+
+def _standardize(X, means, scales):
+    return [[0.0 if v is None else (v - m) / s for v, m, s in zip(x, means, scales)] for x in X]
+
+
+def fit(X, y, ridge_lambda=DEFAULT_LAMBDA):
+    """Ridge fit on standardized X; the intercept (mean of y) is not penalized.
+    Returns a model dict (without metric / dates) including fit statistics."""
+    n, p = len(X), len(FEATURES)
+    means, scales = [], []
+    for j in range(p):
+        col = [x[j] for x in X if x[j] is not None]
+        m = sum(col) / len(col) if col else 0.0
+        var = sum((v - m) ** 2 for v in col) / len(col) if col else 0.0
+        means.append(m)
+        scales.append(math.sqrt(var) or 1.0)
+    Z = _standardize(X, means, scales)
+    y_mean = sum(y) / n
+    yc = [v - y_mean for v in y]
+    A = [[sum(z[i] * z[j] for z in Z) + (ridge_lambda if i == j else 0.0) for j in range(p)]
+         for i in range(p)]
+    b = [sum(z[i] * t for z, t in zip(Z, yc)) for i in range(p)]
+    coef = _solve(A, b)
+
+    pred = [y_mean + sum(c * v for c, v in zip(coef, z)) for z in Z]
+    sse = sum((t - q) ** 2 for t, q in zip(y, pred))
+    sst = sum(t * t for t in yc)
+    return {
+        "features": list(FEATURES), "intercept": y_mean, "coefficients": coef,
+        "means": means, "scales": scales, "ridge_lambda": ridge_lambda, "n": n,
+        "r2": 1 - sse / sst if sst else 0.0,
+        "rmse": math.sqrt(sse / n),
+        "mae": sum(abs(t - q) for t, q in zip(y, pred)) / n,
+    }
+
+
+def contributions(model, x):
+    """Per-feature contribution (percentage points) of feature vector x."""
+    return [0.0 if v is None else c * (v - m) / s
+            for c, v, m, s in zip(model["coefficients"], x, model["means"], model["scales"])]
+
+
+def predict(model, x):
+    """Predicted residual_pct for feature vector x."""
+    return model["intercept"] + sum(contributions(model, x))
+
+
+def breakdown(model, x, min_effect=0.5):
+    """Contributions summed per GROUPS entry, largest first, in the shape of the
+    forecast's category breakdown; groups under min_effect points are left out."""
+    groups = {}
+    for f, c in zip(FEATURES, contributions(model, x)):
+        emoji, label = GROUPS[f]
+        groups[label] = (emoji, groups.get(label, (emoji, 0.0))[1] + c)
+    out = [{"category": "Nivel mediu", "emoji": "📊", "range": "model",
+            "effect_pct": round(model["intercept"], 2), "n": model["n"]}]
+    for label, (emoji, c) in sorted(groups.items(), key=lambda kv: -abs(kv[1][1])):
+        if abs(c) >= min_effect:
+            out.append({"category": label, "emoji": emoji, "range": "model",
+                        "effect_pct": round(c, 2), "n": model["n"]})
+    return out
+
+
+def store(cur, metric, model, data_from, data_to):
+    """Replace the stored model for metric (caller commits)."""
+    cur.execute("""
+        INSERT INTO weather_models (metric, trained_at, data_from, data_to, features, intercept,
+                                    coefficients, means, scales, ridge_lambda, n, r2, rmse, mae)
+        VALUES (%s, now(), %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (metric) DO UPDATE SET
+          trained_at = EXCLUDED.trained_at, data_from = EXCLUDED.data_from, data_to = EXCLUDED.data_to,
+          features = EXCLUDED.features, intercept = EXCLUDED.intercept,
+          coefficients = EXCLUDED.coefficients, means = EXCLUDED.means, scales = EXCLUDED.scales,
+          ridge_lambda = EXCLUDED.ridge_lambda, n = EXCLUDED.n,
+          r2 = EXCLUDED.r2, rmse = EXCLUDED.rmse, mae = EXCLUDED.mae
+    """, (metric, data_from, data_to, model["features"], model["intercept"],
+          model["coefficients"], model["means"], model["scales"], model["ridge_lambda"],
+          model["n"], model["r2"], model["rmse"], model["mae"]))
+
+
+def load(cur, metric):
+    """Stored model for metric, None when there is none or it was fitted on another FEATURES list."""
+    cur.execute("""
+        SELECT metric, trained_at, data_from, data_to, features, intercept, coefficients,
+               means, scales, ridge_lambda, n, r2, rmse, mae
+        FROM weather_models WHERE metric = %s
+    """, (metric,))
+    row = cur.fetchone()
+    if row is None or list(row["features"]) != FEATURES:
+        return None
+    return dict(row)
@@ -0,0 +1,59 @@
+"""
+Open-Meteo response parsing shared by scripts/fetch_weather.py (archive
+backfill) and _lib/openmeteo.py (forecast).
+
+Both endpoints answer with parallel arrays: daily series keyed by "time" as
+YYYY-MM-DD, hourly series keyed by "time" as YYYY-MM-DDTHH:MM. Hourly series
+are reduced to daily means in one pass with a running sum/count per day, so a
+multi-year backfill never holds per-day lists of every hourly value.
+"""
+
+HOURLY_MEANS = {
+    "pressure_msl": "pressure_mean",
+    "relativehumidity_2m": "humidity_mean",
+    "cloudcover": "cloudcover_mean",
+}
+
+
+def daily_values(resp, field_map, per_day=None):
+    """Fill per_day {date_str: {col: value}} from a daily response; missing values are None."""
+    per_day = {} if per_day is None else per_day
+    daily = resp.get("daily", {})
+    times = daily.get("time", [])
+    rows = [per_day.setdefault(dstr, {}) for dstr in times]
+    for api_field, col in field_map.items():
+        arr = daily.get(api_field) or ()
+        n = len(arr)
+        for i, row in enumerate(rows):
+            row[col] = arr[i] if i < n else None
+    return per_day
+
+
+def hourly_means(resp, field_map=HOURLY_MEANS, per_day=None, ndigits=2):
+    """Add the daily mean of each hourly field to per_day, skipping nulls.
+
+    Days with no non-null value for a field get no key for it."""
+    per_day = {} if per_day is None else per_day
+    hourly = resp.get("hourly", {})
+    times = hourly.get("time", [])
+    # Hours arrive in order, so each day is one contiguous run of indexes
+    runs = []
+    start = 0
+    for i in range(1, len(times) + 1):
+        if i == len(times) or times[i][:10] != times[start][:10]:
+            runs.append((times[start][:10], start, i))
+            start = i
+    for api_field, col in field_map.items():
+        arr = hourly.get(api_field)
+        if not arr:
+            continue
+        for day, lo, hi in runs:
+            total = 0.0
+            count = 0
+            for v in arr[lo:hi]:
+                if v is not None:
+                    total += v
+                    count += 1
+            if count:
+                per_day.setdefault(day, {})[col] = round(total / count, ndigits)
+    return per_day
@@ -8,24 +8,24 @@ Endpoints:
   GET /api/analytics?type=yearly
 """
 from http.server import BaseHTTPRequestHandler
-import json
 import os
+import sys
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from urllib.parse import urlparse, parse_qs
-from decimal import Decimal
+from datetime import date
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _lib import cube, geo, parallel, querylog, serialize, sketches
+
+# Open days kept per side in holiday_blocks (refresh_holiday_blocks p_max_window) / 2
+HOLIDAY_MAX_WINDOW = 10
 
 def get_db():
     # Try multiple environment variable names
     db_url = os.environ.get('POSTGRES_URL') or os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL_NO_SSL')
     if not db_url:
         raise Exception("No database URL configured. Set POSTGRES_URL or DATABASE_URL environment variable.")
-    return psycopg2.connect(db_url, cursor_factory=RealDictCursor)
-
-def decimal_default(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    raise TypeError
+    return psycopg2.connect(db_url, cursor_factory=querylog.TimedCursor)
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -34,6 +34,7 @@ class handler(BaseHTTPRequestHandler):
             params = parse_qs(parsed.query)
 
             conn = get_db()
+            querylog.start(querylog.label(self.path), conn)
             cur = conn.cursor()
 
             analysis_type = params.get('type', ['overview'])[0]
@@ -46,10 +47,12 @@ class handler(BaseHTTPRequestHandler):
             elif analysis_type == 'yearly':
                 result = self.get_yearly_summary(cur)
             elif analysis_type == 'county':
-                result = self.get_county_analysis(cur)
+                year = params.get('year', [None])[0]
+                result = self.get_county_analysis(cur, year)
             elif analysis_type == 'city':
                 county = params.get('county', [None])[0]
-                result = self.get_city_analysis(cur, county)
+                year = params.get('year', [None])[0]
+                result = self.get_city_analysis(cur, county, year)
             elif analysis_type == 'weekday':
                 year = params.get('year', [None])[0]
                 month = params.get('month', [None])[0]
@@ -61,7 +64,9 @@ class handler(BaseHTTPRequestHandler):
             elif analysis_type == 'tops':
                 result = self.get_top_stats(cur)
             elif analysis_type == 'holidays':
-                result = self.get_holiday_analysis(cur)
+                year = params.get('year', [None])[0]
+                window = params.get('window', [5])[0]
+                result = self.get_holiday_analysis(cur, year, window)
             elif analysis_type == 'waste_by_region':
                 category = params.get('category', [None])[0]
                 result = self.get_waste_by_region(cur, category)
@@ -81,59 +86,65 @@ class handler(BaseHTTPRequestHandler):
                 }
 
             cur.close()
+            timing = querylog.finish()
             conn.close()
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result, default=decimal_default, ensure_ascii=False).encode('utf-8'))
+            serialize.send_json(self, 200, result, timing)
 
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode())
+            serialize.send_json(self, 500, {'error': str(e)}, querylog.finish())
 
     def get_overview(self, cur):
         """Get overall business overview"""
         # Total stats
-        cur.execute("""
-            SELECT COUNT(*) as transactions,
-                   COUNT(DISTINCT cnp) as unique_partners,
-                   COALESCE(SUM(gross_value), 0) as total_value,
-                   COALESCE(SUM(net_paid), 0) as total_paid,
-                   MIN(date) as first_date,
-                   MAX(date) as last_date,
-                   COUNT(DISTINCT date) as working_days
-            FROM transactions
-        """)
-        totals = cur.fetchone()
+        def q_totals(cur):
+            cur.execute("""
+                SELECT COUNT(*) as transactions,
+                       COALESCE(SUM(gross_value), 0) as total_value,
+                       COALESCE(SUM(net_paid), 0) as total_paid,
+                       MIN(date) as first_date,
+                       MAX(date) as last_date,
+                       COUNT(DISTINCT date) as working_days
+                FROM transactions
+            """)
+            totals = cur.fetchone()
+            # Unique partners: merged HLL month sketches (partner_sketches)
+            totals['unique_partners'] = sketches.distinct_partners(cur, totals['first_date'], totals['last_date']) if totals['first_date'] else 0
+            return totals
 
         # Partner stats
-        cur.execute("SELECT COUNT(*) as count FROM partners")
-        total_partners = cur.fetchone()['count']
+        def q_partners(cur):
+            cur.execute("SELECT COUNT(*) as count FROM partners")
+            return cur.fetchone()['count']
 
         # Category totals
-        cur.execute("""
-            SELECT wc.name, SUM(ti.weight_kg) as total_kg
-            FROM transaction_items ti
-            JOIN waste_types wt ON ti.waste_type_id = wt.id
-            JOIN waste_categories wc ON wt.category_id = wc.id
-            GROUP BY wc.name
-            ORDER BY total_kg DESC
-        """)
-        categories = cur.fetchall()
+        def q_categories(cur):
+            cur.execute("""
+                SELECT wc.name, SUM(ti.weight_kg) as total_kg
+                FROM transaction_items ti
+                JOIN waste_types wt ON ti.waste_type_id = wt.id
+                JOIN waste_categories wc ON wt.category_id = wc.id
+                GROUP BY wc.name
+                ORDER BY total_kg DESC
+            """)
+            return cur.fetchall()
 
         # Recent activity (last 30 days)
-        cur.execute("""
-            SELECT COUNT(*) as transactions,
-                   COALESCE(SUM(gross_value), 0) as value,
-                   COUNT(DISTINCT cnp) as partners
-            FROM transactions
-            WHERE date >= CURRENT_DATE - 30
-        """)
-        recent = cur.fetchone()
+        def q_recent(cur):
+            cur.execute("""
+                SELECT COUNT(*) as transactions,
+                       COALESCE(SUM(gross_value), 0) as value,
+                       COUNT(DISTINCT cnp) as partners
+                FROM transactions
+                WHERE date >= CURRENT_DATE - 30
+            """)
+            return cur.fetchone()
+
+        r, timing = parallel.fan_out({
+            'totals': q_totals, 'partners': q_partners,
+            'categories': q_categories, 'recent': q_recent,
+        }, cur)
+        totals, total_partners, categories, recent = r['totals'], r['partners'], r['categories'], r['recent']
 
         return {
             'overview': {
@@ -157,7 +168,8 @@ class handler(BaseHTTPRequestHandler):
             'by_category': [{
                 'category': c['name'],
                 'total_kg': float(c['total_kg'])
-            } for c in categories]
+            } for c in categories],
+            'timing_ms': timing
         }
 
     def get_yearly_summary(self, cur):
@@ -165,7 +177,6 @@ class handler(BaseHTTPRequestHandler):
         cur.execute("""
             SELECT EXTRACT(YEAR FROM date)::int as year,
                    COUNT(*) as transactions,
-                   COUNT(DISTINCT cnp) as unique_partners,
                    COALESCE(SUM(gross_value), 0) as total_value,
                    COALESCE(SUM(net_paid), 0) as total_paid,
                    COUNT(DISTINCT date) as working_days
@@ -174,6 +185,11 @@ class handler(BaseHTTPRequestHandler):
             ORDER BY year
         """)
         years = cur.fetchall()
+        partners_by_year = sketches.partners_per_year(cur)
+        for y in years:
+            if y['year'] not in partners_by_year:
+                partners_by_year[y['year']] = sketches.distinct_partners(cur, date(y['year'], 1, 1), date(y['year'], 12, 31))
+            y['unique_partners'] = partners_by_year[y['year']]
 
         return {
             'years': [{
@@ -193,7 +209,6 @@ class handler(BaseHTTPRequestHandler):
             SELECT EXTRACT(YEAR FROM date)::int as year,
                    EXTRACT(MONTH FROM date)::int as month,
                    COUNT(*) as transactions,
-                   COUNT(DISTINCT cnp) as unique_partners,
                    COALESCE(SUM(gross_value), 0) as total_value,
                    COUNT(DISTINCT date) as working_days,
                    MIN(date) as first_day,
@@ -212,6 +227,13 @@ class handler(BaseHTTPRequestHandler):
 
         cur.execute(query, params)
         months = cur.fetchall()
+        # Exact per-month distinct partners stored with the month sketches
+        partners_by_month = sketches.partners_per_month(cur, year)
+        for m in months:
+            key = (m['year'], m['month'])
+            if key not in partners_by_month:
+                partners_by_month[key] = sketches.distinct_partners(cur, m['first_day'].replace(day=1), m['last_day'])
+            m['unique_partners'] = partners_by_month[key]
 
         return {
             'year_filter': year,
@@ -227,60 +249,34 @@ class handler(BaseHTTPRequestHandler):
             } for m in months]
         }
 
-    def get_county_analysis(self, cur):
-        """Get analysis by county"""
-        cur.execute("""
-            SELECT p.county,
-                   COUNT(DISTINCT p.cnp) as partner_count,
-                   COUNT(t.document_id) as transaction_count,
-                   COALESCE(SUM(t.gross_value), 0) as total_value
-            FROM partners p
-            LEFT JOIN transactions t ON p.cnp = t.cnp
-            WHERE p.county IS NOT NULL
-            GROUP BY p.county
-            ORDER BY total_value DESC
-        """)
-        counties = cur.fetchall()
+    def get_county_analysis(self, cur, year=None):
+        """Get analysis by county (geo_stats rollup)"""
+        counties = geo.measures_by(cur, 'county', year=year, order='gross_value')
 
         return {
+            'year': year,
             'by_county': [{
-                'county': c['county'],
-                'partner_count': c['partner_count'],
-                'transaction_count': c['transaction_count'],
-                'total_value': float(c['total_value']),
-                'avg_per_partner': float(c['total_value']) / c['partner_count'] if c['partner_count'] > 0 else 0
+                'county': c['value'],
+                'partner_count': c['partners'],
+                'transaction_count': c['transactions'],
+                'total_value': float(c['gross_value']),
+                'avg_per_partner': float(c['gross_value']) / c['partners'] if c['partners'] > 0 else 0
             } for c in counties]
         }
 
-    def get_city_analysis(self, cur, county=None):
-        """Get analysis by city, optionally filtered by county"""
-        query = """
-            SELECT p.city, p.county,
-                   COUNT(DISTINCT p.cnp) as partner_count,
-                   COUNT(t.document_id) as transaction_count,
-                   COALESCE(SUM(t.gross_value), 0) as total_value
-            FROM partners p
-            LEFT JOIN transactions t ON p.cnp = t.cnp
-            WHERE p.city IS NOT NULL
-        """
-        params = []
-        if county:
-            query += " AND p.county ILIKE %s"
-            params.append(f'%{county}%')
-
-        query += " GROUP BY p.city, p.county ORDER BY total_value DESC LIMIT 100"
-
-        cur.execute(query, params)
-        cities = cur.fetchall()
+    def get_city_analysis(self, cur, county=None, year=None):
+        """Get analysis by normalized city, optionally filtered by county (geo_stats rollup)"""
+        cities = geo.measures_by(cur, 'city', year=year, county=county, order='gross_value', limit=100)
 
         return {
             'county_filter': county,
+            'year': year,
             'by_city': [{
-                'city': c['city'],
+                'city': c['value'],
                 'county': c['county'],
-                'partner_count': c['partner_count'],
-                'transaction_count': c['transaction_count'],
-                'total_value': float(c['total_value'])
+                'partner_count': c['partners'],
+                'transaction_count': c['transactions'],
+                'total_value': float(c['gross_value'])
             } for c in cities]
         }
 
@@ -325,53 +321,28 @@ class handler(BaseHTTPRequestHandler):
         }
 
     def get_age_analysis(self, cur):
-        """Get analysis by partner age groups"""
-        cur.execute("""
-            SELECT
-                CASE
-                    WHEN EXTRACT(YEAR FROM CURRENT_DATE) - p.birth_year < 25 THEN '18-24'
-                    WHEN EXTRACT(YEAR FROM CURRENT_DATE) - p.birth_year < 35 THEN '25-34'
-                    WHEN EXTRACT(YEAR FROM CURRENT_DATE) - p.birth_year < 45 THEN '35-44'
-                    WHEN EXTRACT(YEAR FROM CURRENT_DATE) - p.birth_year < 55 THEN '45-54'
-                    WHEN EXTRACT(YEAR FROM CURRENT_DATE) - p.birth_year < 65 THEN '55-64'
-                    ELSE '65+'
-                END as age_group,
-                COUNT(DISTINCT p.cnp) as partner_count,
-                COUNT(t.document_id) as transaction_count,
-                COALESCE(SUM(t.gross_value), 0) as total_value
-            FROM partners p
-            LEFT JOIN transactions t ON p.cnp = t.cnp
-            WHERE p.birth_year IS NOT NULL
-            GROUP BY age_group
-            ORDER BY age_group
-        """)
-        ages = cur.fetchall()
-
-        # Sex breakdown
-        cur.execute("""
-            SELECT p.sex,
-                   COUNT(DISTINCT p.cnp) as partner_count,
-                   COUNT(t.document_id) as transaction_count,
-                   COALESCE(SUM(t.gross_value), 0) as total_value
-            FROM partners p
-            LEFT JOIN transactions t ON p.cnp = t.cnp
-            WHERE p.sex IS NOT NULL
-            GROUP BY p.sex
-        """)
-        sex = cur.fetchall()
+        """Get analysis by partner age groups (age now and at transaction time) and sex (cube_activity)"""
+        now = cube.measures_by(cur, 'age_group_now', known_only=True)
+        at_transaction = cube.measures_by(cur, 'age_group', known_only=True)
+        sex = cube.measures_by(cur, 'sex', known_only=True)
+
+        def by_age(rows):
+            rows = sorted(rows, key=lambda a: cube.AGE_ORDER.index(a['value']))
+            return [{
+                'age_group': a['value'],
+                'partner_count': a['partners'],
+                'transaction_count': a['transactions'],
+                'total_value': float(a['gross_value'])
+            } for a in rows]
 
         return {
-            'by_age_group': [{
-                'age_group': a['age_group'],
-                'partner_count': a['partner_count'],
-                'transaction_count': a['transaction_count'],
-                'total_value': float(a['total_value'])
-            } for a in ages],
+            'by_age_group': by_age(now),
+            'by_age_group_at_transaction': by_age(at_transaction),
             'by_sex': [{
-                'sex': 'Barbat' if s['sex'] == 'M' else 'Femeie',
-                'partner_count': s['partner_count'],
-                'transaction_count': s['transaction_count'],
-                'total_value': float(s['total_value'])
+                'sex': 'Barbat' if s['value'] == 'M' else 'Femeie',
+                'partner_count': s['partners'],
+                'transaction_count': s['transactions'],
+                'total_value': float(s['gross_value'])
             } for s in sex]
         }
 
@@ -449,236 +420,247 @@ class handler(BaseHTTPRequestHandler):
     def get_top_stats(self, cur):
         """Get various top statistics for the Statistici tab"""
         # Top by weight per category - get ALL categories
-        cur.execute("""
-            SELECT wc.name as category, p.name, p.cnp, SUM(ti.weight_kg) as total_kg
-            FROM transaction_items ti
-            JOIN waste_types wt ON ti.waste_type_id = wt.id
-            JOIN waste_categories wc ON wt.category_id = wc.id
-            JOIN transactions t ON ti.document_id = t.document_id
-            JOIN partners p ON t.cnp = p.cnp
-            GROUP BY wc.name, p.name, p.cnp
-            ORDER BY wc.name, total_kg DESC
-        """)
-        all_by_cat = cur.fetchall()
-
-        # Group by category and get top 1
-        top_by_weight = {}
-        for row in all_by_cat:
-            cat = row['category']
-            if cat not in top_by_weight:
-                top_by_weight[cat] = {'name': row['name'], 'cnp': row['cnp'], 'total_kg': float(row['total_kg'])}
+        def q_top_weight(cur):
+            cur.execute("""
+                SELECT wc.name as category, p.name, p.cnp, SUM(ti.weight_kg) as total_kg
+                FROM transaction_items ti
+                JOIN waste_types wt ON ti.waste_type_id = wt.id
+                JOIN waste_categories wc ON wt.category_id = wc.id
+                JOIN transactions t ON ti.document_id = t.document_id
+                JOIN partners p ON t.cnp = p.cnp
+                GROUP BY wc.name, p.name, p.cnp
+                ORDER BY wc.name, total_kg DESC
+            """)
+            # Group by category and get top 1
+            top_by_weight = {}
+            for row in cur.fetchall():
+                cat = row['category']
+                if cat not in top_by_weight:
+                    top_by_weight[cat] = {'name': row['name'], 'cnp': row['cnp'], 'total_kg': float(row['total_kg'])}
+            return top_by_weight
 
         # Top by value per category - SORT by value DESC for display
-        cur.execute("""
-            SELECT wc.name as category, p.name, p.cnp, SUM(ti.value) as total_value
-            FROM transaction_items ti
-            JOIN waste_types wt ON ti.waste_type_id = wt.id
-            JOIN waste_categories wc ON wt.category_id = wc.id
-            JOIN transactions t ON ti.document_id = t.document_id
-            JOIN partners p ON t.cnp = p.cnp
-            GROUP BY wc.name, p.name, p.cnp
-            ORDER BY wc.name, total_value DESC
-        """)
-        all_val = cur.fetchall()
-
-        top_by_value = {}
-        for row in all_val:
-            cat = row['category']
-            if cat not in top_by_value:
-                top_by_value[cat] = {'name': row['name'], 'cnp': row['cnp'], 'total_value': float(row['total_value'])}
-
-        # Sort top_by_value by total_value descending for display
-        top_by_value = dict(sorted(top_by_value.items(), key=lambda x: x[1]['total_value'], reverse=True))
+        def q_top_value(cur):
+            cur.execute("""
+                SELECT wc.name as category, p.name, p.cnp, SUM(ti.value) as total_value
+                FROM transaction_items ti
+                JOIN waste_types wt ON ti.waste_type_id = wt.id
+                JOIN waste_categories wc ON wt.category_id = wc.id
+                JOIN transactions t ON ti.document_id = t.document_id
+                JOIN partners p ON t.cnp = p.cnp
+                GROUP BY wc.name, p.name, p.cnp
+                ORDER BY wc.name, total_value DESC
+            """)
+            top_by_value = {}
+            for row in cur.fetchall():
+                cat = row['category']
+                if cat not in top_by_value:
+                    top_by_value[cat] = {'name': row['name'], 'cnp': row['cnp'], 'total_value': float(row['total_value'])}
+            # Sort top_by_value by total_value descending for display
+            return dict(sorted(top_by_value.items(), key=lambda x: x[1]['total_value'], reverse=True))
 
         # Bottom by value per category (smallest total among returning partners)
-        cur.execute("""
-            SELECT wc.name as category, p.name, p.cnp, SUM(ti.value) as total_value, COUNT(DISTINCT t.document_id) as visits
-            FROM transaction_items ti
-            JOIN waste_types wt ON ti.waste_type_id = wt.id
-            JOIN waste_categories wc ON wt.category_id = wc.id
-            JOIN transactions t ON ti.document_id = t.document_id
-            JOIN partners p ON t.cnp = p.cnp
-            GROUP BY wc.name, p.name, p.cnp
-            HAVING COUNT(DISTINCT t.document_id) >= 3
-            ORDER BY wc.name, total_value ASC
-        """)
-        all_bottom = cur.fetchall()
-
-        bottom_by_value = {}
-        for row in all_bottom:
-            cat = row['category']
-            if cat not in bottom_by_value:
-                bottom_by_value[cat] = {'name': row['name'], 'cnp': row['cnp'], 'total_value': float(row['total_value']), 'visits': row['visits']}
+        def q_bottom_value(cur):
+            cur.execute("""
+                SELECT wc.name as category, p.name, p.cnp, SUM(ti.value) as total_value, COUNT(DISTINCT t.document_id) as visits
+                FROM transaction_items ti
+                JOIN waste_types wt ON ti.waste_type_id = wt.id
+                JOIN waste_categories wc ON wt.category_id = wc.id
+                JOIN transactions t ON ti.document_id = t.document_id
+                JOIN partners p ON t.cnp = p.cnp
+                GROUP BY wc.name, p.name, p.cnp
+                HAVING COUNT(DISTINCT t.document_id) >= 3
+                ORDER BY wc.name, total_value ASC
+            """)
+            bottom_by_value = {}
+            for row in cur.fetchall():
+                cat = row['category']
+                if cat not in bottom_by_value:
+                    bottom_by_value[cat] = {'name': row['name'], 'cnp': row['cnp'], 'total_value': float(row['total_value']), 'visits': row['visits']}
+            return bottom_by_value
 
         # Funny/unusual names - search for Hungarian/Romanian funny patterns
-        cur.execute("""
-            SELECT name, cnp, city FROM partners
-            WHERE name ~* '(futy|fut|fasz|pul|kur|szar|poop|cac|pipi|xxx|zzz|aaa|eee|ooo|uuu|iii)'
-               OR name ~* '(buzi|bolond|hulye|prost|nebun|tampla)'
-               OR LENGTH(name) <= 4
-               OR name ~* '^[A-Z]{1,2} [A-Z]{1,2}$'
-               OR name ~* '([a-z])\\1{3,}'
-            ORDER BY LENGTH(name), name
-            LIMIT 20
-        """)
-        funny_names = [{'name': r['name'], 'cnp': r['cnp'], 'city': r['city']} for r in cur.fetchall()]
+        def q_funny_names(cur):
+            cur.execute("""
+                SELECT name, cnp, city FROM partners
+                WHERE name ~* '(futy|fut|fasz|pul|kur|szar|poop|cac|pipi|xxx|zzz|aaa|eee|ooo|uuu|iii)'
+                   OR name ~* '(buzi|bolond|hulye|prost|nebun|tampla)'
+                   OR LENGTH(name) <= 4
+                   OR name ~* '^[A-Z]{1,2} [A-Z]{1,2}$'
+                   OR name ~* '([a-z])\\1{3,}'
+                ORDER BY LENGTH(name), name
+                LIMIT 20
+            """)
+            return [{'name': r['name'], 'cnp': r['cnp'], 'city': r['city']} for r in cur.fetchall()]
 
         # Unusual cities
-        cur.execute("""
-            SELECT DISTINCT city FROM partners
-            WHERE city IS NOT NULL
-              AND (LENGTH(city) <= 3 OR city ~* '[0-9]' OR city ~* '(xxx|zzz|test|asd)')
-            LIMIT 10
-        """)
-        unusual_cities = [r['city'] for r in cur.fetchall()]
+        def q_unusual_cities(cur):
+            cur.execute("""
+                SELECT DISTINCT city FROM partners
+                WHERE city IS NOT NULL
+                  AND (LENGTH(city) <= 3 OR city ~* '[0-9]' OR city ~* '(xxx|zzz|test|asd)')
+                LIMIT 10
+            """)
+            return [r['city'] for r in cur.fetchall()]
 
         # Consistent weight partners (low std deviation)
-        cur.execute("""
-            SELECT p.name, p.cnp,
-                   COUNT(DISTINCT t.document_id) as visits,
-                   AVG(ti.weight_kg) as avg_weight,
-                   STDDEV(ti.weight_kg) as std_weight
-            FROM partners p
-            JOIN transactions t ON p.cnp = t.cnp
-            JOIN transaction_items ti ON t.document_id = ti.document_id
-            GROUP BY p.name, p.cnp
-            HAVING COUNT(DISTINCT t.document_id) >= 10 AND STDDEV(ti.weight_kg) < 5
-            ORDER BY std_weight ASC
-            LIMIT 10
-        """)
-        consistent_partners = [{'name': r['name'], 'cnp': r['cnp'], 'visits': r['visits'], 'avg_weight': float(r['avg_weight']), 'std_weight': float(r['std_weight']) if r['std_weight'] else 0} for r in cur.fetchall()]
+        def q_consistent(cur):
+            cur.execute("""
+                SELECT p.name, p.cnp,
+                       COUNT(DISTINCT t.document_id) as visits,
+                       AVG(ti.weight_kg) as avg_weight,
+                       STDDEV(ti.weight_kg) as std_weight
+                FROM partners p
+                JOIN transactions t ON p.cnp = t.cnp
+                JOIN transaction_items ti ON t.document_id = ti.document_id
+                GROUP BY p.name, p.cnp
+                HAVING COUNT(DISTINCT t.document_id) >= 10 AND STDDEV(ti.weight_kg) < 5
+                ORDER BY std_weight ASC
+                LIMIT 10
+            """)
+            return [{'name': r['name'], 'cnp': r['cnp'], 'visits': r['visits'], 'avg_weight': float(r['avg_weight']), 'std_weight': float(r['std_weight']) if r['std_weight'] else 0} for r in cur.fetchall()]
 
         # Best month overall - AVERAGE per day, not total!
-        cur.execute("""
-            SELECT EXTRACT(MONTH FROM date)::int as month,
-                   SUM(gross_value) as total,
-                   COUNT(DISTINCT date) as days_count,
-                   SUM(gross_value) / COUNT(DISTINCT date) as avg_per_day
-            FROM transactions
-            GROUP BY EXTRACT(MONTH FROM date)
-            ORDER BY avg_per_day DESC
-            LIMIT 1
-        """)
-        best_month = cur.fetchone()
-        month_names = ['', 'Ianuarie', 'Februarie', 'Martie', 'Aprilie', 'Mai', 'Iunie', 'Iulie', 'August', 'Septembrie', 'Octombrie', 'Noiembrie', 'Decembrie']
+        def q_best_month(cur):
+            cur.execute("""
+                SELECT EXTRACT(MONTH FROM date)::int as month,
+                       SUM(gross_value) as total,
+                       COUNT(DISTINCT date) as days_count,
+                       SUM(gross_value) / COUNT(DISTINCT date) as avg_per_day
+                FROM transactions
+                GROUP BY EXTRACT(MONTH FROM date)
+                ORDER BY avg_per_day DESC
+                LIMIT 1
+            """)
+            return cur.fetchone()
 
         # Best weekday - AVERAGE per day, not total!
-        cur.execute("""
-            SELECT EXTRACT(DOW FROM date)::int as dow,
-                   SUM(gross_value) as total,
-                   COUNT(DISTINCT date) as days_count,
-                   SUM(gross_value) / COUNT(DISTINCT date) as avg_per_day
-            FROM transactions
-            GROUP BY EXTRACT(DOW FROM date)
-            ORDER BY avg_per_day DESC
-            LIMIT 1
-        """)
-        best_dow = cur.fetchone()
-        dow_names = ['Duminica', 'Luni', 'Marti', 'Miercuri', 'Joi', 'Vineri', 'Sambata']
+        def q_best_dow(cur):
+            cur.execute("""
+                SELECT EXTRACT(DOW FROM date)::int as dow,
+                       SUM(gross_value) as total,
+                       COUNT(DISTINCT date) as days_count,
+                       SUM(gross_value) / COUNT(DISTINCT date) as avg_per_day
+                FROM transactions
+                GROUP BY EXTRACT(DOW FROM date)
+                ORDER BY avg_per_day DESC
+                LIMIT 1
+            """)
+            return cur.fetchone()
 
         # Best week (ISO week number)
-        cur.execute("""
-            SELECT EXTRACT(ISOYEAR FROM date)::int as year,
-                   EXTRACT(WEEK FROM date)::int as week,
-                   SUM(gross_value) as total,
-                   COUNT(DISTINCT date) as days_count,
-                   MIN(date) as week_start
-            FROM transactions
-            GROUP BY EXTRACT(ISOYEAR FROM date), EXTRACT(WEEK FROM date)
-            ORDER BY total DESC
-            LIMIT 1
-        """)
-        best_week = cur.fetchone()
+        def q_best_week(cur):
+            cur.execute("""
+                SELECT EXTRACT(ISOYEAR FROM date)::int as year,
+                       EXTRACT(WEEK FROM date)::int as week,
+                       SUM(gross_value) as total,
+                       COUNT(DISTINCT date) as days_count,
+                       MIN(date) as week_start
+                FROM transactions
+                GROUP BY EXTRACT(ISOYEAR FROM date), EXTRACT(WEEK FROM date)
+                ORDER BY total DESC
+                LIMIT 1
+            """)
+            return cur.fetchone()
+
+        r, timing = parallel.fan_out({
+            'top_by_weight': q_top_weight, 'top_by_value': q_top_value, 'bottom_by_value': q_bottom_value,
+            'funny_names': q_funny_names, 'unusual_cities': q_unusual_cities, 'consistent': q_consistent,
+            'best_month': q_best_month, 'best_dow': q_best_dow, 'best_week': q_best_week,
+        }, cur)
+        best_month, best_dow, best_week = r['best_month'], r['best_dow'], r['best_week']
+        month_names = ['', 'Ianuarie', 'Februarie', 'Martie', 'Aprilie', 'Mai', 'Iunie', 'Iulie', 'August', 'Septembrie', 'Octombrie', 'Noiembrie', 'Decembrie']
+        dow_names = ['Duminica', 'Luni', 'Marti', 'Miercuri', 'Joi', 'Vineri', 'Sambata']
 
         return {
-            'top_by_weight': top_by_weight,
-            'top_by_value': top_by_value,
-            'bottom_by_value': bottom_by_value,
-            'consistent_partners': consistent_partners,
+            'top_by_weight': r['top_by_weight'],
+            'top_by_value': r['top_by_value'],
+            'bottom_by_value': r['bottom_by_value'],
+            'consistent_partners': r['consistent'],
             'best_month': {'month': month_names[best_month['month']], 'value': float(best_month['total']), 'avg_per_day': float(best_month['avg_per_day']), 'days': best_month['days_count']} if best_month else None,
             'best_weekday': {'day': dow_names[best_dow['dow']], 'value': float(best_dow['total']), 'avg_per_day': float(best_dow['avg_per_day']), 'days': best_dow['days_count']} if best_dow else None,
-            'best_week': {'year': best_week['year'], 'week': best_week['week'], 'value': float(best_week['total']), 'days': best_week['days_count'], 'week_start': str(best_week['week_start'])} if best_week else None
+            'best_week': {'year': best_week['year'], 'week': best_week['week'], 'value': float(best_week['total']), 'days': best_week['days_count'], 'week_start': str(best_week['week_start'])} if best_week else None,
+            'timing_ms': timing
         }
 
-    def get_holiday_analysis(self, cur):
-        """Analyze performance around holidays with before/after comparison"""
-        # Orthodox Easter 2024: May 5, 2025: April 20
-        # Christmas: Dec 25
-        # St Nicholas: Dec 6
-        from datetime import datetime, timedelta
-
-        holidays = {
-            'paste_2024': {'start': '2024-04-28', 'end': '2024-05-12', 'name': 'Paste 2024',
-                          'before_start': '2024-04-14', 'before_end': '2024-04-27',
-                          'after_start': '2024-05-13', 'after_end': '2024-05-26'},
-            'paste_2025': {'start': '2025-04-13', 'end': '2025-04-27', 'name': 'Paste 2025',
-                          'before_start': '2025-03-30', 'before_end': '2025-04-12',
-                          'after_start': '2025-04-28', 'after_end': '2025-05-11'},
-            'craciun_2024': {'start': '2024-12-20', 'end': '2024-12-31', 'name': 'Craciun 2024',
-                            'before_start': '2024-12-06', 'before_end': '2024-12-19',
-                            'after_start': '2025-01-01', 'after_end': '2025-01-14'},
-            'mos_nicolae_2024': {'start': '2024-12-01', 'end': '2024-12-08', 'name': 'Mos Nicolae 2024',
-                                'before_start': '2024-11-17', 'before_end': '2024-11-30',
-                                'after_start': '2024-12-09', 'after_end': '2024-12-16'},
-            'craciun_2025': {'start': '2025-12-20', 'end': '2025-12-31', 'name': 'Craciun 2025',
-                            'before_start': '2025-12-06', 'before_end': '2025-12-19',
-                            'after_start': '2026-01-01', 'after_end': '2026-01-14'},
-            'mos_nicolae_2025': {'start': '2025-12-01', 'end': '2025-12-08', 'name': 'Mos Nicolae 2025',
-                                'before_start': '2025-11-17', 'before_end': '2025-11-30',
-                                'after_start': '2025-12-09', 'after_end': '2025-12-16'}
-        }
+    def get_holiday_analysis(self, cur, year=None, window=5):
+        """Analyze performance around holiday blocks with before/after comparison (holiday_blocks).
 
-        results = {}
-        for key, h in holidays.items():
-            # Get data for holiday period
-            cur.execute("""
-                SELECT COUNT(*) as transactions,
-                       COALESCE(SUM(gross_value), 0) as total_value,
-                       COUNT(DISTINCT cnp) as partners
-                FROM transactions
-                WHERE date BETWEEN %s AND %s
-            """, (h['start'], h['end']))
-            data = cur.fetchone()
-
-            # Get data for BEFORE period
-            cur.execute("""
-                SELECT COUNT(*) as transactions,
-                       COALESCE(SUM(gross_value), 0) as total_value,
-                       COUNT(DISTINCT cnp) as partners
-                FROM transactions
-                WHERE date BETWEEN %s AND %s
-            """, (h['before_start'], h['before_end']))
-            before_data = cur.fetchone()
+        For a block the holiday period is the block plus `window` open days on each side,
+        compared per open day with the `window` open days before and after that period."""
+        window = max(1, min(int(window or 5), HOLIDAY_MAX_WINDOW))
+        if not year:
+            cur.execute("SELECT MAX(year) AS year FROM holiday_blocks")
+            year = cur.fetchone()['year']
+        if not year:
+            return {'year': None, 'window': window, 'holidays': {}}
+        year = int(year)
 
-            # Get data for AFTER period
-            cur.execute("""
-                SELECT COUNT(*) as transactions,
-                       COALESCE(SUM(gross_value), 0) as total_value,
-                       COUNT(DISTINCT cnp) as partners
-                FROM transactions
-                WHERE date BETWEEN %s AND %s
-            """, (h['after_start'], h['after_end']))
-            after_data = cur.fetchone()
+        cur.execute("""
+            SELECT block_id, block_start, block_end, year_label, block_name, before_dates, after_dates
+            FROM holiday_blocks
+            WHERE year = %s
+            ORDER BY block_start
+        """, (year,))
+        blocks = cur.fetchall()
+
+        # (block, segment, first day, last day); date lists are nearest first
+        segments = []
+        for b in blocks:
+            before, after = b['before_dates'][:2 * window], b['after_dates'][:2 * window]
+            start = before[min(window, len(before)) - 1] if before else b['block_start']
+            end = after[min(window, len(after)) - 1] if after else b['block_end']
+            segments.append((b['block_id'], 'holiday', start, end))
+            if len(before) > window:
+                segments.append((b['block_id'], 'before', before[-1], before[window]))
+            if len(after) > window:
+                segments.append((b['block_id'], 'after', after[window], after[-1]))
+        if not segments:
+            return {'year': year, 'window': window, 'holidays': {}}
+        bounds = {(seg[0], seg[1]): (seg[2], seg[3]) for seg in segments}
+        ids, names, starts, ends = (list(c) for c in zip(*segments))
 
-            # Get top category during this period
-            cur.execute("""
-                SELECT wc.name, SUM(ti.weight_kg) as total_kg, SUM(ti.value) as total_value
-                FROM transactions t
-                JOIN transaction_items ti ON t.document_id = ti.document_id
-                JOIN waste_types wt ON ti.waste_type_id = wt.id
-                JOIN waste_categories wc ON wt.category_id = wc.id
-                WHERE t.date BETWEEN %s AND %s
-                GROUP BY wc.name
-                ORDER BY total_kg DESC
-                LIMIT 3
-            """, (h['start'], h['end']))
-            top_cats = cur.fetchall()
+        cur.execute("""
+            SELECT s.block_id, s.segment,
+                   COUNT(t.document_id) as transactions,
+                   COALESCE(SUM(t.gross_value), 0) as total_value,
+                   COUNT(DISTINCT t.cnp) as partners,
+                   COUNT(DISTINCT t.date) as open_days
+            FROM unnest(%s::int[], %s::text[], %s::date[], %s::date[]) AS s(block_id, segment, date_from, date_to)
+            LEFT JOIN transaction_facts t ON t.date BETWEEN s.date_from AND s.date_to
+            GROUP BY s.block_id, s.segment
+        """, (ids, names, starts, ends))
+        stats = {(r['block_id'], r['segment']): r for r in cur.fetchall()}
+
+        # Top categories during each holiday period
+        holiday = [seg for seg in segments if seg[1] == 'holiday']  # one per block, in block order
+        cur.execute("""
+            SELECT s.block_id, wc.name, SUM(ti.weight_kg) as total_kg, SUM(ti.value) as total_value
+            FROM unnest(%s::int[], %s::date[], %s::date[]) AS s(block_id, date_from, date_to)
+            JOIN transactions t ON t.date BETWEEN s.date_from AND s.date_to
+            JOIN transaction_items ti ON t.document_id = ti.document_id
+            JOIN waste_types wt ON ti.waste_type_id = wt.id
+            JOIN waste_categories wc ON wt.category_id = wc.id
+            GROUP BY s.block_id, wc.name
+            ORDER BY s.block_id, total_kg DESC
+        """, ([h[0] for h in holiday], [h[2] for h in holiday], [h[3] for h in holiday]))
+        top_cats = {}
+        for c in cur.fetchall():
+            top_cats.setdefault(c['block_id'], [])
+            if len(top_cats[c['block_id']]) < 3:
+                top_cats[c['block_id']].append({'name': c['name'], 'kg': float(c['total_kg']), 'value': float(c['total_value'])})
+
+        def per_day(r):
+            return float(r['total_value']) / r['open_days'] if r and r['open_days'] else 0
 
-            # Calculate differences
-            before_val = float(before_data['total_value']) if before_data['total_value'] else 0
-            holiday_val = float(data['total_value']) if data['total_value'] else 0
-            after_val = float(after_data['total_value']) if after_data['total_value'] else 0
+        results = {}
+        for b, (_, _, start, end) in zip(blocks, holiday):
+            data = stats[(b['block_id'], 'holiday')]
+            before_data = stats.get((b['block_id'], 'before'))
+            after_data = stats.get((b['block_id'], 'after'))
 
+            # Calculate differences (per open day, so periods of different length compare)
+            before_val, holiday_val, after_val = per_day(before_data), per_day(data), per_day(after_data)
             diff_before_pct = ((holiday_val - before_val) / before_val * 100) if before_val > 0 else 0
             diff_after_pct = ((holiday_val - after_val) / after_val * 100) if after_val > 0 else 0
 
@@ -694,91 +676,53 @@ class handler(BaseHTTPRequestHandler):
             else:
                 explanation = "Fara impact semnificativ al sarbatorii."
 
-            results[key] = {
-                'name': h['name'],
-                'period': f"{h['start']} - {h['end']}",
+            def versus(r, key):
+                if r is None:
+                    return None
+                first, last = bounds[(b['block_id'], key)]
+                return {
+                    'period': f"{first} - {last}",
+                    'value': float(r['total_value']),
+                    'avg_per_day': per_day(r),
+                    'diff_pct': diff_before_pct if key == 'before' else diff_after_pct
+                }
+
+            results[str(b['block_id'])] = {
+                'name': f"{b['block_name']} {b['year_label']}",
+                'block': f"{b['block_start']} - {b['block_end']}",
+                'period': f"{start} - {end}",
                 'transactions': data['transactions'],
-                'total_value': holiday_val,
+                'total_value': float(data['total_value']),
+                'avg_per_day': holiday_val,
                 'partners': data['partners'],
-                'top_categories': [{'name': c['name'], 'kg': float(c['total_kg']), 'value': float(c['total_value'])} for c in top_cats],
-                'vs_before': {
-                    'period': f"{h['before_start']} - {h['before_end']}",
-                    'value': before_val,
-                    'diff_pct': diff_before_pct
-                },
-                'vs_after': {
-                    'period': f"{h['after_start']} - {h['after_end']}",
-                    'value': after_val,
-                    'diff_pct': diff_after_pct
-                },
+                'top_categories': top_cats.get(b['block_id'], []),
+                'vs_before': versus(before_data, 'before'),
+                'vs_after': versus(after_data, 'after'),
                 'explanation': explanation
             }
 
-        return {'holidays': results}
+        return {'year': year, 'window': window, 'holidays': results}
 
     def get_waste_by_region(self, cur, category=None):
         """Get waste breakdown by county, city, and age group"""
-        category_filter = ""
-        params = []
+        category_id = None
         if category:
-            category_filter = "AND wc.name ILIKE %s"
-            params.append(f'%{category}%')
-
-        # By County
-        cur.execute(f"""
-            SELECT p.county, SUM(ti.weight_kg) as total_kg, SUM(ti.value) as total_value,
-                   COUNT(DISTINCT p.cnp) as partners
-            FROM partners p
-            JOIN transactions t ON p.cnp = t.cnp
-            JOIN transaction_items ti ON t.document_id = ti.document_id
-            JOIN waste_types wt ON ti.waste_type_id = wt.id
-            JOIN waste_categories wc ON wt.category_id = wc.id
-            WHERE p.county IS NOT NULL {category_filter}
-            GROUP BY p.county
-            ORDER BY total_kg DESC
-            LIMIT 15
-        """, params)
-        by_county = [{'county': r['county'], 'total_kg': float(r['total_kg']), 'total_value': float(r['total_value']), 'partners': r['partners']} for r in cur.fetchall()]
-
-        # By City
-        cur.execute(f"""
-            SELECT p.city, p.county, SUM(ti.weight_kg) as total_kg, SUM(ti.value) as total_value,
-                   COUNT(DISTINCT p.cnp) as partners
-            FROM partners p
-            JOIN transactions t ON p.cnp = t.cnp
-            JOIN transaction_items ti ON t.document_id = ti.document_id
-            JOIN waste_types wt ON ti.waste_type_id = wt.id
-            JOIN waste_categories wc ON wt.category_id = wc.id
-            WHERE p.city IS NOT NULL {category_filter}
-            GROUP BY p.city, p.county
-            ORDER BY total_kg DESC
-            LIMIT 15
-        """, params)
-        by_city = [{'city': r['city'], 'county': r['county'], 'total_kg': float(r['total_kg']), 'total_value': float(r['total_value']), 'partners': r['partners']} for r in cur.fetchall()]
-
-        # By Age Group
-        cur.execute(f"""
-            SELECT
-                CASE
-                    WHEN EXTRACT(YEAR FROM CURRENT_DATE) - p.birth_year < 25 THEN '18-24'
-                    WHEN EXTRACT(YEAR FROM CURRENT_DATE) - p.birth_year < 35 THEN '25-34'
-                    WHEN EXTRACT(YEAR FROM CURRENT_DATE) - p.birth_year < 45 THEN '35-44'
-                    WHEN EXTRACT(YEAR FROM CURRENT_DATE) - p.birth_year < 55 THEN '45-54'
-                    WHEN EXTRACT(YEAR FROM CURRENT_DATE) - p.birth_year < 65 THEN '55-64'
-                    ELSE '65+'
-                END as age_group,
-                SUM(ti.weight_kg) as total_kg, SUM(ti.value) as total_value,
-                COUNT(DISTINCT p.cnp) as partners
-            FROM partners p
-            JOIN transactions t ON p.cnp = t.cnp
-            JOIN transaction_items ti ON t.document_id = ti.document_id
-            JOIN waste_types wt ON ti.waste_type_id = wt.id
-            JOIN waste_categories wc ON wt.category_id = wc.id
-            WHERE p.birth_year IS NOT NULL {category_filter}
-            GROUP BY age_group
-            ORDER BY total_kg DESC
-        """, params)
-        by_age = [{'age_group': r['age_group'], 'total_kg': float(r['total_kg']), 'total_value': float(r['total_value']), 'partners': r['partners']} for r in cur.fetchall()]
+            try:
+                category_id, category = cube.resolve_category(cur, category)
+            except ValueError as e:
+                return {'error': str(e)}
+
+        # By County (cube_activity)
+        county_rows = cube.measures_by(cur, 'county', category_id=category_id, limit=15, known_only=True)
+        by_county = [{'county': r['value'], 'total_kg': float(r['total_kg']), 'total_value': float(r['total_value']), 'partners': r['partners']} for r in county_rows]
+
+        # By City (geo_stats)
+        city_rows = geo.measures_by(cur, 'city', category_id=category_id, order='total_kg', limit=15)
+        by_city = [{'city': r['value'], 'county': r['county'], 'total_kg': float(r['total_kg']), 'total_value': float(r['total_value']), 'partners': r['partners']} for r in city_rows]
+
+        # By Age Group (age now, cube_activity)
+        age_rows = cube.measures_by(cur, 'age_group_now', category_id=category_id, known_only=True)
+        by_age = [{'age_group': r['value'], 'total_kg': float(r['total_kg']), 'total_value': float(r['total_value']), 'partners': r['partners']} for r in age_rows]
 
         # Get all categories for dropdown
         cur.execute("SELECT name FROM waste_categories ORDER BY name")
@@ -793,48 +737,10 @@ class handler(BaseHTTPRequestHandler):
         }
 
     def get_all_cities(self, cur):
-        """Get list of all cities with stats - normalized to avoid duplicates"""
-        # First, normalize city names by removing prefixes like "Com.", "Oras", "Sat", "Mun."
-        # and group by the normalized name, picking the most common county
+        """Get list of all cities with stats - normalized to avoid duplicates (city_stats rollup)"""
         cur.execute("""
-            WITH normalized_cities AS (
-                SELECT
-                    p.cnp,
-                    TRIM(REGEXP_REPLACE(
-                        REGEXP_REPLACE(
-                            REGEXP_REPLACE(
-                                REGEXP_REPLACE(
-                                    REGEXP_REPLACE(p.city, '^Com\\.?\\s+', '', 'i'),
-                                    '^Comuna\\s+', '', 'i'),
-                                '^Oras\\s+', '', 'i'),
-                            '^Sat\\s+', '', 'i'),
-                        '^Mun\\.?\\s+|^Municipiul\\s+', '', 'i')
-                    ) as normalized_city,
-                    p.county
-                FROM partners p
-                WHERE p.city IS NOT NULL
-            ),
-            city_counties AS (
-                SELECT normalized_city, county, COUNT(*) as cnt
-                FROM normalized_cities
-                WHERE county IS NOT NULL
-                GROUP BY normalized_city, county
-            ),
-            best_county AS (
-                SELECT DISTINCT ON (normalized_city) normalized_city, county
-                FROM city_counties
-                ORDER BY normalized_city, cnt DESC
-            )
-            SELECT nc.normalized_city as city,
-                   bc.county,
-                   COUNT(DISTINCT nc.cnp) as partners,
-                   SUM(ti.weight_kg) as total_kg,
-                   SUM(ti.value) as total_value
-            FROM normalized_cities nc
-            JOIN transactions t ON nc.cnp = t.cnp
-            JOIN transaction_items ti ON t.document_id = ti.document_id
-            LEFT JOIN best_county bc ON nc.normalized_city = bc.normalized_city
-            GROUP BY nc.normalized_city, bc.county
+            SELECT normalized_city as city, county, partners, total_kg, total_value
+            FROM city_stats
             ORDER BY total_value DESC
         """)
         cities = [{'city': r['city'], 'county': r['county'], 'partners': r['partners'],
@@ -842,91 +748,55 @@ class handler(BaseHTTPRequestHandler):
         return {'cities': cities, 'count': len(cities)}
 
     def get_city_details(self, cur, city):
-        """Get detailed breakdown for a specific city - handles normalized city names"""
+        """Get detailed breakdown for a specific city - matched on partners.normalized_city"""
         if not city:
             return {'error': 'City parameter required'}
 
-        # Create a pattern to match the city with possible prefixes
-        city_pattern = f'%{city}%'
-
-        # Basic stats - use pattern matching to find all variations
+        # Totals and canonical county from the rollup; the input is normalized the same way
         cur.execute("""
-            SELECT COUNT(DISTINCT p.cnp) as partners,
-                   COUNT(DISTINCT t.document_id) as transactions,
-                   SUM(ti.weight_kg) as total_kg,
-                   SUM(ti.value) as total_value
-            FROM partners p
-            JOIN transactions t ON p.cnp = t.cnp
-            JOIN transaction_items ti ON t.document_id = ti.document_id
-            WHERE p.city ILIKE %s
-        """, (city_pattern,))
+            SELECT normalized_city, county, partners, transactions, total_kg, total_value
+            FROM city_stats
+            WHERE normalized_city = normalize_city(%s)
+        """, (city,))
         basic = cur.fetchone()
 
-        # Get the county (most common one for this city)
-        cur.execute("""
-            SELECT p.county, COUNT(*) as cnt
-            FROM partners p
-            WHERE p.city ILIKE %s AND p.county IS NOT NULL
-            GROUP BY p.county
-            ORDER BY cnt DESC
-            LIMIT 1
-        """, (city_pattern,))
-        county_row = cur.fetchone()
-        county = county_row['county'] if county_row else None
-
         if not basic or basic['partners'] == 0:
             return {'error': f'City {city} not found'}
+        normalized = basic['normalized_city']
 
-        # Breakdown by waste category
-        cur.execute("""
-            SELECT wc.name as category,
-                   SUM(ti.weight_kg) as total_kg,
-                   SUM(ti.value) as total_value
-            FROM partners p
-            JOIN transactions t ON p.cnp = t.cnp
-            JOIN transaction_items ti ON t.document_id = ti.document_id
-            JOIN waste_types wt ON ti.waste_type_id = wt.id
-            JOIN waste_categories wc ON wt.category_id = wc.id
-            WHERE p.city ILIKE %s
-            GROUP BY wc.name
-            ORDER BY total_kg DESC
-        """, (city_pattern,))
-        by_category = [{'category': r['category'], 'total_kg': float(r['total_kg']), 'total_value': float(r['total_value'])} for r in cur.fetchall()]
+        # Breakdown by waste category (geo_stats)
+        category_rows = geo.measures_by(cur, 'category', city=normalized, order='total_kg')
+        by_category = [{'category': r['value'], 'total_kg': float(r['total_kg']), 'total_value': float(r['total_value'])} for r in category_rows]
 
-        # Top partners by visits
+        # Top partners by visits and by value in one scan
         cur.execute("""
-            SELECT p.cnp, p.name, COUNT(t.document_id) as visits, SUM(t.gross_value) as total_value
-            FROM partners p
-            JOIN transactions t ON p.cnp = t.cnp
-            WHERE p.city ILIKE %s
-            GROUP BY p.cnp, p.name
-            ORDER BY visits DESC
-            LIMIT 20
-        """, (city_pattern,))
-        top_by_visits = [{'cnp': r['cnp'], 'name': r['name'], 'visits': r['visits'], 'total_value': float(r['total_value'])} for r in cur.fetchall()]
-
-        # Top partners by value
-        cur.execute("""
-            SELECT p.cnp, p.name, COUNT(t.document_id) as visits, SUM(t.gross_value) as total_value
-            FROM partners p
-            JOIN transactions t ON p.cnp = t.cnp
-            WHERE p.city ILIKE %s
-            GROUP BY p.cnp, p.name
-            ORDER BY total_value DESC
-            LIMIT 20
-        """, (city_pattern,))
-        top_by_value = [{'cnp': r['cnp'], 'name': r['name'], 'visits': r['visits'], 'total_value': float(r['total_value'])} for r in cur.fetchall()]
+            SELECT * FROM (
+                SELECT p.cnp, p.name, COUNT(t.document_id) as visits, SUM(t.gross_value) as total_value,
+                       ROW_NUMBER() OVER (ORDER BY COUNT(t.document_id) DESC, p.cnp) as rank_visits,
+                       ROW_NUMBER() OVER (ORDER BY SUM(t.gross_value) DESC NULLS LAST, p.cnp) as rank_value
+                FROM partners p
+                JOIN transactions t ON p.cnp = t.cnp
+                WHERE p.normalized_city = %s
+                GROUP BY p.cnp, p.name
+            ) ranked
+            WHERE rank_visits <= 20 OR rank_value <= 20
+        """, (normalized,))
+        ranked = cur.fetchall()
+
+        def fmt(rows, rank):
+            return [{'cnp': r['cnp'], 'name': r['name'], 'visits': r['visits'], 'total_value': float(r['total_value'] or 0)}
+                    for r in sorted((r for r in rows if r[rank] <= 20), key=lambda r: r[rank])]
 
         return {
-            'city': city,
-            'county': county,
+            'city': normalized,
+            'county': basic['county'],
             'partners': basic['partners'],
             'transactions': basic['transactions'],
             'total_kg': float(basic['total_kg']) if basic['total_kg'] else 0,
             'total_value': float(basic['total_value']) if basic['total_value'] else 0,
             'by_category': by_category,
-            'top_by_visits': top_by_visits,
-            'top_by_value': top_by_value
+            'top_by_visits': fmt(ranked, 'rank_visits'),
+            'top_by_value': fmt(ranked, 'rank_value')
         }
 
     def get_custom_compare(self, cur, months_str, category):
@@ -935,209 +805,51 @@ class handler(BaseHTTPRequestHandler):
         month_list = [int(m.strip()) for m in months_str.split(',') if m.strip().isdigit()]
         if not month_list:
             return {'error': 'No valid months specified'}
+        category_id = None
+        if category:
+            try:
+                category_id, category = cube.resolve_category(cur, category)
+            except ValueError as e:
+                return {'error': str(e)}
+
+        def q_categories(c):
+            c.execute("SELECT name FROM waste_categories ORDER BY name")
+            return c.fetchall()
+
+        # All per-year numbers come from cube_activity; the groups are independent
+        tasks = {
+            'year_stats': lambda c: cube.year_totals(c, month_list, category_id),
+            'sex': lambda c: cube.partners_by(c, 'sex', month_list, category_id),
+            'age': lambda c: cube.partners_by(c, 'age_group', month_list, category_id),
+            'county': lambda c: cube.partners_by(c, 'county', month_list, category_id),
+            # Also get TOTAL partners per year (all months) for comparison
+            'year_totals': lambda c: cube.year_totals(c),
+            'categories': q_categories,
+        }
+        if not category:
+            tasks['breakdown'] = lambda c: cube.category_breakdown(c, month_list)
+        r, timing = parallel.fan_out(tasks, cur)
 
-        month_placeholders = ','.join(['%s'] * len(month_list))
+        year_stats = r['year_stats']
+        sex_data = [row for row in r['sex'] if row['value']]
+        age_data = r['age']
+        county_data = r['county']
 
-        # Base: all transactions in selected months
-        # If category filter: only partners/transactions that have items in that category
         if category:
-            # Per year stats - filtered by category
-            cur.execute(f"""
-                SELECT EXTRACT(YEAR FROM t.date)::int as year,
-                       COUNT(DISTINCT t.document_id) as transactions,
-                       COALESCE(SUM(t.gross_value), 0) as total_value,
-                       COALESCE(SUM(t.net_paid), 0) as total_paid,
-                       COUNT(DISTINCT t.cnp) as unique_partners,
-                       COUNT(DISTINCT t.date) as working_days
-                FROM transactions t
-                JOIN transaction_items ti ON t.document_id = ti.document_id
-                JOIN waste_types wt ON ti.waste_type_id = wt.id
-                JOIN waste_categories wc ON wt.category_id = wc.id
-                WHERE EXTRACT(MONTH FROM t.date) IN ({month_placeholders})
-                  AND wc.name ILIKE %s
-                GROUP BY EXTRACT(YEAR FROM t.date)
-                ORDER BY year
-            """, month_list + [category])
-
-            year_stats = cur.fetchall()
-
-            # Category-specific weight/value
-            cur.execute(f"""
-                SELECT EXTRACT(YEAR FROM t.date)::int as year,
-                       COALESCE(SUM(ti.weight_kg), 0) as total_kg,
-                       COALESCE(SUM(ti.value), 0) as category_value,
-                       COUNT(DISTINCT t.cnp) as category_partners,
-                       ROUND(AVG(ti.price_per_kg)::numeric, 2) as avg_price
-                FROM transaction_items ti
-                JOIN waste_types wt ON ti.waste_type_id = wt.id
-                JOIN waste_categories wc ON wt.category_id = wc.id
-                JOIN transactions t ON ti.document_id = t.document_id
-                WHERE EXTRACT(MONTH FROM t.date) IN ({month_placeholders})
-                  AND wc.name ILIKE %s
-                GROUP BY EXTRACT(YEAR FROM t.date)
-                ORDER BY year
-            """, month_list + [category])
-            category_stats = {r['year']: r for r in cur.fetchall()}
-
-            # Demographics for partners who brought this category in selected months
-            cur.execute(f"""
-                SELECT EXTRACT(YEAR FROM t.date)::int as year,
-                       p.sex,
-                       COUNT(DISTINCT p.cnp) as cnt
-                FROM partners p
-                JOIN transactions t ON p.cnp = t.cnp
-                JOIN transaction_items ti ON t.document_id = ti.document_id
-                JOIN waste_types wt ON ti.waste_type_id = wt.id
-                JOIN waste_categories wc ON wt.category_id = wc.id
-                WHERE EXTRACT(MONTH FROM t.date) IN ({month_placeholders})
-                  AND wc.name ILIKE %s
-                  AND p.sex IS NOT NULL AND p.sex != ''
-                GROUP BY EXTRACT(YEAR FROM t.date), p.sex
-                ORDER BY year
-            """, month_list + [category])
-            sex_data = cur.fetchall()
-
-            # Age groups for category partners
-            cur.execute(f"""
-                SELECT EXTRACT(YEAR FROM t.date)::int as year,
-                       CASE
-                           WHEN p.birth_year IS NULL OR p.birth_year = 0 THEN 'Necunoscut'
-                           WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 25 THEN '18-24'
-                           WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 35 THEN '25-34'
-                           WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 45 THEN '35-44'
-                           WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 55 THEN '45-54'
-                           WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 65 THEN '55-64'
-                           ELSE '65+'
-                       END as age_group,
-                       COUNT(DISTINCT p.cnp) as cnt
-                FROM partners p
-                JOIN transactions t ON p.cnp = t.cnp
-                JOIN transaction_items ti ON t.document_id = ti.document_id
-                JOIN waste_types wt ON ti.waste_type_id = wt.id
-                JOIN waste_categories wc ON wt.category_id = wc.id
-                WHERE EXTRACT(MONTH FROM t.date) IN ({month_placeholders})
-                  AND wc.name ILIKE %s
-                GROUP BY EXTRACT(YEAR FROM t.date), age_group
-                ORDER BY year
-            """, month_list + [category])
-            age_data = cur.fetchall()
-
-            # County breakdown for category partners
-            cur.execute(f"""
-                SELECT EXTRACT(YEAR FROM t.date)::int as year,
-                       COALESCE(p.county, 'Necunoscut') as county,
-                       COUNT(DISTINCT p.cnp) as cnt
-                FROM partners p
-                JOIN transactions t ON p.cnp = t.cnp
-                JOIN transaction_items ti ON t.document_id = ti.document_id
-                JOIN waste_types wt ON ti.waste_type_id = wt.id
-                JOIN waste_categories wc ON wt.category_id = wc.id
-                WHERE EXTRACT(MONTH FROM t.date) IN ({month_placeholders})
-                  AND wc.name ILIKE %s
-                GROUP BY EXTRACT(YEAR FROM t.date), p.county
-                ORDER BY year, cnt DESC
-            """, month_list + [category])
-            county_data = cur.fetchall()
-
+            category_stats = {row['year']: row for row in year_stats}
         else:
-            # No category filter - all transactions in selected months
-            cur.execute(f"""
-                SELECT EXTRACT(YEAR FROM t.date)::int as year,
-                       COUNT(DISTINCT t.document_id) as transactions,
-                       COALESCE(SUM(t.gross_value), 0) as total_value,
-                       COALESCE(SUM(t.net_paid), 0) as total_paid,
-                       COUNT(DISTINCT t.cnp) as unique_partners,
-                       COUNT(DISTINCT t.date) as working_days
-                FROM transactions t
-                WHERE EXTRACT(MONTH FROM t.date) IN ({month_placeholders})
-                GROUP BY EXTRACT(YEAR FROM t.date)
-                ORDER BY year
-            """, month_list)
-            year_stats = cur.fetchall()
-
-            # Total weight by category per year
-            cur.execute(f"""
-                SELECT EXTRACT(YEAR FROM t.date)::int as year,
-                       wc.name as category,
-                       COALESCE(SUM(ti.weight_kg), 0) as total_kg,
-                       COALESCE(SUM(ti.value), 0) as total_value
-                FROM transaction_items ti
-                JOIN waste_types wt ON ti.waste_type_id = wt.id
-                JOIN waste_categories wc ON wt.category_id = wc.id
-                JOIN transactions t ON ti.document_id = t.document_id
-                WHERE EXTRACT(MONTH FROM t.date) IN ({month_placeholders})
-                GROUP BY EXTRACT(YEAR FROM t.date), wc.name
-                ORDER BY year, total_kg DESC
-            """, month_list)
-            cat_breakdown_rows = cur.fetchall()
             category_stats = {}
-            for r in cat_breakdown_rows:
-                yr = r['year']
+            for row in r['breakdown']:
+                yr = row['year']
                 if yr not in category_stats:
                     category_stats[yr] = {'categories': []}
                 category_stats[yr]['categories'].append({
-                    'name': r['category'],
-                    'kg': float(r['total_kg']),
-                    'value': float(r['total_value'])
+                    'name': row['category'],
+                    'kg': float(row['total_kg']),
+                    'value': float(row['total_value'])
                 })
 
-            # Demographics - sex
-            cur.execute(f"""
-                SELECT EXTRACT(YEAR FROM t.date)::int as year,
-                       p.sex,
-                       COUNT(DISTINCT p.cnp) as cnt
-                FROM partners p
-                JOIN transactions t ON p.cnp = t.cnp
-                WHERE EXTRACT(MONTH FROM t.date) IN ({month_placeholders})
-                  AND p.sex IS NOT NULL AND p.sex != ''
-                GROUP BY EXTRACT(YEAR FROM t.date), p.sex
-                ORDER BY year
-            """, month_list)
-            sex_data = cur.fetchall()
-
-            # Age groups
-            cur.execute(f"""
-                SELECT EXTRACT(YEAR FROM t.date)::int as year,
-                       CASE
-                           WHEN p.birth_year IS NULL OR p.birth_year = 0 THEN 'Necunoscut'
-                           WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 25 THEN '18-24'
-                           WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 35 THEN '25-34'
-                           WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 45 THEN '35-44'
-                           WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 55 THEN '45-54'
-                           WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 65 THEN '55-64'
-                           ELSE '65+'
-                       END as age_group,
-                       COUNT(DISTINCT p.cnp) as cnt
-                FROM partners p
-                JOIN transactions t ON p.cnp = t.cnp
-                WHERE EXTRACT(MONTH FROM t.date) IN ({month_placeholders})
-                GROUP BY EXTRACT(YEAR FROM t.date), age_group
-                ORDER BY year
-            """, month_list)
-            age_data = cur.fetchall()
-
-            # County breakdown
-            cur.execute(f"""
-                SELECT EXTRACT(YEAR FROM t.date)::int as year,
-                       COALESCE(p.county, 'Necunoscut') as county,
-                       COUNT(DISTINCT p.cnp) as cnt
-                FROM partners p
-                JOIN transactions t ON p.cnp = t.cnp
-                WHERE EXTRACT(MONTH FROM t.date) IN ({month_placeholders})
-                GROUP BY EXTRACT(YEAR FROM t.date), p.county
-                ORDER BY year, cnt DESC
-            """, month_list)
-            county_data = cur.fetchall()
-
-        # Also get TOTAL partners per year (all months) for comparison
-        cur.execute("""
-            SELECT EXTRACT(YEAR FROM date)::int as year,
-                   COUNT(DISTINCT cnp) as total_partners
-            FROM transactions
-            GROUP BY EXTRACT(YEAR FROM date)
-            ORDER BY year
-        """)
-        total_partners_by_year = {r['year']: r['total_partners'] for r in cur.fetchall()}
+        total_partners_by_year = {row['year']: row['unique_partners'] for row in r['year_totals']}
 
         # Build result
         years_result = {}
@@ -1147,20 +859,20 @@ class handler(BaseHTTPRequestHandler):
             sex_breakdown = {}
             for sd in sex_data:
                 if sd['year'] == yr:
-                    sex_breakdown[sd['sex']] = sd['cnt']
+                    sex_breakdown[sd['value']] = sd['cnt']
 
             # Age breakdown
             age_breakdown = {}
             age_order = ['18-24', '25-34', '35-44', '45-54', '55-64', '65+', 'Necunoscut']
             for ad in age_data:
                 if ad['year'] == yr:
-                    age_breakdown[ad['age_group']] = ad['cnt']
+                    age_breakdown[ad['value']] = ad['cnt']
 
             # County breakdown (top 10)
             counties = []
             for cd in county_data:
                 if cd['year'] == yr:
-                    counties.append({'county': cd['county'], 'partners': cd['cnt']})
+                    counties.append({'county': cd['value'], 'partners': cd['cnt']})
             counties = counties[:10]
 
             year_data = {
@@ -1178,22 +890,22 @@ class handler(BaseHTTPRequestHandler):
 
             if category:
                 cs = category_stats.get(yr, {})
-                year_data['category_kg'] = float(cs.get('total_kg', 0)) if cs else 0
-                year_data['category_value'] = float(cs.get('category_value', 0)) if cs else 0
-                year_data['category_partners'] = cs.get('category_partners', 0) if cs else 0
-                year_data['avg_price'] = float(cs.get('avg_price', 0)) if cs else 0
+                year_data['category_kg'] = float(cs.get('total_kg') or 0) if cs else 0
+                year_data['category_value'] = float(cs.get('item_value') or 0) if cs else 0
+                year_data['category_partners'] = cs.get('unique_partners', 0) if cs else 0
+                year_data['avg_price'] = float(cs.get('avg_price') or 0) if cs else 0
             else:
                 year_data['category_breakdown'] = category_stats.get(yr, {}).get('categories', [])
 
             years_result[yr] = year_data
 
-        # Get available categories for filter
-        cur.execute("SELECT name FROM waste_categories ORDER BY name")
-        available_categories = [r['name'] for r in cur.fetchall()]
+        # Available categories for filter
+        available_categories = [row['name'] for row in r['categories']]
 
         return {
             'months': month_list,
             'category': category,
             'years': years_result,
-            'available_categories': available_categories
+            'available_categories': available_categories,
+            'timing_ms': timing
         }
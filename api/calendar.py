@@ -7,7 +7,7 @@ Endpoints:
   GET  /api/calendar?type=working_days&date_from=X&date_to=Y
   GET  /api/calendar?type=weekly_pattern&date_from=X&date_to=Y
   GET  /api/calendar?type=monthly_pattern&year=YYYY
-  GET  /api/calendar?type=holiday_effect&window=3
+  GET  /api/calendar?type=holiday_effect&window=3[&year=YYYY]
   GET  /api/calendar?type=bridge_days
   GET  /api/calendar?type=illegal_workdays
   POST /api/calendar?action=confirm_closure   body: {date_from, date_to, reason}
@@ -16,32 +16,25 @@ Endpoints:
 from http.server import BaseHTTPRequestHandler
 import json
 import os
+import sys
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from urllib.parse import urlparse, parse_qs
-from decimal import Decimal
-from datetime import date, datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _lib import querylog, serialize
+
+# Open days per side stored in holiday_blocks (refresh_holiday_blocks p_max_window)
+HOLIDAY_MAX_WINDOW = 20
 
 def get_db():
     db_url = os.environ.get('POSTGRES_URL') or os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL_NO_SSL')
     if not db_url:
         raise Exception("No database URL configured")
-    return psycopg2.connect(db_url, cursor_factory=RealDictCursor)
-
-def json_default(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    if isinstance(obj, (date, datetime)):
-        return obj.isoformat()
-    raise TypeError(f"Not serializable: {type(obj)}")
+    return psycopg2.connect(db_url, cursor_factory=querylog.TimedCursor)
 
 class handler(BaseHTTPRequestHandler):
     def _send(self, status, payload):
-        self.send_response(status)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(payload, default=json_default).encode('utf-8'))
+        serialize.send_json(self, status, payload, querylog.finish())
 
     def list_holidays(self, cur, year):
         if year:
@@ -73,21 +66,13 @@ class handler(BaseHTTPRequestHandler):
         the count."""
         cur.execute(
             """
-            WITH bounds AS (SELECT MIN(date) AS dmin, MAX(date) AS dmax FROM transactions),
-            days AS (
-              SELECT generate_series(b.dmin, b.dmax, '1 day'::interval)::date AS d FROM bounds b
-            ),
-            tx_set AS (SELECT DISTINCT date FROM transactions),
-            official AS (SELECT DISTINCT date FROM holidays WHERE is_official),
+            WITH bounds AS (SELECT MIN(date) AS dmin, MAX(date) AS dmax FROM calendar_days WHERE tx_count > 0),
             marked AS (
-              SELECT d,
-                     (EXTRACT(ISODOW FROM d) = 7
-                       OR d IN (SELECT date FROM official)
-                       OR d NOT IN (SELECT date FROM tx_set)) AS is_closed,
-                     (EXTRACT(ISODOW FROM d) <> 7
-                       AND d NOT IN (SELECT date FROM official)
-                       AND d NOT IN (SELECT date FROM tx_set)) AS is_company_closure
-              FROM days
+              SELECT c.date AS d,
+                     (c.is_sunday OR c.is_official_holiday OR c.tx_count = 0) AS is_closed,
+                     (NOT c.is_sunday AND NOT c.is_official_holiday AND c.tx_count = 0) AS is_company_closure
+              FROM calendar_days c, bounds b
+              WHERE c.date BETWEEN b.dmin AND b.dmax
             ),
             grouped AS (
               SELECT d, is_closed, is_company_closure,
@@ -124,14 +109,11 @@ class handler(BaseHTTPRequestHandler):
                      EXTRACT(ISODOW FROM t.date)::int AS dow,
                      COUNT(DISTINCT t.cnp) AS partners,
                      COUNT(*) AS tx_count,
-                     COALESCE(SUM(i.weight_kg), 0) AS kg,
+                     COALESCE(SUM(t.weight_kg), 0) AS kg,
                      COALESCE(SUM(t.gross_value), 0) AS ron
-              FROM transactions t
-              LEFT JOIN transaction_items i ON i.document_id = t.document_id
+              FROM transaction_facts t
+              JOIN calendar_days c ON c.date = t.date AND c.is_open
               WHERE {where_sql}
-                AND EXTRACT(ISODOW FROM t.date) <> 7
-                AND t.date NOT IN (SELECT date FROM holidays WHERE is_official)
-                AND t.date NOT IN (SELECT date FROM company_closures WHERE reason IS DISTINCT FROM '__ignored__')
               GROUP BY t.date
             )
             SELECT dow,
@@ -157,13 +139,11 @@ class handler(BaseHTTPRequestHandler):
 
     def monthly_pattern(self, cur, year):
         year = int(year) if year else None
-        where = ["EXTRACT(ISODOW FROM t.date) <> 7",
-                 "t.date NOT IN (SELECT date FROM holidays WHERE is_official)",
-                 "t.date NOT IN (SELECT date FROM company_closures WHERE reason IS DISTINCT FROM '__ignored__')"]
+        where = ["TRUE"]
         args = []
         if year:
-            where.append("EXTRACT(year FROM t.date) = %s")
-            args.append(year)
+            where.append("t.date >= make_date(%s, 1, 1) AND t.date < make_date(%s + 1, 1, 1)")
+            args += [year, year]
         cur.execute(
             f"""
             WITH daily AS (
@@ -171,10 +151,10 @@ class handler(BaseHTTPRequestHandler):
                      EXTRACT(month FROM t.date)::int AS month,
                      COUNT(DISTINCT t.cnp) AS partners,
                      COUNT(*) AS tx_count,
-                     COALESCE(SUM(i.weight_kg), 0) AS kg,
+                     COALESCE(SUM(t.weight_kg), 0) AS kg,
                      COALESCE(SUM(t.gross_value), 0) AS ron
-              FROM transactions t
-              LEFT JOIN transaction_items i ON i.document_id = t.document_id
+              FROM transaction_facts t
+              JOIN calendar_days c ON c.date = t.date AND c.is_open
               WHERE {' AND '.join(where)}
               GROUP BY t.date
             )
@@ -197,136 +177,79 @@ class handler(BaseHTTPRequestHandler):
         return [dict(r) for r in cur.fetchall()]
 
     def working_days(self, cur, date_from, date_to):
+        # calendar_days only spans the years with transactions or holidays;
+        # days outside it are classified on the fly (COALESCE is lazy, so the
+        # subqueries only run for those)
         cur.execute(
             """
             WITH days AS (
               SELECT generate_series(%s::date, %s::date, '1 day'::interval)::date AS d
+            ),
+            flags AS (
+              SELECT c.is_open,
+                     COALESCE(c.is_sunday, EXTRACT(ISODOW FROM days.d) = 7) AS is_sunday,
+                     COALESCE(c.is_official_holiday,
+                              EXISTS (SELECT 1 FROM holidays h WHERE h.date = days.d AND h.is_official))
+                       AS is_official_holiday,
+                     COALESCE(c.is_company_closure,
+                              EXISTS (SELECT 1 FROM company_closures cc
+                                      WHERE cc.date = days.d AND cc.reason IS DISTINCT FROM '__ignored__'))
+                       AS is_company_closure
+              FROM days
+              LEFT JOIN calendar_days c ON c.date = days.d
             )
-            SELECT
-              COUNT(*) FILTER (
-                WHERE EXTRACT(ISODOW FROM d) <> 7
-                  AND d NOT IN (SELECT date FROM holidays WHERE is_official)
-                  AND d NOT IN (SELECT date FROM company_closures WHERE reason IS DISTINCT FROM '__ignored__')
-              ) AS working_days,
-              COUNT(*) FILTER (WHERE EXTRACT(ISODOW FROM d) = 7) AS sundays,
-              COUNT(*) FILTER (WHERE d IN (SELECT date FROM holidays WHERE is_official)) AS official_holidays,
-              COUNT(*) FILTER (WHERE d IN (SELECT date FROM company_closures WHERE reason IS DISTINCT FROM '__ignored__')) AS company_closed
-            FROM days
+            SELECT COUNT(*) FILTER (WHERE COALESCE(is_open, NOT (is_sunday OR is_official_holiday OR is_company_closure)))
+                     AS working_days,
+                   COUNT(*) FILTER (WHERE is_sunday) AS sundays,
+                   COUNT(*) FILTER (WHERE is_official_holiday) AS official_holidays,
+                   COUNT(*) FILTER (WHERE is_company_closure) AS company_closed
+            FROM flags
             """,
             (date_from, date_to),
         )
         return dict(cur.fetchone())
 
-    def holiday_effect(self, cur, window):
-        """Group consecutive official holidays (spanning Sundays and other
-        closed days) into a single holiday BLOCK, then compare traffic on the
-        N nearest open days before the block vs after the block. Avoids showing
-        the same before/after data three times for holidays like Easter that
-        naturally fall in a multi-day closure."""
-        window = int(window) if window else 3
+    def holiday_effect(self, cur, window, year=None):
+        """Compare traffic on the N nearest open days before each holiday BLOCK
+        (consecutive official holidays spanning Sundays and other closed days)
+        vs the N after it, from holiday_blocks. Avoids showing the same
+        before/after data three times for holidays like Easter that naturally
+        fall in a multi-day closure."""
+        where = "WHERE hb.year = %s" if year else ""
+        args = [window, window] + ([int(year)] if year else [])
         cur.execute(
             f"""
-            WITH tx_bounds AS (SELECT MIN(date) AS dmin, MAX(date) AS dmax FROM transactions),
-            tx_days AS (SELECT t.date, COUNT(DISTINCT t.cnp) AS partners FROM transactions t GROUP BY t.date),
-            official AS (
-              SELECT DISTINCT h.date, h.name
-              FROM holidays h, tx_bounds b
-              WHERE h.is_official AND h.date BETWEEN b.dmin AND b.dmax
-            ),
-            days AS (
-              SELECT generate_series(b.dmin, b.dmax, '1 day'::interval)::date AS d FROM tx_bounds b
-            ),
-            marked AS (
-              SELECT d,
-                (d IN (SELECT date FROM tx_days)
-                 AND EXTRACT(ISODOW FROM d) <> 7
-                 AND d NOT IN (SELECT date FROM official)) AS is_open
-              FROM days
-            ),
-            numbered AS (
-              SELECT d, is_open,
-                SUM(CASE WHEN is_open THEN 1 ELSE 0 END) OVER (ORDER BY d ROWS UNBOUNDED PRECEDING) AS grp
-              FROM marked
-            ),
-            closure_blocks AS (
-              SELECT grp, MIN(d) AS block_start, MAX(d) AS block_end
-              FROM numbered WHERE NOT is_open
-              GROUP BY grp
-            ),
-            holiday_blocks AS (
-              SELECT cb.grp, cb.block_start, cb.block_end,
-                     STRING_AGG(o.name, ' + ' ORDER BY o.date) AS block_name,
-                     CASE
-                       WHEN EXTRACT(year FROM cb.block_start) = EXTRACT(year FROM cb.block_end)
-                         THEN EXTRACT(year FROM cb.block_start)::text
-                       ELSE EXTRACT(year FROM cb.block_start)::text || '/' ||
-                            RIGHT(EXTRACT(year FROM cb.block_end)::text, 2)
-                     END AS year_label
-              FROM official o
-              JOIN closure_blocks cb ON o.date BETWEEN cb.block_start AND cb.block_end
-              GROUP BY cb.grp, cb.block_start, cb.block_end
-            ),
-            before_ranked AS (
-              SELECT hb.block_name, hb.year_label, hb.block_start, hb.block_end, t.partners,
-                     ROW_NUMBER() OVER (PARTITION BY hb.grp ORDER BY t.date DESC) AS rn
-              FROM holiday_blocks hb
-              JOIN tx_days t ON t.date < hb.block_start
-            ),
-            after_ranked AS (
-              SELECT hb.block_name, hb.year_label, hb.block_start, hb.block_end, t.partners,
-                     ROW_NUMBER() OVER (PARTITION BY hb.grp ORDER BY t.date ASC) AS rn
-              FROM holiday_blocks hb
-              JOIN tx_days t ON t.date > hb.block_end
-            ),
-            slots AS (
-              SELECT block_name, year_label, block_start, block_end, -rn::int AS offset_days, partners
-              FROM before_ranked WHERE rn <= {window}
+            SELECT hb.block_name AS holiday_name,
+                   hb.year_label,
+                   hb.block_start,
+                   hb.block_end,
+                   hb.days_total,
+                   s.offset_days,
+                   s.partners
+            FROM holiday_blocks hb
+            CROSS JOIN LATERAL (
+              SELECT -i::int AS offset_days, p AS partners
+              FROM unnest(hb.before_partners) WITH ORDINALITY AS u(p, i) WHERE i <= %s
               UNION ALL
-              SELECT block_name, year_label, block_start, block_end, rn::int AS offset_days, partners
-              FROM after_ranked WHERE rn <= {window}
-            )
-            SELECT block_name AS holiday_name,
-                   year_label,
-                   block_start,
-                   block_end,
-                   (block_end - block_start + 1) AS days_total,
-                   offset_days,
-                   partners
-            FROM slots
-            ORDER BY block_name, year_label, offset_days
-            """
+              SELECT i::int, p
+              FROM unnest(hb.after_partners) WITH ORDINALITY AS u(p, i) WHERE i <= %s
+            ) s
+            {where}
+            ORDER BY holiday_name, year_label, offset_days
+            """,
+            args,
         )
         return [dict(r) for r in cur.fetchall()]
 
     def bridge_days(self, cur):
         cur.execute(
             """
-            WITH bounds AS (SELECT MIN(date) AS dmin, MAX(date) AS dmax FROM transactions),
-            days AS (
-              SELECT generate_series(b.dmin, b.dmax, '1 day'::interval)::date AS d FROM bounds b
-            ),
-            closed AS (
-              SELECT d FROM days
-              WHERE EXTRACT(ISODOW FROM d) = 7
-                 OR d IN (SELECT date FROM holidays WHERE is_official)
-                 OR d IN (SELECT date FROM company_closures WHERE reason IS DISTINCT FROM '__ignored__')
-            ),
-            bridges AS (
-              SELECT d.d AS bridge_date
-              FROM days d
-              WHERE EXTRACT(ISODOW FROM d.d) <> 7
-                AND d.d NOT IN (SELECT date FROM holidays WHERE is_official)
-                AND d.d NOT IN (SELECT date FROM company_closures WHERE reason IS DISTINCT FROM '__ignored__')
-                AND (d.d - INTERVAL '1 day')::date IN (SELECT d FROM closed)
-                AND (d.d + INTERVAL '1 day')::date IN (SELECT d FROM closed)
-            )
-            SELECT b.bridge_date,
-                   COALESCE(COUNT(DISTINCT t.cnp), 0) AS partners,
-                   COALESCE(COUNT(t.document_id), 0) AS transactions
-            FROM bridges b
-            LEFT JOIN transactions t ON t.date = b.bridge_date
-            GROUP BY b.bridge_date
-            ORDER BY b.bridge_date
+            SELECT date AS bridge_date, partners, tx_count AS transactions
+            FROM calendar_days
+            WHERE is_bridge
+              AND date BETWEEN (SELECT MIN(date) FROM calendar_days WHERE tx_count > 0)
+                           AND (SELECT MAX(date) FROM calendar_days WHERE tx_count > 0)
+            ORDER BY date
             """
         )
         return [dict(r) for r in cur.fetchall()]
@@ -334,15 +257,16 @@ class handler(BaseHTTPRequestHandler):
     def illegal_workdays(self, cur):
         cur.execute(
             """
-            SELECT t.date,
-                   STRING_AGG(DISTINCT h.name, ', ') AS holiday_names,
-                   COUNT(*) AS tx_count,
-                   COUNT(DISTINCT t.cnp) AS partners,
+            SELECT c.date,
+                   c.holiday_names,
+                   c.tx_count,
+                   c.partners,
                    ROUND(SUM(t.gross_value)::numeric, 2) AS ron
-            FROM transactions t
-            JOIN holidays h ON h.date = t.date AND h.is_official = true
-            GROUP BY t.date
-            ORDER BY t.date
+            FROM calendar_days c
+            JOIN transaction_facts t ON t.date = c.date
+            WHERE c.is_official_holiday AND c.tx_count > 0
+            GROUP BY c.date, c.holiday_names, c.tx_count, c.partners
+            ORDER BY c.date
             """
         )
         return [dict(r) for r in cur.fetchall()]
@@ -354,6 +278,7 @@ class handler(BaseHTTPRequestHandler):
             query_type = params.get('type', [''])[0]
 
             conn = get_db()
+            querylog.start(querylog.label(self.path), conn)
             cur = conn.cursor()
 
             if query_type == 'ping':
@@ -380,8 +305,9 @@ class handler(BaseHTTPRequestHandler):
                 else:
                     result = self.working_days(cur, df, dt)
             elif query_type == 'holiday_effect':
-                win = params.get('window', ['3'])[0]
-                result = {'holiday_effect': self.holiday_effect(cur, win)}
+                win = max(1, min(int(params.get('window', ['3'])[0] or 3), HOLIDAY_MAX_WINDOW))
+                year = params.get('year', [None])[0]
+                result = {'holiday_effect': self.holiday_effect(cur, win, year), 'window': win}
             elif query_type == 'bridge_days':
                 result = {'bridge_days': self.bridge_days(cur)}
             elif query_type == 'illegal_workdays':
@@ -389,8 +315,8 @@ class handler(BaseHTTPRequestHandler):
             else:
                 result = {'error': 'Unknown query type', 'got': query_type}
 
-            conn.close()
             self._send(200, result)
+            conn.close()
         except Exception as e:
             self._send(500, {'error': str(e)})
 
@@ -405,6 +331,7 @@ class handler(BaseHTTPRequestHandler):
             data = json.loads(body) if body else {}
 
             conn = get_db()
+            querylog.start(querylog.label(self.path), conn)
             cur = conn.cursor()
 
             if action in ('confirm_closure', 'ignore_closure'):
@@ -422,12 +349,14 @@ class handler(BaseHTTPRequestHandler):
                     """,
                     (df, dt, reason),
                 )
+                cur.execute("SELECT refresh_calendar_days(EXTRACT(YEAR FROM %s::date)::int, EXTRACT(YEAR FROM %s::date)::int)", (df, dt))
+                cur.execute("SELECT refresh_holiday_blocks(NULL, NULL)")
                 conn.commit()
                 result = {'ok': True, 'action': action, 'date_from': df, 'date_to': dt}
             else:
                 result = {'error': 'Unknown action', 'got': action}
 
-            conn.close()
             self._send(200, result)
+            conn.close()
         except Exception as e:
             self._send(500, {'error': str(e)})
@@ -4,28 +4,25 @@ Ez a régi API formátumot tartja a dashboard kompatibilitás érdekében
 GET /api/data - Éves és havi összefoglalók
 """
 from http.server import BaseHTTPRequestHandler
-import json
 import os
+import sys
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _lib import querylog, serialize, sketches
 
 def get_db():
     # Try multiple environment variable names
     db_url = os.environ.get('POSTGRES_URL') or os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL_NO_SSL')
     if not db_url:
         raise Exception("No database URL configured")
-    return psycopg2.connect(db_url, cursor_factory=RealDictCursor)
-
-def decimal_default(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    raise TypeError
+    return psycopg2.connect(db_url, cursor_factory=querylog.TimedCursor)
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         try:
             conn = get_db()
+            querylog.start(querylog.label(self.path), conn)
             cur = conn.cursor()
 
             result = {'years': {}}
@@ -66,7 +63,6 @@ class handler(BaseHTTPRequestHandler):
                        EXTRACT(MONTH FROM date)::int as month,
                        COUNT(*) as transactions,
                        COUNT(DISTINCT date) as working_days,
-                       COUNT(DISTINCT cnp) as unique_partners,
                        COALESCE(SUM(gross_value), 0) as total_value,
                        COALESCE(SUM(net_paid), 0) as total_paid,
                        MIN(date) as first_day,
@@ -76,6 +72,8 @@ class handler(BaseHTTPRequestHandler):
                 ORDER BY year, month
             """)
             monthly = cur.fetchall()
+            # Exact per-month distinct partners from partner_sketches
+            partners_by_month = sketches.partners_per_month(cur)
 
             # Month names in Romanian
             month_names = {
@@ -109,6 +107,10 @@ class handler(BaseHTTPRequestHandler):
                 """, (m['year'], m['month']))
                 worst = cur.fetchone()
 
+                unique_partners = partners_by_month.get((m['year'], m['month']))
+                if unique_partners is None:
+                    unique_partners = sketches.distinct_partners(cur, m['first_day'].replace(day=1), m['last_day'])
+
                 result['years'][year]['months'][month] = {
                     'period': f"{month_names[m['month']]} {m['year']}",
                     'summary': {
@@ -116,7 +118,7 @@ class handler(BaseHTTPRequestHandler):
                         'total_paid': float(m['total_paid']),
                         'transactions': m['transactions'],
                         'working_days': m['working_days'],
-                        'unique_partners': m['unique_partners'],
+                        'unique_partners': unique_partners,
                         'avg_per_day': float(m['total_value']) / m['working_days'] if m['working_days'] > 0 else 0,
                         'avg_per_trans': float(m['total_value']) / m['transactions'] if m['transactions'] > 0 else 0,
                         'best_day': {
@@ -175,16 +177,10 @@ class handler(BaseHTTPRequestHandler):
                     result['years'][year]['total_by_category'][c['category']] = float(c['total_kg'])
 
             cur.close()
+            timing = querylog.finish()
             conn.close()
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result, default=decimal_default, ensure_ascii=False).encode('utf-8'))
+            serialize.send_json(self, 200, result, timing)
 
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode())
+            serialize.send_json(self, 500, {'error': str(e)}, querylog.finish())
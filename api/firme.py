@@ -10,26 +10,34 @@ Endpoints:
   GET /api/firme?type=deseuri&year=2024 - Sumar deseuri
   GET /api/firme?type=top - Top firme
   GET /api/firme?type=transporturi - Transporturi
+  GET /api/firme?type=profile&dim=sofer|transportator|country|firma|deseu&value=X&year=2024 - Profil generic
   GET /api/firme?type=yearly - Comparatie anuala
 """
 from http.server import BaseHTTPRequestHandler
-import json
 import os
+import sys
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from urllib.parse import urlparse, parse_qs
-from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _lib import columnar, querylog, serialize
+
+# Profile dimensions: name -> (vanzari column to match, label column, key in breakdown rows)
+PROFILE_DIMS = {
+    'sofer': ('nume_sofer', 'nume_sofer', 'sofer'),
+    'transportator': ('transportator', 'transportator', 'transportator'),
+    'country': ('tara_destinatie', 'tara_destinatie', 'tara'),
+    'firma': ('firma_id', 'firma_name', 'firma'),
+    'deseu': ('tip_deseu', 'tip_deseu', 'tip_deseu'),
+}
+
+MONTH_NAMES = ['', 'Ian', 'Feb', 'Mar', 'Apr', 'Mai', 'Iun', 'Iul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
 
 def get_db():
     db_url = os.environ.get('POSTGRES_URL') or os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL_NO_SSL')
     if not db_url:
         raise Exception("No database URL configured")
-    return psycopg2.connect(db_url, cursor_factory=RealDictCursor)
-
-def decimal_default(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    raise TypeError
+    return psycopg2.connect(db_url, cursor_factory=querylog.TimedCursor)
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -38,6 +46,7 @@ class handler(BaseHTTPRequestHandler):
             params = parse_qs(parsed.query)
 
             conn = get_db()
+            querylog.start(querylog.label(self.path), conn)
             cur = conn.cursor()
 
             query_type = params.get('type', ['overview'])[0]
@@ -73,82 +82,71 @@ class handler(BaseHTTPRequestHandler):
             elif query_type == 'transporturi':
                 year = params.get('year', [None])[0]
                 result = self.get_transporturi(cur, year)
+            elif query_type == 'profile':
+                dim = params.get('dim', [None])[0]
+                value = params.get('value', [None])[0]
+                year = params.get('year', [None])[0]
+                result = self.get_profile(cur, dim, value, year)
             elif query_type == 'sofer_profile':
                 sofer = params.get('sofer', [None])[0]
-                result = self.get_sofer_profile(cur, sofer)
+                year = params.get('year', [None])[0]
+                result = self.get_sofer_profile(cur, sofer, year)
             elif query_type == 'transportator_profile':
                 transportator = params.get('transportator', [None])[0]
-                result = self.get_transportator_profile(cur, transportator)
+                year = params.get('year', [None])[0]
+                result = self.get_transportator_profile(cur, transportator, year)
             elif query_type == 'country_profile':
                 country = params.get('country', [None])[0]
-                result = self.get_country_profile(cur, country)
+                year = params.get('year', [None])[0]
+                result = self.get_country_profile(cur, country, year)
             elif query_type == 'yearly':
                 result = self.get_yearly_comparison(cur)
             else:
                 result = {
                     'error': 'Unknown query type',
-                    'available': ['overview', 'list', 'firma', 'vanzari', 'monthly', 'deseuri', 'top', 'transporturi', 'yearly']
+                    'available': ['overview', 'list', 'firma', 'vanzari', 'monthly', 'deseuri', 'top', 'transporturi', 'profile', 'yearly']
                 }
 
             cur.close()
+            timing = querylog.finish()
             conn.close()
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result, default=decimal_default, ensure_ascii=False).encode('utf-8'))
+            serialize.send_json(self, 200, result, timing)
 
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode())
+            serialize.send_json(self, 500, {'error': str(e)}, querylog.finish())
 
     def get_overview(self, cur, year=None):
         """Get overall B2B business overview"""
-        # Total stats
-        if year:
-            cur.execute("""
-                SELECT COUNT(*) as total_vanzari,
-                       COUNT(DISTINCT firma_id) as firme_active,
-                       COALESCE(SUM(valoare_ron), 0) as total_valoare,
-                       COALESCE(SUM(adaos_final), 0) as total_profit,
-                       COALESCE(SUM(cantitate_receptionata), 0) as total_kg,
-                       MIN(data) as first_date,
-                       MAX(data) as last_date
-                FROM vanzari
-                WHERE year = %s
-            """, (int(year),))
-        else:
-            cur.execute("""
-                SELECT COUNT(*) as total_vanzari,
-                       COUNT(DISTINCT firma_id) as firme_active,
-                       COALESCE(SUM(valoare_ron), 0) as total_valoare,
-                       COALESCE(SUM(adaos_final), 0) as total_profit,
-                       COALESCE(SUM(cantitate_receptionata), 0) as total_kg,
-                       MIN(data) as first_date,
-                       MAX(data) as last_date
-                FROM vanzari
-            """)
-        totals = cur.fetchone()
-
-        # Total firme
-        cur.execute("SELECT COUNT(*) as count FROM firme")
-        total_firme = cur.fetchone()['count']
-
-        # By year
+        # Total stats + by year from the sumar_firme rollup
         cur.execute("""
             SELECT year,
-                   COUNT(*) as vanzari,
+                   SUM(nr_vanzari)::int as vanzari,
                    COALESCE(SUM(valoare_ron), 0) as valoare,
                    COALESCE(SUM(adaos_final), 0) as profit,
-                   COALESCE(SUM(cantitate_receptionata), 0) as kg
-            FROM vanzari
+                   COALESCE(SUM(cantitate_receptionata), 0) as kg,
+                   array_agg(DISTINCT firma_id) FILTER (WHERE firma_id IS NOT NULL) as firme,
+                   MIN(first_sale) as first_date,
+                   MAX(last_sale) as last_date
+            FROM sumar_firme
             GROUP BY year
             ORDER BY year
         """)
         by_year = cur.fetchall()
+        selected = [y for y in by_year if not year or y['year'] == int(year)]
+        totals = {
+            'total_vanzari': sum(y['vanzari'] for y in selected),
+            'firme_active': len(set().union(*(y['firme'] or [] for y in selected))),
+            'total_valoare': sum(y['valoare'] for y in selected),
+            'total_profit': sum(y['profit'] for y in selected),
+            'total_kg': sum(y['kg'] for y in selected),
+            'first_date': min((y['first_date'] for y in selected), default=None),
+            'last_date': max((y['last_date'] for y in selected), default=None),
+        }
+
+        # Total firme
+        cur.execute("SELECT COUNT(*) as count FROM firme")
+        total_firme = cur.fetchone()['count']
 
         # Recent month
         cur.execute("""
@@ -192,20 +190,20 @@ class handler(BaseHTTPRequestHandler):
         """Get list of all companies with stats, optionally filtered by year"""
         query = """
             SELECT f.id, f.name,
-                   COUNT(v.id) as nr_vanzari,
-                   COALESCE(SUM(v.valoare_ron), 0) as total_valoare,
-                   COALESCE(SUM(v.adaos_final), 0) as total_profit,
-                   COALESCE(SUM(v.cantitate_receptionata), 0) as total_kg,
-                   MIN(v.data) as first_sale,
-                   MAX(v.data) as last_sale
+                   COALESCE(SUM(s.nr_vanzari), 0)::int as nr_vanzari,
+                   COALESCE(SUM(s.valoare_ron), 0) as total_valoare,
+                   COALESCE(SUM(s.adaos_final), 0) as total_profit,
+                   COALESCE(SUM(s.cantitate_receptionata), 0) as total_kg,
+                   MIN(s.first_sale) as first_sale,
+                   MAX(s.last_sale) as last_sale
             FROM firme f
-            LEFT JOIN vanzari v ON f.id = v.firma_id
+            JOIN sumar_firme s ON f.id = s.firma_id
         """
         conditions = []
         params = []
 
         if year:
-            conditions.append("v.year = %s")
+            conditions.append("s.year = %s")
             params.append(int(year))
 
         if search:
@@ -215,7 +213,7 @@ class handler(BaseHTTPRequestHandler):
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
 
-        query += " GROUP BY f.id, f.name HAVING COUNT(v.id) > 0 ORDER BY total_valoare DESC"
+        query += " GROUP BY f.id, f.name HAVING SUM(s.nr_vanzari) > 0 ORDER BY total_valoare DESC"
 
         cur.execute(query, params)
         firme = cur.fetchall()
@@ -241,37 +239,30 @@ class handler(BaseHTTPRequestHandler):
             return {'error': 'firma_id required'}
 
         # Basic info
-        cur.execute("""
-            SELECT f.*,
-                   COUNT(v.id) as nr_vanzari,
-                   COALESCE(SUM(v.valoare_ron), 0) as total_valoare,
-                   COALESCE(SUM(v.adaos_final), 0) as total_profit,
-                   COALESCE(SUM(v.cantitate_receptionata), 0) as total_kg,
-                   MIN(v.data) as first_sale,
-                   MAX(v.data) as last_sale
-            FROM firme f
-            LEFT JOIN vanzari v ON f.id = v.firma_id
-            WHERE f.id = %s
-            GROUP BY f.id
-        """, (firma_id,))
+        cur.execute("SELECT id, name FROM firme WHERE id = %s", (firma_id,))
         firma = cur.fetchone()
 
         if not firma:
             return {'error': 'Firma not found'}
 
-        # Monthly breakdown
+        # Monthly breakdown (sumar_firme rollup); totals are its sums
         cur.execute("""
-            SELECT year, month,
-                   COUNT(*) as nr_vanzari,
-                   COALESCE(SUM(valoare_ron), 0) as valoare,
-                   COALESCE(SUM(adaos_final), 0) as profit,
-                   COALESCE(SUM(cantitate_receptionata), 0) as kg
-            FROM vanzari
-            WHERE firma_id = %s
-            GROUP BY year, month
+            SELECT year, month, nr_vanzari, first_sale, last_sale,
+                   valoare_ron as valoare,
+                   adaos_final as profit,
+                   cantitate_receptionata as kg
+            FROM sumar_firme
+            WHERE firma_id = %s AND nr_vanzari > 0
             ORDER BY year, month
         """, (firma_id,))
         monthly = cur.fetchall()
+        firma = dict(firma,
+                     nr_vanzari=sum(m['nr_vanzari'] for m in monthly),
+                     total_valoare=sum(m['valoare'] for m in monthly),
+                     total_profit=sum(m['profit'] for m in monthly),
+                     total_kg=sum(m['kg'] for m in monthly),
+                     first_sale=monthly[0]['first_sale'] if monthly else None,
+                     last_sale=monthly[-1]['last_sale'] if monthly else None)
 
         # Recent vanzari
         cur.execute("""
@@ -362,12 +353,12 @@ class handler(BaseHTTPRequestHandler):
         """Get monthly summary"""
         query = """
             SELECT year, month,
-                   COUNT(*) as nr_vanzari,
-                   COUNT(DISTINCT firma_id) as nr_firme,
+                   SUM(nr_vanzari)::int as nr_vanzari,
+                   COUNT(firma_id) as nr_firme,
                    COALESCE(SUM(valoare_ron), 0) as total_valoare,
                    COALESCE(SUM(adaos_final), 0) as total_profit,
                    COALESCE(SUM(cantitate_receptionata), 0) as total_kg
-            FROM vanzari
+            FROM sumar_firme
         """
         params = []
         if year:
@@ -489,32 +480,26 @@ class handler(BaseHTTPRequestHandler):
         """Get top companies by value"""
         query = """
             SELECT f.id, f.name,
-                   COUNT(v.id) as nr_vanzari,
-                   COALESCE(SUM(v.valoare_ron), 0) as total_valoare,
-                   COALESCE(SUM(v.adaos_final), 0) as total_profit,
-                   COALESCE(SUM(v.cantitate_receptionata), 0) as total_kg
+                   SUM(s.nr_vanzari)::int as nr_vanzari,
+                   COALESCE(SUM(s.valoare_ron), 0) as total_valoare,
+                   COALESCE(SUM(s.adaos_final), 0) as total_profit,
+                   COALESCE(SUM(s.cantitate_receptionata), 0) as total_kg
             FROM firme f
-            JOIN vanzari v ON f.id = v.firma_id
+            JOIN sumar_firme s ON f.id = s.firma_id
         """
         params = []
         if year:
-            query += " WHERE v.year = %s"
+            query += " WHERE s.year = %s"
             params.append(int(year))
 
-        query += f" GROUP BY f.id, f.name ORDER BY total_valoare DESC LIMIT {limit}"
+        query += " GROUP BY f.id, f.name"
 
+        # One row per firma - rank the three tops in Python
         cur.execute(query, params)
-        top = cur.fetchall()
-
-        # Also get top by profit
-        query2 = query.replace('ORDER BY total_valoare', 'ORDER BY total_profit')
-        cur.execute(query2, params)
-        top_profit = cur.fetchall()
-
-        # Top by kg
-        query3 = query.replace('ORDER BY total_valoare', 'ORDER BY total_kg')
-        cur.execute(query3, params)
-        top_kg = cur.fetchall()
+        firme = cur.fetchall()
+        top = sorted(firme, key=lambda f: f['total_valoare'], reverse=True)[:limit]
+        top_profit = sorted(firme, key=lambda f: f['total_profit'], reverse=True)[:limit]
+        top_kg = sorted(firme, key=lambda f: f['total_kg'], reverse=True)[:limit]
 
         def format_firma(f):
             return {
@@ -535,60 +520,44 @@ class handler(BaseHTTPRequestHandler):
 
     def get_transporturi(self, cur, year=None):
         """Get transport costs from vanzari table (transport_ron column)"""
-        # Monthly summary from vanzari.transport_ron
-        query = """
-            SELECT year, month,
-                   COUNT(*) as nr_vanzari,
-                   COUNT(transport_ron) as nr_with_transport,
-                   COALESCE(SUM(transport_ron), 0) as transport_total,
-                   COALESCE(SUM(valoare_ron), 0) as valoare_total
-            FROM vanzari
-        """
-        params = []
-        if year:
-            query += " WHERE year = %s"
-            params.append(int(year))
-        query += " GROUP BY year, month ORDER BY year, month"
-
-        cur.execute(query, params)
-        monthly = cur.fetchall()
-
-        # Yearly summary
-        year_query = """
-            SELECT year,
-                   COUNT(*) as nr_vanzari,
-                   COUNT(transport_ron) as nr_with_transport,
-                   COALESCE(SUM(transport_ron), 0) as transport_total,
-                   COALESCE(SUM(valoare_ron), 0) as valoare_total
-            FROM vanzari
-        """
-        year_params = []
-        if year:
-            year_query += " WHERE year = %s"
-            year_params.append(int(year))
-        year_query += " GROUP BY year ORDER BY year"
-
-        cur.execute(year_query, year_params)
-        by_year = cur.fetchall()
-
-        # By firma (top transporters)
-        firma_query = """
-            SELECT f.name as firma_name,
-                   COUNT(*) as nr_vanzari,
-                   COALESCE(SUM(v.transport_ron), 0) as transport_total,
-                   COALESCE(SUM(v.valoare_ron), 0) as valoare_total
-            FROM vanzari v
-            JOIN firme f ON v.firma_id = f.id
-            WHERE v.transport_ron > 0
-        """
-        firma_params = []
-        if year:
-            firma_query += " AND v.year = %s"
-            firma_params.append(int(year))
-        firma_query += " GROUP BY f.name ORDER BY transport_total DESC LIMIT 20"
-
-        cur.execute(firma_query, firma_params)
-        by_firma = cur.fetchall()
+        snap = columnar.snapshot(cur)
+        idx = snap.where(year=int(year)) if year else range(snap.n)
+        years, transport = snap.cols['year'], snap.cols['transport_ron']
+        detail_year = int(year) if year else self._transport_details_year(snap)
+        in_detail_year = lambda i: years[i] == detail_year
+
+        totals = {
+            'nr_vanzari': ('count', None),
+            'nr_with_transport': ('count', 'transport_ron'),
+            'transport_total': ('sum', 'transport_ron'),
+            'valoare_total': ('sum', 'valoare_ron'),
+        }
+        trips = {
+            'fuvarok': ('count', None),
+            'transport_total': ('sum', 'transport_ron'),
+            'kg_total': ('sum', 'cantitate_livrata'),
+        }
+        # Whole dashboard in one pass: monthly / yearly / per firma totals plus
+        # the driver / vehicle / country details of detail_year
+        g = snap.aggregate(idx, {
+            'monthly': (('year', 'month'), totals),
+            'by_year': ('year', totals),
+            'by_firma': ('firma_name', {k: totals[k] for k in ('nr_vanzari', 'transport_total', 'valoare_total')},
+                         False, lambda i: transport[i] > 0),   # only sales with transport cost
+            'by_country': ('tara_destinatie', trips, False, in_detail_year),
+            'by_transporter': ('transportator', trips, False, in_detail_year),
+            'by_driver': ('nume_sofer', trips, False, in_detail_year),
+            # Unique counts (NULLs skipped like COUNT DISTINCT)
+            'unique': (None, {
+                'vehicles': ('distinct', 'numar_auto'),
+                'drivers': ('distinct', 'nume_sofer'),
+                'countries': ('distinct', 'tara_destinatie'),
+                'transporters': ('distinct', 'transportator'),
+            }, False, in_detail_year),
+        })
+        monthly = sorted(g['monthly'], key=lambda m: (m['year'], m['month']))
+        by_year = sorted(g['by_year'], key=lambda y: y['year'])
+        by_firma = columnar.order(g['by_firma'], 'transport_total', limit=20)
 
         # Calculate totals
         total_transport = sum(float(m['transport_total'] or 0) for m in monthly)
@@ -597,8 +566,7 @@ class handler(BaseHTTPRequestHandler):
         total_with_transport = sum(m['nr_with_transport'] for m in monthly)
 
         # Get available years
-        cur.execute("SELECT DISTINCT year FROM vanzari ORDER BY year")
-        available_years = [r['year'] for r in cur.fetchall()]
+        available_years = sorted(set(snap.cols['year']))
 
         month_names = ['', 'Ian', 'Feb', 'Mar', 'Apr', 'Mai', 'Iun',
                        'Iul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
@@ -637,414 +605,222 @@ class handler(BaseHTTPRequestHandler):
                 'valoare_total': float(m['valoare_total']) if m['valoare_total'] else 0,
                 'transport_percent': round(float(m['transport_total'] or 0) / float(m['valoare_total']) * 100, 2) if m['valoare_total'] else 0
             } for m in monthly],
-            'details_2024': self._get_transport_details_2024(cur, year)
+            'details': self._transport_details(g, detail_year)
         }
 
-    def _get_transport_details_2024(self, cur, year_filter):
-        """Get detailed transport stats (drivers, vehicles, countries) - only 2024 has data"""
-        # By country
-        cur.execute("""
-            SELECT tara_destinatie, COUNT(*) as fuvarok,
-                   COALESCE(SUM(transport_ron), 0) as transport_total,
-                   COALESCE(SUM(cantitate_livrata), 0) as kg_total
-            FROM vanzari
-            WHERE year = 2024 AND tara_destinatie IS NOT NULL
-            GROUP BY tara_destinatie
-            ORDER BY fuvarok DESC
-        """)
-        by_country = [{
-            'tara': r['tara_destinatie'],
-            'fuvarok': r['fuvarok'],
-            'transport_ron': float(r['transport_total']) if r['transport_total'] else 0,
-            'kg_total': float(r['kg_total']) if r['kg_total'] else 0
-        } for r in cur.fetchall()]
-
-        # By transporter company
-        cur.execute("""
-            SELECT transportator, COUNT(*) as fuvarok,
-                   COALESCE(SUM(transport_ron), 0) as transport_total,
-                   COALESCE(SUM(cantitate_livrata), 0) as kg_total
-            FROM vanzari
-            WHERE year = 2024 AND transportator IS NOT NULL
-            GROUP BY transportator
-            ORDER BY fuvarok DESC
-        """)
-        by_transporter = [{
-            'transportator': r['transportator'],
-            'fuvarok': r['fuvarok'],
-            'transport_ron': float(r['transport_total']) if r['transport_total'] else 0,
-            'kg_total': float(r['kg_total']) if r['kg_total'] else 0
-        } for r in cur.fetchall()]
-
-        # By driver (top 15)
-        cur.execute("""
-            SELECT nume_sofer, COUNT(*) as fuvarok,
-                   COALESCE(SUM(transport_ron), 0) as transport_total,
-                   COALESCE(SUM(cantitate_livrata), 0) as kg_total
-            FROM vanzari
-            WHERE year = 2024 AND nume_sofer IS NOT NULL
-            GROUP BY nume_sofer
-            ORDER BY fuvarok DESC
-            LIMIT 15
-        """)
-        by_driver = [{
-            'sofer': r['nume_sofer'],
-            'fuvarok': r['fuvarok'],
-            'transport_ron': float(r['transport_total']) if r['transport_total'] else 0,
-            'kg_total': float(r['kg_total']) if r['kg_total'] else 0
-        } for r in cur.fetchall()]
-
-        # Unique counts
-        cur.execute("SELECT COUNT(DISTINCT numar_auto) as cnt FROM vanzari WHERE year = 2024 AND numar_auto IS NOT NULL")
-        unique_vehicles = cur.fetchone()['cnt']
-
-        cur.execute("SELECT COUNT(DISTINCT nume_sofer) as cnt FROM vanzari WHERE year = 2024 AND nume_sofer IS NOT NULL")
-        unique_drivers = cur.fetchone()['cnt']
-
-        cur.execute("SELECT COUNT(DISTINCT tara_destinatie) as cnt FROM vanzari WHERE year = 2024 AND tara_destinatie IS NOT NULL")
-        unique_countries = cur.fetchone()['cnt']
-
-        cur.execute("SELECT COUNT(DISTINCT transportator) as cnt FROM vanzari WHERE year = 2024 AND transportator IS NOT NULL")
-        unique_transporters = cur.fetchone()['cnt']
-
+    def _transport_details_year(self, snap):
+        """Latest year with driver / vehicle / destination data (older imports lack it)."""
+        cols = [snap.cols[c] for c in ('nume_sofer', 'numar_auto', 'tara_destinatie', 'transportator')]
+        years = snap.cols['year']
+        return max((years[i] for i in range(snap.n) if any(c[i] != columnar.NULL for c in cols)), default=None)
+
+    def _transport_details(self, r, detail_year):
+        """Detailed transport stats (drivers, vehicles, countries) for detail_year"""
+        def fmt(rows, column, key, limit=None):
+            return [{
+                key: row[column],
+                'fuvarok': row['fuvarok'],
+                'transport_ron': float(row['transport_total']) if row['transport_total'] else 0,
+                'kg_total': float(row['kg_total']) if row['kg_total'] else 0
+            } for row in columnar.order(rows, 'fuvarok', limit=limit)]
+
+        unique = r['unique'][0]
         return {
-            'has_details': True,
-            'year': 2024,
-            'unique_vehicles': unique_vehicles,
-            'unique_drivers': unique_drivers,
-            'unique_countries': unique_countries,
-            'unique_transporters': unique_transporters,
-            'by_country': by_country,
-            'by_transporter': by_transporter,
-            'by_driver': by_driver
+            'has_details': any(unique.values()),
+            'year': detail_year,
+            'unique_vehicles': unique['vehicles'],
+            'unique_drivers': unique['drivers'],
+            'unique_countries': unique['countries'],
+            'unique_transporters': unique['transporters'],
+            'by_country': fmt(r['by_country'], 'tara_destinatie', 'tara'),
+            'by_transporter': fmt(r['by_transporter'], 'transportator', 'transportator'),
+            'by_driver': fmt(r['by_driver'], 'nume_sofer', 'sofer', limit=15),   # top 15
         }
 
-    def get_sofer_profile(self, cur, sofer_name):
+    def get_profile(self, cur, dim, value, year=None):
+        """Generic profile for one driver / transporter / country / firma / waste type."""
+        if dim not in PROFILE_DIMS:
+            return {'error': 'Unknown profile dimension', 'available': list(PROFILE_DIMS)}
+        if not value:
+            return {'error': 'Profile value required'}
+        return self._profile(cur, dim, value, year)[2]
+
+    def _profile(self, cur, dim, value, year=None):
+        """Summary, monthly for `year` (default: the entity's latest year), yearly totals
+        and a breakdown by every other dimension - one pass over its vanzari rows.
+        Returns (snapshot, row indexes, result)."""
+        column = PROFILE_DIMS[dim][0]
+        if column == 'firma_id':
+            value = int(value)
+
+        snap = columnar.snapshot(cur)
+        idx = snap.where(**{column: value})
+        measures = {
+            'fuvarok': ('count', None),
+            'kg': ('sum', 'cantitate_livrata'),
+            'valoare': ('sum', 'valoare_ron'),
+            'profit': ('sum', 'adaos_final'),
+            'transport': ('sum', 'transport_ron'),
+        }
+        summary = dict(measures, first_trip=('min', 'data'), last_trip=('max', 'data'),
+                       vehicule=('distinct', 'numar_auto'))
+        groupings = {
+            'summary': (None, summary),
+            'monthly': (('year', 'month'), measures),
+        }
+        for other, (filter_col, label_col, _) in PROFILE_DIMS.items():
+            if other != dim:
+                summary[other] = ('distinct', filter_col)
+                groupings[other] = (label_col, measures, True)
+        r = snap.aggregate(idx, groupings)
+
+        available_years = sorted({m['year'] for m in r['monthly']})
+        year = int(year) if year else (available_years[-1] if available_years else None)
+        s = r['summary'][0]
+        for key in ('first_trip', 'last_trip'):
+            s[key] = str(s[key]) if s[key] else None
+
+        by_year = {}
+        for m in r['monthly']:
+            y = by_year.setdefault(m['year'], dict.fromkeys(measures, 0))
+            for key in measures:
+                y[key] += m[key]
+
+        result = {
+            'dim': dim,
+            'value': value,
+            'year': year,
+            'available_years': available_years,
+            'summary': s,
+            'monthly': [dict(m, month_name=MONTH_NAMES[m['month']])
+                        for m in sorted(r['monthly'], key=lambda m: m['month']) if m['year'] == year],
+            'by_year': [{'year': y, **{k: round(v, 2) for k, v in by_year[y].items()}} for y in available_years],
+        }
+        for other, (_, label_col, out_key) in PROFILE_DIMS.items():
+            if other != dim:
+                rows = columnar.order(r[other], 'kg' if other == 'deseu' else 'fuvarok')
+                result['by_' + other] = [{out_key: row[label_col], **{k: v for k, v in row.items() if k != label_col}}
+                                         for row in rows]
+        return snap, idx, result
+
+    def get_sofer_profile(self, cur, sofer_name, year=None):
         """Get detailed driver profile with all trips"""
         if not sofer_name:
             return {'error': 'Sofer name required'}
 
-        # Summary stats
-        cur.execute("""
-            SELECT
-                COUNT(*) as total_fuvarok,
-                COALESCE(SUM(cantitate_livrata), 0) as total_kg,
-                COALESCE(SUM(valoare_ron), 0) as total_valoare,
-                COALESCE(SUM(adaos_final), 0) as total_profit,
-                COALESCE(SUM(transport_ron), 0) as total_transport,
-                COUNT(DISTINCT numar_auto) as vehicule_used,
-                COUNT(DISTINCT tara_destinatie) as tari_vizitate,
-                COUNT(DISTINCT transportator) as transportatori,
-                MIN(data) as first_trip,
-                MAX(data) as last_trip
-            FROM vanzari
-            WHERE nume_sofer = %s
-        """, (sofer_name,))
-        summary = cur.fetchone()
-
-        # Monthly breakdown
-        cur.execute("""
-            SELECT month,
-                   COUNT(*) as fuvarok,
-                   COALESCE(SUM(cantitate_livrata), 0) as kg,
-                   COALESCE(SUM(valoare_ron), 0) as valoare,
-                   COALESCE(SUM(adaos_final), 0) as profit
-            FROM vanzari
-            WHERE nume_sofer = %s AND year = 2024
-            GROUP BY month
-            ORDER BY month
-        """, (sofer_name,))
-        monthly = cur.fetchall()
-
-        # By country
-        cur.execute("""
-            SELECT tara_destinatie,
-                   COUNT(*) as fuvarok,
-                   COALESCE(SUM(cantitate_livrata), 0) as kg
-            FROM vanzari
-            WHERE nume_sofer = %s AND tara_destinatie IS NOT NULL
-            GROUP BY tara_destinatie
-            ORDER BY fuvarok DESC
-        """, (sofer_name,))
-        by_country = cur.fetchall()
-
-        # By transporter
-        cur.execute("""
-            SELECT transportator,
-                   COUNT(*) as fuvarok
-            FROM vanzari
-            WHERE nume_sofer = %s AND transportator IS NOT NULL
-            GROUP BY transportator
-            ORDER BY fuvarok DESC
-        """, (sofer_name,))
-        by_transporter = cur.fetchall()
-
-        # By waste type (tip_deseu)
-        cur.execute("""
-            SELECT tip_deseu,
-                   COUNT(*) as fuvarok,
-                   COALESCE(SUM(cantitate_livrata), 0) as kg,
-                   COALESCE(SUM(valoare_ron), 0) as valoare,
-                   COALESCE(SUM(adaos_final), 0) as profit
-            FROM vanzari
-            WHERE nume_sofer = %s AND tip_deseu IS NOT NULL AND tip_deseu != ''
-            GROUP BY tip_deseu
-            ORDER BY kg DESC
-        """, (sofer_name,))
-        by_waste = cur.fetchall()
+        snap, idx, p = self._profile(cur, 'sofer', sofer_name, year)
 
         # Recent trips (last 50)
-        cur.execute("""
-            SELECT data, numar_aviz, tip_deseu, tara_destinatie,
-                   cantitate_livrata, valoare_ron, adaos_final, numar_auto, transportator
-            FROM vanzari
-            WHERE nume_sofer = %s
-            ORDER BY data DESC
-            LIMIT 50
-        """, (sofer_name,))
-        trips = cur.fetchall()
-
-        month_names = ['', 'Ian', 'Feb', 'Mar', 'Apr', 'Mai', 'Iun', 'Iul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+        data = snap.cols['data']
+        trips = [snap.row(i, ('data', 'numar_aviz', 'firma_name', 'tip_deseu', 'tara_destinatie', 'cantitate_livrata',
+                              'valoare_ron', 'adaos_final', 'numar_auto', 'transportator'))
+                 for i in sorted(idx, key=lambda i: data[i], reverse=True)[:50]]
 
+        s = p['summary']
         return {
             'sofer': sofer_name,
+            'year': p['year'],
+            'available_years': p['available_years'],
             'summary': {
-                'total_fuvarok': summary['total_fuvarok'],
-                'total_kg': float(summary['total_kg']) if summary['total_kg'] else 0,
-                'total_valoare': float(summary['total_valoare']) if summary['total_valoare'] else 0,
-                'total_profit': float(summary['total_profit']) if summary['total_profit'] else 0,
-                'total_transport': float(summary['total_transport']) if summary['total_transport'] else 0,
-                'vehicule_used': summary['vehicule_used'],
-                'tari_vizitate': summary['tari_vizitate'],
-                'transportatori': summary['transportatori'],
-                'first_trip': str(summary['first_trip']) if summary['first_trip'] else None,
-                'last_trip': str(summary['last_trip']) if summary['last_trip'] else None
+                'total_fuvarok': s['fuvarok'],
+                'total_kg': s['kg'],
+                'total_valoare': s['valoare'],
+                'total_profit': s['profit'],
+                'total_transport': s['transport'],
+                'vehicule_used': s['vehicule'],
+                'tari_vizitate': s['country'],
+                'transportatori': s['transportator'],
+                'first_trip': s['first_trip'],
+                'last_trip': s['last_trip']
             },
-            'monthly': [{
-                'month': m['month'],
-                'month_name': month_names[m['month']],
-                'fuvarok': m['fuvarok'],
-                'kg': float(m['kg']) if m['kg'] else 0,
-                'valoare': float(m['valoare']) if m['valoare'] else 0,
-                'profit': float(m['profit']) if m['profit'] else 0
-            } for m in monthly],
-            'by_country': [{'tara': c['tara_destinatie'], 'fuvarok': c['fuvarok'], 'kg': float(c['kg']) if c['kg'] else 0} for c in by_country],
-            'by_transporter': [{'transportator': t['transportator'], 'fuvarok': t['fuvarok']} for t in by_transporter],
-            'by_waste': [{'tip_deseu': w['tip_deseu'], 'fuvarok': w['fuvarok'], 'kg': float(w['kg']) if w['kg'] else 0, 'valoare': float(w['valoare']) if w['valoare'] else 0, 'profit': float(w['profit']) if w['profit'] else 0} for w in by_waste],
+            'monthly': p['monthly'],
+            'by_year': p['by_year'],
+            'by_country': p['by_country'],
+            'by_transporter': p['by_transportator'],
+            'by_firma': p['by_firma'],
+            'by_waste': p['by_deseu'],
             'trips': [{
                 'data': str(t['data']),
                 'numar_aviz': t['numar_aviz'],
+                'firma': t['firma_name'],
                 'tip_deseu': t['tip_deseu'],
                 'tara': t['tara_destinatie'],
-                'kg': float(t['cantitate_livrata']) if t['cantitate_livrata'] else 0,
-                'valoare': float(t['valoare_ron']) if t['valoare_ron'] else 0,
-                'profit': float(t['adaos_final']) if t['adaos_final'] else 0,
+                'kg': t['cantitate_livrata'] or 0,
+                'valoare': t['valoare_ron'] or 0,
+                'profit': t['adaos_final'] or 0,
                 'numar_auto': t['numar_auto'],
                 'transportator': t['transportator']
             } for t in trips]
         }
 
-    def get_transportator_profile(self, cur, transportator_name):
+    def get_transportator_profile(self, cur, transportator_name, year=None):
         """Get detailed transporter company profile"""
         if not transportator_name:
             return {'error': 'Transportator name required'}
 
-        # Summary stats
-        cur.execute("""
-            SELECT
-                COUNT(*) as total_fuvarok,
-                COALESCE(SUM(cantitate_livrata), 0) as total_kg,
-                COALESCE(SUM(valoare_ron), 0) as total_valoare,
-                COALESCE(SUM(adaos_final), 0) as total_profit,
-                COALESCE(SUM(transport_ron), 0) as total_transport,
-                COUNT(DISTINCT nume_sofer) as soferi_count,
-                COUNT(DISTINCT numar_auto) as vehicule_count,
-                COUNT(DISTINCT tara_destinatie) as tari_count
-            FROM vanzari
-            WHERE transportator = %s
-        """, (transportator_name,))
-        summary = cur.fetchone()
-
-        # Monthly breakdown
-        cur.execute("""
-            SELECT month,
-                   COUNT(*) as fuvarok,
-                   COALESCE(SUM(cantitate_livrata), 0) as kg,
-                   COALESCE(SUM(valoare_ron), 0) as valoare,
-                   COALESCE(SUM(adaos_final), 0) as profit
-            FROM vanzari
-            WHERE transportator = %s AND year = 2024
-            GROUP BY month
-            ORDER BY month
-        """, (transportator_name,))
-        monthly = cur.fetchall()
-
-        # Top drivers for this transporter
-        cur.execute("""
-            SELECT nume_sofer, COUNT(*) as fuvarok, COALESCE(SUM(cantitate_livrata), 0) as kg
-            FROM vanzari
-            WHERE transportator = %s AND nume_sofer IS NOT NULL
-            GROUP BY nume_sofer
-            ORDER BY fuvarok DESC
-            LIMIT 10
-        """, (transportator_name,))
-        top_drivers = cur.fetchall()
-
-        # By country
-        cur.execute("""
-            SELECT tara_destinatie, COUNT(*) as fuvarok, COALESCE(SUM(cantitate_livrata), 0) as kg
-            FROM vanzari
-            WHERE transportator = %s AND tara_destinatie IS NOT NULL
-            GROUP BY tara_destinatie
-            ORDER BY fuvarok DESC
-        """, (transportator_name,))
-        by_country = cur.fetchall()
-
-        # By waste type
-        cur.execute("""
-            SELECT tip_deseu, COUNT(*) as fuvarok,
-                   COALESCE(SUM(cantitate_livrata), 0) as kg,
-                   COALESCE(SUM(valoare_ron), 0) as valoare,
-                   COALESCE(SUM(adaos_final), 0) as profit
-            FROM vanzari
-            WHERE transportator = %s AND tip_deseu IS NOT NULL AND tip_deseu != ''
-            GROUP BY tip_deseu
-            ORDER BY kg DESC
-        """, (transportator_name,))
-        by_waste = cur.fetchall()
-
-        month_names = ['', 'Ian', 'Feb', 'Mar', 'Apr', 'Mai', 'Iun', 'Iul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-
+        _, _, p = self._profile(cur, 'transportator', transportator_name, year)
+        s = p['summary']
         return {
             'transportator': transportator_name,
+            'year': p['year'],
+            'available_years': p['available_years'],
             'summary': {
-                'total_fuvarok': summary['total_fuvarok'],
-                'total_kg': float(summary['total_kg']) if summary['total_kg'] else 0,
-                'total_valoare': float(summary['total_valoare']) if summary['total_valoare'] else 0,
-                'total_profit': float(summary['total_profit']) if summary['total_profit'] else 0,
-                'total_transport': float(summary['total_transport']) if summary['total_transport'] else 0,
-                'nr_soferi': summary['soferi_count'],
-                'vehicule_count': summary['vehicule_count'],
-                'tari_count': summary['tari_count']
+                'total_fuvarok': s['fuvarok'],
+                'total_kg': s['kg'],
+                'total_valoare': s['valoare'],
+                'total_profit': s['profit'],
+                'total_transport': s['transport'],
+                'nr_soferi': s['sofer'],
+                'vehicule_count': s['vehicule'],
+                'tari_count': s['country']
             },
-            'monthly': [{
-                'month': m['month'],
-                'month_name': month_names[m['month']],
-                'fuvarok': m['fuvarok'],
-                'kg': float(m['kg']) if m['kg'] else 0,
-                'valoare': float(m['valoare']) if m['valoare'] else 0,
-                'profit': float(m['profit']) if m['profit'] else 0
-            } for m in monthly],
-            'top_drivers': [{'sofer': d['nume_sofer'], 'fuvarok': d['fuvarok'], 'kg': float(d['kg']) if d['kg'] else 0} for d in top_drivers],
-            'by_country': [{'tara': c['tara_destinatie'], 'fuvarok': c['fuvarok'], 'kg': float(c['kg']) if c['kg'] else 0} for c in by_country],
-            'by_waste': [{'tip_deseu': w['tip_deseu'], 'fuvarok': w['fuvarok'], 'kg': float(w['kg']) if w['kg'] else 0, 'valoare': float(w['valoare']) if w['valoare'] else 0, 'profit': float(w['profit']) if w['profit'] else 0} for w in by_waste]
+            'monthly': p['monthly'],
+            'by_year': p['by_year'],
+            'top_drivers': p['by_sofer'][:10],
+            'by_country': p['by_country'],
+            'by_firma': p['by_firma'],
+            'by_waste': p['by_deseu']
         }
 
-    def get_country_profile(self, cur, country_name):
+    def get_country_profile(self, cur, country_name, year=None):
         """Get detailed country destination profile"""
         if not country_name:
             return {'error': 'Country name required'}
 
-        # Summary stats
-        cur.execute("""
-            SELECT
-                COUNT(*) as total_fuvarok,
-                COALESCE(SUM(cantitate_livrata), 0) as total_kg,
-                COALESCE(SUM(valoare_ron), 0) as total_valoare,
-                COALESCE(SUM(adaos_final), 0) as total_profit,
-                COALESCE(SUM(transport_ron), 0) as total_transport,
-                COUNT(DISTINCT nume_sofer) as soferi_count,
-                COUNT(DISTINCT transportator) as transportatori_count
-            FROM vanzari
-            WHERE tara_destinatie = %s
-        """, (country_name,))
-        summary = cur.fetchone()
-
-        # Monthly breakdown
-        cur.execute("""
-            SELECT month,
-                   COUNT(*) as fuvarok,
-                   COALESCE(SUM(cantitate_livrata), 0) as kg,
-                   COALESCE(SUM(valoare_ron), 0) as valoare,
-                   COALESCE(SUM(adaos_final), 0) as profit
-            FROM vanzari
-            WHERE tara_destinatie = %s AND year = 2024
-            GROUP BY month
-            ORDER BY month
-        """, (country_name,))
-        monthly = cur.fetchall()
-
-        # Top drivers to this country
-        cur.execute("""
-            SELECT nume_sofer, COUNT(*) as fuvarok, COALESCE(SUM(cantitate_livrata), 0) as kg
-            FROM vanzari
-            WHERE tara_destinatie = %s AND nume_sofer IS NOT NULL
-            GROUP BY nume_sofer
-            ORDER BY fuvarok DESC
-            LIMIT 10
-        """, (country_name,))
-        top_drivers = cur.fetchall()
-
-        # By transporter
-        cur.execute("""
-            SELECT transportator, COUNT(*) as fuvarok, COALESCE(SUM(cantitate_livrata), 0) as kg
-            FROM vanzari
-            WHERE tara_destinatie = %s AND transportator IS NOT NULL
-            GROUP BY transportator
-            ORDER BY fuvarok DESC
-        """, (country_name,))
-        by_transporter = cur.fetchall()
-
-        # By waste type
-        cur.execute("""
-            SELECT tip_deseu, COUNT(*) as fuvarok,
-                   COALESCE(SUM(cantitate_livrata), 0) as kg,
-                   COALESCE(SUM(valoare_ron), 0) as valoare,
-                   COALESCE(SUM(adaos_final), 0) as profit
-            FROM vanzari
-            WHERE tara_destinatie = %s AND tip_deseu IS NOT NULL AND tip_deseu != ''
-            GROUP BY tip_deseu
-            ORDER BY kg DESC
-        """, (country_name,))
-        by_waste = cur.fetchall()
-
-        month_names = ['', 'Ian', 'Feb', 'Mar', 'Apr', 'Mai', 'Iun', 'Iul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-
+        _, _, p = self._profile(cur, 'country', country_name, year)
+        s = p['summary']
         return {
             'country': country_name,
+            'year': p['year'],
+            'available_years': p['available_years'],
             'summary': {
-                'total_fuvarok': summary['total_fuvarok'],
-                'total_kg': float(summary['total_kg']) if summary['total_kg'] else 0,
-                'total_valoare': float(summary['total_valoare']) if summary['total_valoare'] else 0,
-                'total_profit': float(summary['total_profit']) if summary['total_profit'] else 0,
-                'total_transport': float(summary['total_transport']) if summary['total_transport'] else 0,
-                'nr_soferi': summary['soferi_count'],
-                'transportatori_count': summary['transportatori_count']
+                'total_fuvarok': s['fuvarok'],
+                'total_kg': s['kg'],
+                'total_valoare': s['valoare'],
+                'total_profit': s['profit'],
+                'total_transport': s['transport'],
+                'nr_soferi': s['sofer'],
+                'transportatori_count': s['transportator']
             },
-            'monthly': [{
-                'month': m['month'],
-                'month_name': month_names[m['month']],
-                'fuvarok': m['fuvarok'],
-                'kg': float(m['kg']) if m['kg'] else 0,
-                'valoare': float(m['valoare']) if m['valoare'] else 0,
-                'profit': float(m['profit']) if m['profit'] else 0
-            } for m in monthly],
-            'top_drivers': [{'sofer': d['nume_sofer'], 'fuvarok': d['fuvarok'], 'kg': float(d['kg']) if d['kg'] else 0} for d in top_drivers],
-            'by_transporter': [{'transportator': t['transportator'], 'fuvarok': t['fuvarok'], 'kg': float(t['kg']) if t['kg'] else 0} for t in by_transporter],
-            'by_waste': [{'tip_deseu': w['tip_deseu'], 'fuvarok': w['fuvarok'], 'kg': float(w['kg']) if w['kg'] else 0, 'valoare': float(w['valoare']) if w['valoare'] else 0, 'profit': float(w['profit']) if w['profit'] else 0} for w in by_waste]
+            'monthly': p['monthly'],
+            'by_year': p['by_year'],
+            'top_drivers': p['by_sofer'][:10],
+            'by_transporter': p['by_transportator'],
+            'by_firma': p['by_firma'],
+            'by_waste': p['by_deseu']
         }
 
     def get_yearly_comparison(self, cur):
         """Get yearly comparison for trends"""
         cur.execute("""
             SELECT year,
-                   COUNT(*) as nr_vanzari,
+                   SUM(nr_vanzari)::int as nr_vanzari,
                    COUNT(DISTINCT firma_id) as nr_firme,
                    COALESCE(SUM(valoare_ron), 0) as total_valoare,
                    COALESCE(SUM(adaos_final), 0) as total_profit,
                    COALESCE(SUM(cantitate_receptionata), 0) as total_kg,
                    COUNT(DISTINCT month) as months_active
-            FROM vanzari
+            FROM sumar_firme
             GROUP BY year
             ORDER BY year
         """)
@@ -1055,7 +831,7 @@ class handler(BaseHTTPRequestHandler):
             SELECT year, month,
                    COALESCE(SUM(valoare_ron), 0) as valoare,
                    COALESCE(SUM(adaos_final), 0) as profit
-            FROM vanzari
+            FROM sumar_firme
             GROUP BY year, month
             ORDER BY year, month
         """)
@@ -4,24 +4,20 @@ GET /api/monthly?year=2024&month=10 - Specifikus hónap részletei
 GET /api/monthly - Összes hónap összefoglalója
 """
 from http.server import BaseHTTPRequestHandler
-import json
 import os
+import sys
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from urllib.parse import urlparse, parse_qs
-from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _lib import querylog, serialize
 
 def get_db():
     # Try multiple environment variable names
     db_url = os.environ.get('POSTGRES_URL') or os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL_NO_SSL')
     if not db_url:
         raise Exception("No database URL configured")
-    return psycopg2.connect(db_url, cursor_factory=RealDictCursor)
-
-def decimal_default(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    raise TypeError
+    return serialize.register_casters(psycopg2.connect(db_url, cursor_factory=querylog.TimedCursor))
 
 # Romanian weekday names
 WEEKDAY_NAMES = {
@@ -43,6 +39,7 @@ class handler(BaseHTTPRequestHandler):
             month = query.get('month', [None])[0]
 
             conn = get_db()
+            querylog.start(querylog.label(self.path), conn)
             cur = conn.cursor()
 
             if year and month:
@@ -51,19 +48,13 @@ class handler(BaseHTTPRequestHandler):
                 result = self.get_all_months(cur)
 
             cur.close()
+            timing = querylog.finish()
             conn.close()
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result, default=decimal_default, ensure_ascii=False).encode('utf-8'))
+            serialize.send_json(self, 200, result, timing)
 
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode())
+            serialize.send_json(self, 500, {'error': str(e)}, querylog.finish())
 
     def get_month_details(self, cur, year, month):
         """Get detailed data for a specific month"""
@@ -5,24 +5,20 @@ Endpoints:
   GET /api/partners?cnp=1234567890123
 """
 from http.server import BaseHTTPRequestHandler
-import json
 import os
+import sys
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from urllib.parse import urlparse, parse_qs
-from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _lib import querylog, serialize
 
 def get_db():
     # Try multiple environment variable names
     db_url = os.environ.get('POSTGRES_URL') or os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL_NO_SSL')
     if not db_url:
         raise Exception("No database URL configured")
-    return psycopg2.connect(db_url, cursor_factory=RealDictCursor)
-
-def decimal_default(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    raise TypeError
+    return serialize.register_casters(psycopg2.connect(db_url, cursor_factory=querylog.TimedCursor))
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -31,6 +27,7 @@ class handler(BaseHTTPRequestHandler):
             params = parse_qs(parsed.query, keep_blank_values=True)
 
             conn = get_db()
+            querylog.start(querylog.label(self.path), conn)
             cur = conn.cursor()
 
             # Get specific partner by CNP
@@ -129,19 +126,13 @@ class handler(BaseHTTPRequestHandler):
                 result = {'error': 'Specify ?q=search, ?cnp=XXX, ?inactive=days, ?top=N, ?onetime, ?filter, ?regulars, ?same_address, ?same_family, ?big_suppliers, or ?list=1'}
 
             cur.close()
+            timing = querylog.finish()
             conn.close()
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result, default=decimal_default, ensure_ascii=False).encode('utf-8'))
+            serialize.send_json(self, 200, result, timing)
 
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode())
+            serialize.send_json(self, 500, {'error': str(e)}, querylog.finish())
 
     def search_partners(self, cur, query, limit):
         """Search partners by name or CNP"""
@@ -828,11 +819,10 @@ class handler(BaseHTTPRequestHandler):
                 LEFT JOIN (
                     SELECT t.cnp,
                            COUNT(DISTINCT t.document_id) as visit_count,
-                           COALESCE(SUM(ti.weight_kg), 0) as total_kg,
+                           COALESCE(SUM(t.weight_kg), 0) as total_kg,
                            COALESCE(SUM(t.gross_value), 0) as total_value,
                            MAX(t.date) as last_visit
-                    FROM transactions t
-                    LEFT JOIN transaction_items ti ON t.document_id = ti.document_id
+                    FROM transaction_facts t
                     GROUP BY t.cnp
                 ) stats ON p.cnp = stats.cnp
                 {where_sql}
@@ -881,16 +871,15 @@ class handler(BaseHTTPRequestHandler):
                 """
                 params.append(f'%{category}%')
             else:
-                # No category filter - use gross_value
+                # No category filter - use gross_value (transaction_facts: one row per document)
                 base_query = f"""
                     SELECT p.cnp, p.name, p.city, p.county, p.street, p.sex,
                            COUNT(DISTINCT t.document_id) as visit_count,
-                           COALESCE(SUM(ti.weight_kg), 0) as total_kg,
+                           COALESCE(SUM(t.weight_kg), 0) as total_kg,
                            COALESCE(SUM(t.gross_value), 0) as total_value,
                            MAX(t.date) as last_visit
                     FROM partners p
-                    LEFT JOIN transactions t ON p.cnp = t.cnp
-                    LEFT JOIN transaction_items ti ON t.document_id = ti.document_id
+                    LEFT JOIN transaction_facts t ON p.cnp = t.cnp
                     {where_sql}
                     GROUP BY p.cnp, p.name, p.city, p.county, p.street, p.sex
                 """
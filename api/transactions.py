@@ -7,24 +7,20 @@ Endpoints:
   GET /api/transactions?category=Cupru&date_from=2024-01-01
 """
 from http.server import BaseHTTPRequestHandler
-import json
 import os
+import sys
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from urllib.parse import urlparse, parse_qs
-from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _lib import querylog, serialize
 
 def get_db():
     # Try multiple environment variable names
     db_url = os.environ.get('POSTGRES_URL') or os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL_NO_SSL')
     if not db_url:
         raise Exception("No database URL configured")
-    return psycopg2.connect(db_url, cursor_factory=RealDictCursor)
-
-def decimal_default(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    raise TypeError
+    return serialize.register_casters(psycopg2.connect(db_url, cursor_factory=querylog.TimedCursor))
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -33,6 +29,7 @@ class handler(BaseHTTPRequestHandler):
             params = parse_qs(parsed.query)
 
             conn = get_db()
+            querylog.start(querylog.label(self.path), conn)
             cur = conn.cursor()
 
             # Get specific transaction by document_id
@@ -75,19 +72,13 @@ class handler(BaseHTTPRequestHandler):
                 }
 
             cur.close()
+            timing = querylog.finish()
             conn.close()
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result, default=decimal_default, ensure_ascii=False).encode('utf-8'))
+            serialize.send_json(self, 200, result, timing)
 
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode())
+            serialize.send_json(self, 500, {'error': str(e)}, querylog.finish())
 
     def get_transaction_details(self, cur, doc_id):
         """Get full details of a specific transaction"""
@@ -4,39 +4,28 @@ Endpoints:
   GET /api/weather?type=ping
   GET /api/weather?type=residuals&metric=partners&date_from=X&date_to=Y
   GET /api/weather?type=buckets&variable=rain_sum&metric=partners
-  GET /api/weather?type=lag_curve&variable=rain_sum&metric=partners
+  GET /api/weather?type=lag_curve&variable=rain_sum&metric=partners[&lag_from=-2&lag_to=3]
   GET /api/weather?type=extreme_days&metric=partners&limit=20
   GET /api/weather?type=overview&metric=partners
 Metric options: partners | transactions | kg | ron
 """
 from http.server import BaseHTTPRequestHandler
-import json
 import os
+import sys
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from urllib.parse import urlparse, parse_qs
-from decimal import Decimal
-from datetime import date, datetime
-
-METRICS = {
-    "partners":     ("COUNT(DISTINCT t.cnp)",                     "partners"),
-    "transactions": ("COUNT(*)",                                  "transactions"),
-    "kg":           ("COALESCE(SUM(i.weight_kg), 0)",             "kg"),
-    "ron":          ("COALESCE(SUM(t.gross_value), 0)",           "ron"),
-}
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _lib import openmeteo, querylog, serialize, weathercats, weathermodel
+from _lib.weatherdaily import BASELINE_DAYS, METRICS, daily_residuals, weekday_baseline
 
 def get_db():
     url = os.environ.get("POSTGRES_URL") or os.environ.get("DATABASE_URL") or os.environ.get("POSTGRES_URL_NO_SSL")
     if not url:
         raise Exception("No database URL configured")
-    return psycopg2.connect(url, cursor_factory=RealDictCursor)
-
-def json_default(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    if isinstance(obj, (date, datetime)):
-        return obj.isoformat()
-    raise TypeError(f"Not serializable: {type(obj)}")
+    # NUMERIC as float; dates stay date objects (baselines do date arithmetic)
+    return serialize.register_casters(psycopg2.connect(url, cursor_factory=querylog.TimedCursor), dates=False)
 
 def resolve_metric(name):
     if name not in METRICS:
@@ -64,37 +53,41 @@ BUCKET_SPECS = {
 
 DOW_NAMES_RO = ["Luni", "Marti", "Miercuri", "Joi", "Vineri", "Sambata", "Duminica"]
 
+def _num(row, field):
+    v = row.get(field)
+    return float(v) if v is not None else None
+
 def _weather_desc(row):
     bits = []
-    tmax = row.get("temp_max")
-    tmin = row.get("temp_min")
+    tmax = _num(row, "temp_max")
+    tmin = _num(row, "temp_min")
     if tmax is not None:
         if tmin is not None:
-            bits.append(f"{float(tmin):.0f}..{float(tmax):.0f}°C")
+            bits.append(f"{tmin:.0f}..{tmax:.0f}°C")
         else:
-            bits.append(f"{float(tmax):.0f}°C")
-    ps = row.get("precipitation_sum")
-    if ps is not None and float(ps) >= 0.5:
-        bits.append(f"{float(ps):.1f}mm ploaie")
-    ss = row.get("snowfall_sum")
-    if ss is not None and float(ss) >= 0.5:
-        bits.append(f"{float(ss):.1f}cm zapada")
-    sd = row.get("snow_depth_max")
-    if sd is not None and float(sd) >= 0.02:
-        bits.append(f"strat {float(sd)*100:.0f}cm")
-    wsm = row.get("wind_speed_max")
-    if wsm is not None and float(wsm) >= 30:
-        bits.append(f"vant {float(wsm):.0f}km/h")
-    wgm = row.get("wind_gusts_max")
-    if wgm is not None and float(wgm) >= 50:
-        bits.append(f"rafale {float(wgm):.0f}km/h")
-    hum = row.get("humidity_mean")
-    if hum is not None and float(hum) >= 85:
-        bits.append(f"umed ({float(hum):.0f}%)")
-    cc = row.get("cloudcover_mean")
-    if cc is not None and float(cc) >= 80:
+            bits.append(f"{tmax:.0f}°C")
+    ps = _num(row, "precipitation_sum")
+    if ps is not None and ps >= 0.5:
+        bits.append(f"{ps:.1f}mm ploaie")
+    ss = _num(row, "snowfall_sum")
+    if ss is not None and ss >= 0.5:
+        bits.append(f"{ss:.1f}cm zapada")
+    sd = _num(row, "snow_depth_max")
+    if sd is not None and sd >= 0.02:
+        bits.append(f"strat {sd*100:.0f}cm")
+    wsm = _num(row, "wind_speed_max")
+    if wsm is not None and wsm >= 30:
+        bits.append(f"vant {wsm:.0f}km/h")
+    wgm = _num(row, "wind_gusts_max")
+    if wgm is not None and wgm >= 50:
+        bits.append(f"rafale {wgm:.0f}km/h")
+    hum = _num(row, "humidity_mean")
+    if hum is not None and hum >= 85:
+        bits.append(f"umed ({hum:.0f}%)")
+    cc = _num(row, "cloudcover_mean")
+    if cc is not None and cc >= 80:
         bits.append("nori inchisi")
-    elif cc is not None and float(cc) <= 25:
+    elif cc is not None and cc <= 25:
         bits.append("senin")
     return ", ".join(bits) if bits else "vreme calma"
 
@@ -113,6 +106,52 @@ def _day_example(row):
         "weather": _weather_desc(row),
     }
 
+def _example_cache():
+    """_day_example memoized by date, for views that list the same day under several insights."""
+    cache = {}
+    def example(row):
+        ex = cache.get(row["date"])
+        if ex is None:
+            ex = cache[row["date"]] = _day_example(row)
+        return ex
+    return example
+
+DEFAULT_LAGS = range(-2, 4)
+MAX_LAG = 30
+
+def lag_correlations(rows, variables, lags, min_pairs=10):
+    """Pearson correlation between each variable on day i and the residual on
+    day i+lag (rows in date order, lag counted in rows), for every lag.
+    Values are converted once into aligned lists; each lag is one pass over
+    the two shifted slices. Returns {variable: [{lag, n, correlation}]}."""
+    size = len(rows)
+    ys = [r["residual"] for r in rows]
+    out = {}
+    for var in variables:
+        xs = [_num(r, var) for r in rows]
+        curve = []
+        for lag in lags:
+            n = 0
+            sx = sy = sxx = syy = sxy = 0
+            if abs(lag) < size:
+                src = xs[max(0, -lag):size - max(0, lag)]
+                tgt = ys[max(0, lag):size - max(0, -lag)]
+                for x, y in zip(src, tgt):
+                    if x is None or y is None:
+                        continue
+                    n += 1
+                    sx += x; sy += y
+                    sxx += x * x; syy += y * y
+                    sxy += x * y
+            if n < min_pairs:
+                curve.append({"lag": lag, "n": n, "correlation": None})
+                continue
+            denom = ((n * sxx - sx * sx) * (n * syy - sy * sy)) ** 0.5
+            r = (n * sxy - sx * sy) / denom if denom else 0
+            curve.append({"lag": lag, "n": n, "correlation": round(r, 3)})
+        out[var] = curve
+    return out
+
 def find_threshold(pairs, min_pts_per_side=15):
     """Given list of (x, residual) pairs, find the split point that maximizes
     |t-statistic| of residual means. Returns dict or None."""
@@ -142,97 +181,7 @@ def find_threshold(pairs, min_pts_per_side=15):
 # ============================================================================
 # Open-Meteo forecast (Phase 3 — Prognoza 7-zile)
 # ============================================================================
-import json as _json
-from urllib.parse import urlencode as _urlencode
-from urllib.request import urlopen as _urlopen, Request as _Request
-
-FORECAST_LAT = 47.0722
-FORECAST_LON = 21.9217
-FORECAST_TZ = "Europe/Bucharest"
-FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
-
-FORECAST_DAILY_FIELDS = [
-    "temperature_2m_max", "temperature_2m_min", "temperature_2m_mean",
-    "apparent_temperature_max", "apparent_temperature_min",
-    "precipitation_sum", "rain_sum", "snowfall_sum", "snow_depth_max",
-    "precipitation_hours", "windspeed_10m_max", "windgusts_10m_max",
-    "winddirection_10m_dominant", "weather_code",
-]
-FORECAST_HOURLY_FIELDS = ["pressure_msl", "relativehumidity_2m", "cloudcover"]
-
-FORECAST_DAILY_MAP = {
-    "temperature_2m_max": "temp_max",
-    "temperature_2m_min": "temp_min",
-    "temperature_2m_mean": "temp_mean",
-    "apparent_temperature_max": "apparent_temp_max",
-    "apparent_temperature_min": "apparent_temp_min",
-    "precipitation_sum": "precipitation_sum",
-    "rain_sum": "rain_sum",
-    "snowfall_sum": "snowfall_sum",
-    "snow_depth_max": "snow_depth_max",
-    "precipitation_hours": "precipitation_hours",
-    "windspeed_10m_max": "wind_speed_max",
-    "windgusts_10m_max": "wind_gusts_max",
-    "winddirection_10m_dominant": "wind_direction_dominant",
-    "weather_code": "weather_code",
-}
-FORECAST_HOURLY_MAP = {
-    "pressure_msl": "pressure_mean",
-    "relativehumidity_2m": "humidity_mean",
-    "cloudcover": "cloudcover_mean",
-}
-
-
-def _open_meteo_forecast(forecast_days=7, timeout=10):
-    """Fetch forecast from Open-Meteo, return dict: {date -> {col: value}}.
-    Returns None on network/API failure."""
-    daily_q = {
-        "latitude": FORECAST_LAT, "longitude": FORECAST_LON,
-        "timezone": FORECAST_TZ, "forecast_days": forecast_days,
-        "daily": ",".join(FORECAST_DAILY_FIELDS),
-    }
-    hourly_q = {
-        "latitude": FORECAST_LAT, "longitude": FORECAST_LON,
-        "timezone": FORECAST_TZ, "forecast_days": forecast_days,
-        "hourly": ",".join(FORECAST_HOURLY_FIELDS),
-    }
-    try:
-        daily = _fetch_json(FORECAST_URL + "?" + _urlencode(daily_q), timeout)
-        hourly = _fetch_json(FORECAST_URL + "?" + _urlencode(hourly_q), timeout)
-    except Exception:
-        return None
-
-    per_day = {}
-    d_times = daily.get("daily", {}).get("time", [])
-    for api_field, col in FORECAST_DAILY_MAP.items():
-        arr = daily["daily"].get(api_field, [None] * len(d_times))
-        for i, dstr in enumerate(d_times):
-            per_day.setdefault(dstr, {})[col] = arr[i] if i < len(arr) else None
-
-    h_times = hourly.get("hourly", {}).get("time", [])
-    h_by_day = {}
-    for api_field in FORECAST_HOURLY_FIELDS:
-        arr = hourly["hourly"].get(api_field, [None] * len(h_times))
-        for i, tstr in enumerate(h_times):
-            day = tstr[:10]
-            if arr[i] is None:
-                continue
-            h_by_day.setdefault(day, {}).setdefault(api_field, []).append(arr[i])
-    for dstr, fields in h_by_day.items():
-        target = per_day.setdefault(dstr, {})
-        for api_field, col in FORECAST_HOURLY_MAP.items():
-            vals = fields.get(api_field, [])
-            if vals:
-                target[col] = round(sum(vals) / len(vals), 2)
-
-    return per_day
-
-
-def _fetch_json(url, timeout):
-    req = _Request(url, headers={"User-Agent": "paju-dashboard/1.0"})
-    with _urlopen(req, timeout=timeout) as r:
-        return _json.loads(r.read().decode("utf-8"))
-
+# The Open-Meteo client and the weather_forecast cache live in _lib/openmeteo.py
 
 def _forecast_desc(w):
     """Compact human-readable summary of a forecast day's weather."""
@@ -260,124 +209,20 @@ def _forecast_desc(w):
     return ", ".join(bits) if bits else "vreme calma"
 
 
-_RANKING_CATEGORIES = [
-    # Precipitation (rain)
-    ("🌧️", "Ploaie torentiala", ">20mm",
-     lambda r: r.get("precipitation_sum") is not None and float(r["precipitation_sum"]) > 20),
-    ("🌧️", "Ploaie puternica", "10-20mm",
-     lambda r: r.get("precipitation_sum") is not None and 10 < float(r["precipitation_sum"]) <= 20),
-    ("🌧️", "Ploaie moderata", "5-10mm",
-     lambda r: r.get("precipitation_sum") is not None and 5 < float(r["precipitation_sum"]) <= 10),
-    ("🌧️", "Ploaie usoara", "2-5mm",
-     lambda r: r.get("precipitation_sum") is not None and 2 < float(r["precipitation_sum"]) <= 5),
-    ("🌧️", "Ploaie fina", "0.5-2mm",
-     lambda r: r.get("precipitation_sum") is not None and 0.5 < float(r["precipitation_sum"]) <= 2),
-    # Snow
-    ("❄️", "Zapada abundenta", ">10cm",
-     lambda r: r.get("snowfall_sum") is not None and float(r["snowfall_sum"]) > 10),
-    ("❄️", "Zapada medie", "3-10cm",
-     lambda r: r.get("snowfall_sum") is not None and 3 < float(r["snowfall_sum"]) <= 10),
-    ("❄️", "Ninsoare usoara", "1-3cm",
-     lambda r: r.get("snowfall_sum") is not None and 1 < float(r["snowfall_sum"]) <= 3),
-    # Cold
-    ("🥶", "Ger extrem", "<-10°C max",
-     lambda r: r.get("temp_max") is not None and float(r["temp_max"]) < -10),
-    ("🥶", "Ger", "-10..-5°C max",
-     lambda r: r.get("temp_max") is not None and -10 <= float(r["temp_max"]) < -5),
-    ("🥶", "Frig intens", "-5..0°C max",
-     lambda r: r.get("temp_max") is not None and -5 <= float(r["temp_max"]) < 0),
-    ("🥶", "Frig", "0..5°C max",
-     lambda r: r.get("temp_max") is not None and 0 <= float(r["temp_max"]) < 5),
-    ("🥶", "Rece", "5..10°C max",
-     lambda r: r.get("temp_max") is not None and 5 <= float(r["temp_max"]) < 10),
-    # Hot
-    ("🔥", "Canicula extrema", ">35°C max",
-     lambda r: r.get("temp_max") is not None and float(r["temp_max"]) > 35),
-    ("🔥", "Canicula", "32..35°C max",
-     lambda r: r.get("temp_max") is not None and 32 < float(r["temp_max"]) <= 35),
-    ("🔥", "Foarte cald", "30..32°C max",
-     lambda r: r.get("temp_max") is not None and 30 < float(r["temp_max"]) <= 32),
-    ("🔥", "Cald", "25..30°C max",
-     lambda r: r.get("temp_max") is not None and 25 < float(r["temp_max"]) <= 30),
-    # Wind
-    ("💨", "Furtuna", ">90km/h rafale",
-     lambda r: r.get("wind_gusts_max") is not None and float(r["wind_gusts_max"]) > 90),
-    ("💨", "Rafale mari", "70-90km/h",
-     lambda r: r.get("wind_gusts_max") is not None and 70 < float(r["wind_gusts_max"]) <= 90),
-    ("💨", "Rafale medii", "50-70km/h",
-     lambda r: r.get("wind_gusts_max") is not None and 50 < float(r["wind_gusts_max"]) <= 70),
-    # Humidity / sky
-    ("💧", "Umiditate extrema", ">92%",
-     lambda r: r.get("humidity_mean") is not None and float(r["humidity_mean"]) > 92),
-    ("💧", "Umiditate ridicata", "85-92%",
-     lambda r: r.get("humidity_mean") is not None and 85 < float(r["humidity_mean"]) <= 92),
-    ("💧", "Umiditate scazuta", "<45%",
-     lambda r: r.get("humidity_mean") is not None and float(r["humidity_mean"]) < 45),
-    ("☀️", "Senin", "nori <20%",
-     lambda r: r.get("cloudcover_mean") is not None and float(r["cloudcover_mean"]) < 20),
-    ("☁️", "Mohorat", "nori >90%",
-     lambda r: r.get("cloudcover_mean") is not None and float(r["cloudcover_mean"]) > 90),
-]
-
-
 class handler(BaseHTTPRequestHandler):
     def _send(self, status, payload):
-        self.send_response(status)
-        self.send_header("Content-Type", "application/json")
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.end_headers()
-        self.wfile.write(json.dumps(payload, default=json_default).encode("utf-8"))
+        serialize.send_json(self, status, payload, querylog.finish())
 
     def residuals(self, cur, metric_name, date_from, date_to):
-        agg_sql, label = resolve_metric(metric_name)
-        where = ["EXTRACT(ISODOW FROM t.date) <> 7"]
-        args = []
-        if date_from: where.append("t.date >= %s"); args.append(date_from)
-        if date_to:   where.append("t.date <= %s"); args.append(date_to)
-        where_sql = " AND ".join(where)
+        _, label = resolve_metric(metric_name)
+        daily = daily_residuals(cur, date_from, date_to)
+        return {"metric": label, "residuals": daily["residuals"][metric_name]}
 
-        cur.execute(f"""
-            WITH daily AS (
-              SELECT t.date,
-                     EXTRACT(ISODOW FROM t.date)::int AS dow,
-                     {agg_sql} AS value
-              FROM transactions t
-              LEFT JOIN transaction_items i ON i.document_id = t.document_id
-              WHERE {where_sql}
-              GROUP BY t.date
-            )
-            SELECT d.date, d.dow, d.value,
-                   (
-                     SELECT PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY d2.value)
-                     FROM daily d2
-                     WHERE d2.dow = d.dow
-                       AND d2.date <> d.date
-                       AND d2.date BETWEEN d.date - INTERVAL '28 days' AND d.date - INTERVAL '1 day'
-                   ) AS baseline,
-                   w.temp_max, w.temp_min, w.temp_mean, w.precipitation_sum, w.rain_sum,
-                   w.snowfall_sum, w.snow_depth_max, w.wind_speed_max, w.wind_gusts_max,
-                   w.pressure_mean, w.humidity_mean, w.cloudcover_mean, w.weather_code
-            FROM daily d
-            LEFT JOIN weather_oradea w ON w.date = d.date
-            ORDER BY d.date
-        """, args)
-        out = []
-        for r in cur.fetchall():
-            rec = dict(r)
-            if rec["baseline"] is not None:
-                rec["residual"] = float(rec["value"]) - float(rec["baseline"])
-                rec["residual_pct"] = (rec["residual"] / float(rec["baseline"]) * 100.0) if rec["baseline"] else None
-            else:
-                rec["residual"] = None
-                rec["residual_pct"] = None
-            out.append(rec)
-        return {"metric": label, "residuals": out}
-
-    def buckets(self, cur, metric_name, variable, date_from, date_to):
+    def buckets(self, cur, metric_name, variable, date_from, date_to, data=None):
         if variable not in BUCKET_SPECS:
             return {"error": f"No bucket spec for variable {variable}",
                     "available": list(BUCKET_SPECS.keys())}
-        data = self.residuals(cur, metric_name, date_from, date_to)
+        data = data or self.residuals(cur, metric_name, date_from, date_to)
         rows = [r for r in data["residuals"] if r["residual"] is not None and r.get(variable) is not None]
         out = []
         for lo, hi, label in BUCKET_SPECS[variable]:
@@ -402,7 +247,7 @@ class handler(BaseHTTPRequestHandler):
                         "mean_residual_pct": round(pct, 2) if pct is not None else None})
         return {"metric": data["metric"], "variable": variable, "buckets": out}
 
-    def lag_curve(self, cur, metric_name, variable, date_from, date_to):
+    def lag_curve(self, cur, metric_name, variable, date_from, date_to, lags=DEFAULT_LAGS):
         supported = set(BUCKET_SPECS.keys()) | {"temp_max", "temp_min", "temp_mean",
                                                  "rain_sum", "snowfall_sum",
                                                  "wind_speed_max", "wind_gusts_max",
@@ -410,36 +255,8 @@ class handler(BaseHTTPRequestHandler):
         if variable not in supported:
             return {"error": f"Variable not supported: {variable}"}
         data = self.residuals(cur, metric_name, date_from, date_to)
-        rows = data["residuals"]
-        by_date = {}
-        for r in rows:
-            d = r["date"].isoformat() if hasattr(r["date"], "isoformat") else r["date"]
-            by_date[d] = r
-        sorted_dates = sorted(by_date.keys())
-        lags = list(range(-2, 4))
-        out = []
-        for lag in lags:
-            pairs = []
-            for idx, d in enumerate(sorted_dates):
-                tgt_idx = idx + lag
-                if tgt_idx < 0 or tgt_idx >= len(sorted_dates):
-                    continue
-                src = by_date[d]
-                tgt = by_date[sorted_dates[tgt_idx]]
-                if src.get(variable) is None or tgt.get("residual") is None:
-                    continue
-                pairs.append((float(src[variable]), float(tgt["residual"])))
-            if len(pairs) < 10:
-                out.append({"lag": lag, "n": len(pairs), "correlation": None})
-                continue
-            n = len(pairs)
-            sx = sum(p[0] for p in pairs); sy = sum(p[1] for p in pairs)
-            sxx = sum(p[0] * p[0] for p in pairs); syy = sum(p[1] * p[1] for p in pairs)
-            sxy = sum(p[0] * p[1] for p in pairs)
-            denom = ((n * sxx - sx * sx) * (n * syy - sy * sy)) ** 0.5
-            r = (n * sxy - sx * sy) / denom if denom else 0
-            out.append({"lag": lag, "n": n, "correlation": round(r, 3)})
-        return {"metric": data["metric"], "variable": variable, "lags": out}
+        curves = lag_correlations(data["residuals"], [variable], lags)
+        return {"metric": data["metric"], "variable": variable, "lags": curves[variable]}
 
     def extreme_days(self, cur, metric_name, date_from, date_to, limit=20):
         data = self.residuals(cur, metric_name, date_from, date_to)
@@ -448,37 +265,26 @@ class handler(BaseHTTPRequestHandler):
         return {"metric": data["metric"], "extreme_days": rows[:limit]}
 
     def _all_time_category_effects(self, cur, metric_name):
-        """Return {category_name: {emoji, name, range, effect_pct, n, fn}}
+        """Return {category_name: {emoji, name, range, effect_pct, n}}
         computed across the entire dataset. Used by forecast() to look up
         per-dimension effects without re-querying per future day."""
         data = self.residuals(cur, metric_name, None, None)
-        rows = [r for r in data["residuals"] if r["residual"] is not None]
-        out = {}
-        for emoji, name, range_str, fn in _RANKING_CATEGORIES:
-            matching = [r for r in rows if fn(r) and r.get("residual_pct") is not None]
-            if len(matching) < 5:
-                continue
-            avg_pct = sum(float(r["residual_pct"]) for r in matching) / len(matching)
-            out[name] = {
-                "emoji": emoji,
-                "name": name,
-                "range": range_str,
-                "effect_pct": round(avg_pct, 2),
-                "n": len(matching),
-                "fn": fn,
-            }
-        return out
+        return weathercats.effects(data["residuals"])
 
     def forecast(self, cur, metric_name):
         """Return a 7-day traffic prognoza for Oradea. See
         docs/superpowers/specs/2026-04-20-prognoza-7-zile-design.md."""
         from datetime import datetime
-        forecast_data = _open_meteo_forecast(forecast_days=7)
+        forecast_data, fetched_at, stale = openmeteo.cached(cur, forecast_days=7)
         if forecast_data is None:
             return {"error": "forecast_unavailable", "retry_after_seconds": 300}
 
-        effects = self._all_time_category_effects(cur, metric_name)
         _, metric_label = resolve_metric(metric_name)
+        # Stored ridge model when one was trained (scripts/train_weather_model.py),
+        # otherwise the sum of the matching categories' average effects
+        model = weathermodel.load(cur, metric_name)
+        if model is None:
+            effects = self._all_time_category_effects(cur, metric_name)
 
         DOW_NAMES = ["Luni", "Marti", "Miercuri", "Joi", "Vineri", "Sambata", "Duminica"]
         METRIC_UNIT = {"partners": "parteneri", "transactions": "tranzactii",
@@ -486,6 +292,10 @@ class handler(BaseHTTPRequestHandler):
 
         forecast_dates = sorted(forecast_data.keys())
         baselines = self._forecast_baselines(cur, metric_name, forecast_dates)
+        if model is not None:
+            reach = timedelta(days=weathermodel.HOLIDAY_REACH)
+            holidays = weathermodel.official_holidays(
+                cur, date.fromisoformat(forecast_dates[0]) - reach, date.fromisoformat(forecast_dates[-1]) + reach)
 
         days_out = []
         for dstr in forecast_dates:
@@ -505,19 +315,31 @@ class handler(BaseHTTPRequestHandler):
                 continue
 
             baseline = baselines.get(dstr)
-            matched = []
-            for name, e in effects.items():
-                try:
-                    if e["fn"](weather):
-                        matched.append({
-                            "category": name,
-                            "emoji": e["emoji"],
-                            "range": e["range"],
-                            "effect_pct": e["effect_pct"],
-                            "n": e["n"],
-                        })
-                except Exception:
-                    continue
+            if model is not None:
+                x = weathermodel.features(d_obj, weather, holidays)
+                total_pct = weathermodel.predict(model, x)
+                predicted = (baseline * (1 + total_pct / 100)) if baseline is not None else None
+                r2 = model["r2"] or 0
+                days_out.append({
+                    "date": dstr, "dow": dow, "is_closed": False,
+                    "weather": weather,
+                    "weather_desc": _forecast_desc(weather),
+                    "baseline": round(baseline, 1) if baseline is not None else None,
+                    "predicted": round(predicted, 1) if predicted is not None else None,
+                    "pct_vs_baseline": round(total_pct, 1),
+                    "confidence": "high" if r2 >= 0.3 else ("ok" if r2 >= 0.1 else "low"),
+                    "min_n": model["n"],
+                    "breakdown": weathermodel.breakdown(model, x),
+                })
+                continue
+
+            matched = [{
+                "category": e["name"],
+                "emoji": e["emoji"],
+                "range": e["range"],
+                "effect_pct": e["effect_pct"],
+                "n": e["n"],
+            } for e in weathercats.matched_effects(effects, weather)]
 
             total_pct = sum(m["effect_pct"] for m in matched) if matched else 0.0
             predicted = (baseline * (1 + total_pct / 100)) if baseline is not None else None
@@ -546,6 +368,13 @@ class handler(BaseHTTPRequestHandler):
             "metric": metric_label,
             "metric_unit": METRIC_UNIT.get(metric_name, ""),
             "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "forecast_fetched_at": fetched_at.isoformat(timespec="seconds"),
+            "forecast_stale": stale,
+            "model": {
+                "trained_at": model["trained_at"].isoformat(timespec="seconds"),
+                "data_to": model["data_to"].isoformat(),
+                "n": model["n"], "r2": model["r2"], "rmse": model["rmse"],
+            } if model is not None else None,
             "days": days_out,
         }
 
@@ -556,33 +385,16 @@ class handler(BaseHTTPRequestHandler):
         if not dates:
             return {}
         agg_sql, _ = resolve_metric(metric_name)
+        targets = [date.fromisoformat(d) for d in dates]
         cur.execute(f"""
-            WITH daily AS (
-              SELECT t.date,
-                     EXTRACT(ISODOW FROM t.date)::int AS dow,
-                     {agg_sql} AS value
-              FROM transactions t
-              LEFT JOIN transaction_items i ON i.document_id = t.document_id
-              WHERE EXTRACT(ISODOW FROM t.date) <> 7
-              GROUP BY t.date
-            ),
-            targets AS (
-              SELECT unnest(%s::date[]) AS d
-            )
-            SELECT targets.d,
-                   (SELECT PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY d2.value)
-                    FROM daily d2
-                    WHERE d2.dow = EXTRACT(ISODOW FROM targets.d)::int
-                      AND d2.date BETWEEN targets.d - INTERVAL '28 days' AND targets.d - INTERVAL '1 day'
-                   ) AS baseline
-            FROM targets
-        """, (dates,))
-        out = {}
-        for row in cur.fetchall():
-            d = row["d"]
-            b = row["baseline"]
-            out[d.isoformat() if hasattr(d, "isoformat") else str(d)] = float(b) if b is not None else None
-        return out
+            SELECT t.date, {agg_sql} AS value
+            FROM transaction_facts t
+            WHERE EXTRACT(ISODOW FROM t.date) <> 7
+              AND t.date >= %s AND t.date < %s
+            GROUP BY t.date
+        """, (min(targets) - timedelta(days=BASELINE_DAYS), max(targets)))
+        values = {r["date"]: float(r["value"]) for r in cur.fetchall()}
+        return {d: weekday_baseline(values, t) for d, t in zip(dates, targets)}
 
     def overview(self, cur, metric_name, date_from, date_to):
         data = self.residuals(cur, metric_name, date_from, date_to)
@@ -590,6 +402,7 @@ class handler(BaseHTTPRequestHandler):
         if len(rows) < 30:
             return {"metric": data["metric"], "insights": [], "note": "Nu sunt suficiente date"}
         insights = []
+        example = _example_cache()
 
         # Plain-language labels for narratives
         METRIC_LABEL = {"partners": "parteneri", "transactions": "tranzactii",
@@ -615,7 +428,7 @@ class handler(BaseHTTPRequestHandler):
         # Family A: bucket comparisons — narrative form with example days
         for var in ["rain_sum", "temp_max", "wind_gusts_max", "snowfall_sum",
                     "humidity_mean", "cloudcover_mean"]:
-            bres = self.buckets(cur, metric_name, var, date_from, date_to)
+            bres = self.buckets(cur, metric_name, var, date_from, date_to, data)
             candidates = [b for b in bres.get("buckets", [])
                           if b.get("mean_residual_pct") is not None and b.get("n", 0) >= 10]
             if not candidates:
@@ -640,7 +453,7 @@ class handler(BaseHTTPRequestHandler):
                 bucket_rows.append(r)
             # Sort by residual in the direction of the effect
             bucket_rows.sort(key=lambda r: r["residual"], reverse=(pct > 0))
-            examples = [_day_example(r) for r in bucket_rows[:8]]
+            examples = [example(r) for r in bucket_rows[:8]]
             insights.append({
                 "kind": "bucket",
                 "variable": var,
@@ -669,7 +482,7 @@ class handler(BaseHTTPRequestHandler):
             # Example days above the threshold, sorted by residual in effect direction
             above_rows = [r for r in rows if r.get(var) is not None and float(r[var]) >= t["threshold"]]
             above_rows.sort(key=lambda r: r["residual"], reverse=(above_minus_below > 0))
-            examples = [_day_example(r) for r in above_rows[:8]]
+            examples = [example(r) for r in above_rows[:8]]
             insights.append({
                 "kind": "threshold",
                 "variable": var,
@@ -684,9 +497,10 @@ class handler(BaseHTTPRequestHandler):
             })
 
         # Family C: lag analysis — narrative form
-        for var in ["rain_sum", "snowfall_sum", "temp_max", "wind_gusts_max"]:
-            lc = self.lag_curve(cur, metric_name, var, date_from, date_to)
-            lags = [l for l in lc.get("lags", []) if l.get("correlation") is not None]
+        lag_vars = ["rain_sum", "snowfall_sum", "temp_max", "wind_gusts_max"]
+        curves = lag_correlations(data["residuals"], lag_vars, DEFAULT_LAGS)
+        for var in lag_vars:
+            lags = [l for l in curves[var] if l.get("correlation") is not None]
             if not lags:
                 continue
             peak = max(lags, key=lambda l: abs(l["correlation"]))
@@ -719,12 +533,12 @@ class handler(BaseHTTPRequestHandler):
             pair_scores.sort(key=lambda p: p[2], reverse=True)
             lag_examples = []
             for src, tgt, _ in pair_scores[:8]:
-                ex = _day_example(tgt)
+                ex = dict(example(tgt))
                 ex["lag_trigger"] = {
                     "date": src["date"].isoformat() if hasattr(src["date"], "isoformat") else str(src["date"]),
                     "variable": var,
                     "value": float(src[var]) if src.get(var) is not None else None,
-                    "weather": _weather_desc(src),
+                    "weather": example(src)["weather"],
                     "lag": lag_val,
                 }
                 lag_examples.append(ex)
@@ -764,7 +578,7 @@ class handler(BaseHTTPRequestHandler):
                     f"decat intr-o zi normala. Observat pe {n} zile.")
             matching = [r for r in rows if fn(r)]
             matching.sort(key=lambda r: r["residual"], reverse=(val > 0))
-            examples = [_day_example(r) for r in matching[:8]]
+            examples = [example(r) for r in matching[:8]]
             insights.append({
                 "kind": "interaction",
                 "pattern": name,
@@ -781,22 +595,22 @@ class handler(BaseHTTPRequestHandler):
         insights.sort(key=lambda i: -score(i))
 
         # Ranking: head-to-head of weather categories (narrower for resolution)
-        CATEGORIES = _RANKING_CATEGORIES
-
         STRONG = 15.0  # |residual_pct| >= 15% = strong individual-day effect
         ranking = []
-        for emoji, name, range_str, fn in CATEGORIES:
-            matching = [r for r in rows if fn(r) and r.get("residual_pct") is not None]
-            if len(matching) < 3:
+        pct_rows = [r for r in rows if r["residual_pct"] is not None]
+        members = weathercats.MATCHER.assign(pct_rows)
+        for (emoji, name, range_str, *_), idx in zip(weathercats.CATEGORIES, members):
+            if len(idx) < 3:
                 continue
-            avg_pct = sum(float(r["residual_pct"]) for r in matching) / len(matching)
-            n_strong_neg = sum(1 for r in matching if float(r["residual_pct"]) <= -STRONG)
-            n_strong_pos = sum(1 for r in matching if float(r["residual_pct"]) >= STRONG)
+            matching = [pct_rows[j] for j in idx]
+            avg_pct = sum(r["residual_pct"] for r in matching) / len(matching)
+            n_strong_neg = sum(1 for r in matching if r["residual_pct"] <= -STRONG)
+            n_strong_pos = sum(1 for r in matching if r["residual_pct"] >= STRONG)
             if avg_pct < 0:
-                sorted_matching = sorted(matching, key=lambda r: float(r["residual"]))
+                sorted_matching = sorted(matching, key=lambda r: r["residual"])
             else:
-                sorted_matching = sorted(matching, key=lambda r: float(r["residual"]), reverse=True)
-            examples = [_day_example(r) for r in sorted_matching[:8]]
+                sorted_matching = sorted(matching, key=lambda r: r["residual"], reverse=True)
+            examples = [example(r) for r in sorted_matching[:8]]
             ranking.append({
                 "emoji": emoji,
                 "name": name,
@@ -806,8 +620,8 @@ class handler(BaseHTTPRequestHandler):
                 "n_strong_neg": n_strong_neg,
                 "n_strong_pos": n_strong_pos,
                 "examples": examples,
-                "worst_day": _day_example(sorted_matching[0]) if avg_pct < 0 else None,
-                "best_day":  _day_example(sorted_matching[0]) if avg_pct > 0 else None,
+                "worst_day": example(sorted_matching[0]) if avg_pct < 0 else None,
+                "best_day":  example(sorted_matching[0]) if avg_pct > 0 else None,
             })
 
         ranking.sort(key=lambda r: r["effect_pct"])
@@ -831,8 +645,7 @@ class handler(BaseHTTPRequestHandler):
         # Current period average daily metric
         cur.execute(f"""
             WITH daily AS (
-              SELECT t.date, {agg_sql} AS value FROM transactions t
-              LEFT JOIN transaction_items i ON i.document_id = t.document_id
+              SELECT t.date, {agg_sql} AS value FROM transaction_facts t
               WHERE t.date BETWEEN %s AND %s AND EXTRACT(ISODOW FROM t.date) <> 7
               GROUP BY t.date
             )
@@ -849,8 +662,7 @@ class handler(BaseHTTPRequestHandler):
               SELECT t.date,
                      EXTRACT(year FROM t.date)::int AS yr,
                      {agg_sql} AS value
-              FROM transactions t
-              LEFT JOIN transaction_items i ON i.document_id = t.document_id
+              FROM transaction_facts t
               WHERE EXTRACT(ISODOW FROM t.date) <> 7
                 AND NOT (t.date BETWEEN %s AND %s)
                 AND EXTRACT(doy FROM t.date) BETWEEN %s AND %s
@@ -887,6 +699,7 @@ class handler(BaseHTTPRequestHandler):
             qtype = params.get("type", [""])[0]
 
             conn = get_db()
+            querylog.start(querylog.label(self.path), conn)
             cur = conn.cursor()
 
             if qtype == "ping":
@@ -907,7 +720,9 @@ class handler(BaseHTTPRequestHandler):
                 variable = params.get("variable", ["rain_sum"])[0]
                 df = params.get("date_from", [None])[0]
                 dt = params.get("date_to", [None])[0]
-                result = self.lag_curve(cur, metric, variable, df, dt)
+                lag_from = max(-MAX_LAG, int(params.get("lag_from", [DEFAULT_LAGS.start])[0]))
+                lag_to = min(MAX_LAG, int(params.get("lag_to", [DEFAULT_LAGS.stop - 1])[0]))
+                result = self.lag_curve(cur, metric, variable, df, dt, range(lag_from, lag_to + 1))
             elif qtype == "extreme_days":
                 metric = params.get("metric", ["partners"])[0]
                 df = params.get("date_from", [None])[0]
@@ -925,8 +740,8 @@ class handler(BaseHTTPRequestHandler):
             else:
                 result = {"error": "Unknown query type", "got": qtype}
 
-            conn.close()
             self._send(200, result)
+            conn.close()
         except Exception as e:
             self._send(500, {"error": str(e)})
 
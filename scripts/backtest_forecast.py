@@ -0,0 +1,185 @@
+# scripts/backtest_forecast.py
+"""Backtest the 7-day traffic prognoza (/api/weather?type=forecast) on history.
+
+Every past week is forecast as if it were the Monday morning of that week:
+the weekday baselines use the weeks before it, the category effects and the
+ridge model are fitted only on earlier days, and weather_oradea stands in for
+a perfect weather forecast. Reports MAPE and bias of the predicted daily value
+per metric and variant, plus the time one weekly forecast takes. Weeks run in
+a process pool.
+
+Variants:
+  baseline   same-weekday median of the 4 previous weeks, no weather adjustment
+  effects    baseline + summed average residuals of matching weather categories
+  model      baseline + ridge model (api/_lib/weathermodel.py)
+
+Usage:
+  python scripts/backtest_forecast.py --self-test
+  python scripts/backtest_forecast.py                         # last 52 weeks, all metrics
+  python scripts/backtest_forecast.py --weeks 104 --metric partners --workers 8
+"""
+import argparse, os, random, sys, time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+sys.path.append(str(Path(__file__).parent.parent / 'api'))
+from _lib import weathercats, weatherdaily, weathermodel
+
+VARIANTS = ['baseline', 'effects', 'model']
+MIN_HISTORY_DAYS = 180      # weeks with less training history are skipped
+
+def load_env_local():
+    env = Path(__file__).parent.parent / '.env.local'
+    if env.exists():
+        for line in env.read_text().splitlines():
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            k, v = line.split('=', 1)
+            os.environ.setdefault(k, v.strip().strip('"').strip("'"))
+
+# Worker state, set once per process by _init()
+_rows = None
+_dates = None
+_holidays = None
+_ridge_lambda = None
+
+def _init(rows, holidays, ridge_lambda):
+    global _rows, _dates, _holidays, _ridge_lambda
+    _rows, _holidays, _ridge_lambda = rows, holidays, ridge_lambda
+    _dates = {m: [r['date'] for r in rs] for m, rs in rows.items()}
+
+def forecast_week(metric, week_start):
+    """[(variant, predicted, actual)] for the open days of the week starting
+    week_start, plus {variant: seconds} spent producing each forecast."""
+    rows, dates = _rows[metric], _dates[metric]
+    cut = bisect_left(dates, week_start)
+    history = rows[:cut]
+    week = [r for r in rows[cut:bisect_left(dates, week_start + timedelta(days=7), cut)]
+            if r['baseline'] is not None and float(r['value']) > 0]
+    if sum(1 for r in history if r['residual_pct'] is not None) < MIN_HISTORY_DAYS or not week:
+        return [], {}
+
+    timing = {}
+    pct = {}
+    t0 = time.perf_counter()
+    pct['baseline'] = [0.0 for _ in week]
+    timing['baseline'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    effects = weathercats.effects(history)
+    pct['effects'] = [sum(e['effect_pct'] for e in weathercats.matched_effects(effects, r)) for r in week]
+    timing['effects'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    _, X, y = weathermodel.training_set(history, _holidays)
+    model = weathermodel.fit(X, y, _ridge_lambda)
+    pct['model'] = [weathermodel.predict(model, weathermodel.features(r['date'], r, _holidays)) for r in week]
+    timing['model'] = time.perf_counter() - t0
+
+    out = []
+    for variant in VARIANTS:
+        for r, p in zip(week, pct[variant]):
+            out.append((variant, r['baseline'] * (1 + p / 100), float(r['value'])))
+    return out, timing
+
+def _task(args):
+    return args, forecast_week(*args)
+
+def summarize(results):
+    """{(metric, variant): {days, weeks, mape, bias, ms}} from forecast_week outputs."""
+    acc = {}
+    for (metric, _), (preds, timing) in results:
+        for variant, seconds in timing.items():
+            a = acc.setdefault((metric, variant), {'ape': 0.0, 'pe': 0.0, 'days': 0, 'weeks': 0, 'seconds': 0.0})
+            a['weeks'] += 1
+            a['seconds'] += seconds
+        for variant, predicted, actual in preds:
+            a = acc[(metric, variant)]
+            a['ape'] += abs(predicted - actual) / actual
+            a['pe'] += (predicted - actual) / actual
+            a['days'] += 1
+    return {k: {'days': a['days'], 'weeks': a['weeks'],
+                'mape': 100 * a['ape'] / a['days'] if a['days'] else None,
+                'bias': 100 * a['pe'] / a['days'] if a['days'] else None,
+                'ms': 1000 * a['seconds'] / a['weeks'] if a['weeks'] else None}
+            for k, a in acc.items()}
+
+def run(rows, holidays, metrics, weeks, workers, ridge_lambda):
+    last = max(r['date'] for rs in rows.values() for r in rs)
+    # Mondays of the last `weeks` complete weeks
+    end = last - timedelta(days=last.weekday())
+    starts = [end - timedelta(weeks=k) for k in range(weeks, 0, -1)]
+    tasks = [(m, s) for m in metrics for s in starts]
+    t0 = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init,
+                                 initargs=({m: rows[m] for m in metrics}, holidays, ridge_lambda)) as ex:
+            results = list(ex.map(_task, tasks, chunksize=4))
+    else:
+        _init({m: rows[m] for m in metrics}, holidays, ridge_lambda)
+        results = [_task(t) for t in tasks]
+    elapsed = time.perf_counter() - t0
+    summary = summarize(results)
+    print(f"{len(starts)} weeks ({starts[0]} .. {starts[-1] + timedelta(days=6)}), "
+          f"{workers} workers, {elapsed:.1f}s")
+    print(f"{'metric':<13} {'variant':<9} {'weeks':>5} {'days':>5} {'MAPE %':>7} {'bias %':>7} {'ms/fc':>7}")
+    for m in metrics:
+        for v in VARIANTS:
+            s = summary.get((m, v))
+            if not s or not s['days']:
+                continue
+            print(f"{m:<13} {v:<9} {s['weeks']:>5} {s['days']:>5} {s['mape']:>7.1f} {s['bias']:>+7.1f} {s['ms']:>7.1f}")
+    return summary
+
+def self_test():
+    """On synthetic days where rain cuts traffic, the weather-aware variants beat the plain baseline."""
+    rng = random.Random(3)
+    values, raw = {}, []
+    d = date(2023, 1, 2)
+    while d < date(2025, 1, 1):
+        if d.isoweekday() != 7:
+            rain = rng.choice([0, 0, 0, 3, 12, 30])
+            w = {'temp_max': 5 + 25 * rng.random(), 'precipitation_sum': rain, 'snowfall_sum': 0,
+                 'wind_gusts_max': 30, 'humidity_mean': 70, 'cloudcover_mean': 50}
+            values[d] = 100 * (1 - 0.01 * rain) * (1 + rng.gauss(0, 0.03))
+            raw.append((d, w))
+        d += timedelta(days=1)
+    rows = []
+    for d, w in raw:
+        b = weatherdaily.weekday_baseline(values, d)
+        res = values[d] - b if b is not None else None
+        rows.append({'date': d, 'dow': d.isoweekday(), 'value': values[d], 'baseline': b, **w,
+                     'residual': res, 'residual_pct': res / b * 100 if b else None})
+    summary = run({'partners': rows}, set(), ['partners'], weeks=26, workers=2, ridge_lambda=1.0)
+    base, eff, mod = (summary[('partners', v)]['mape'] for v in VARIANTS)
+    assert mod < base and eff < base, (base, eff, mod)
+    print(f"Self-test OK: MAPE baseline {base:.1f}% > effects {eff:.1f}%, model {mod:.1f}%")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--self-test', action='store_true')
+    parser.add_argument('--metric', choices=list(weatherdaily.METRICS))
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--lambda', dest='ridge_lambda', type=float, default=weathermodel.DEFAULT_LAMBDA)
+    args = parser.parse_args()
+    if args.self_test:
+        self_test()
+        sys.exit(0)
+    load_env_local()
+    url = os.environ.get('POSTGRES_URL')
+    if not url:
+        print("POSTGRES_URL not set"); sys.exit(1)
+    conn = psycopg2.connect(url, cursor_factory=RealDictCursor)
+    with conn.cursor() as cur:
+        daily = weatherdaily.daily_residuals(cur, None, None)
+        holidays = weathermodel.official_holidays(cur)
+    conn.close()
+    metrics = [args.metric] if args.metric else list(weatherdaily.METRICS)
+    run(daily['residuals'], holidays, metrics, args.weeks, args.workers, args.ridge_lambda)
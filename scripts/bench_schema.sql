@@ -0,0 +1,144 @@
+-- scripts/bench_schema.sql
+-- Base PAJU tables (see DB_SCHEMA_EXPORT.md) for the local benchmark database
+-- created by scripts/benchmark.py. Production already has these; the numbered
+-- migrations in scripts/migrations/ are applied on top.
+CREATE TABLE IF NOT EXISTS partners (
+  cnp VARCHAR(13) PRIMARY KEY,
+  name VARCHAR(200),
+  id_series VARCHAR(100),
+  id_expiry DATE,
+  street VARCHAR(500),
+  city VARCHAR(150),
+  county VARCHAR(100),
+  country VARCHAR(100) DEFAULT 'Romania',
+  phone VARCHAR(100),
+  email VARCHAR(150),
+  birth_year INT,
+  sex CHAR(1),
+  county_code_cnp VARCHAR(2),
+  county_from_cnp VARCHAR(50),
+  created_at TIMESTAMP DEFAULT now(),
+  modified_at TIMESTAMP,
+  is_active BOOLEAN DEFAULT true
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+  document_id VARCHAR(50) PRIMARY KEY,
+  date DATE NOT NULL,
+  cnp VARCHAR(13) REFERENCES partners(cnp),
+  payment_type VARCHAR(100),
+  iban VARCHAR(100),
+  gross_value NUMERIC(12,2),
+  env_tax NUMERIC(10,2),
+  income_tax NUMERIC(10,2),
+  net_paid NUMERIC(12,2)
+);
+
+CREATE TABLE IF NOT EXISTS waste_categories (
+  id SERIAL PRIMARY KEY,
+  name VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS waste_types (
+  id SERIAL PRIMARY KEY,
+  category_id INT REFERENCES waste_categories(id),
+  name VARCHAR(100)
+);
+
+CREATE TABLE IF NOT EXISTS transaction_items (
+  id SERIAL PRIMARY KEY,
+  document_id VARCHAR(50) REFERENCES transactions(document_id),
+  waste_type_id INT REFERENCES waste_types(id),
+  price_per_kg NUMERIC(8,2),
+  weight_kg NUMERIC(10,2),
+  value NUMERIC(12,2)
+);
+
+CREATE TABLE IF NOT EXISTS firme (
+  id SERIAL PRIMARY KEY,
+  name VARCHAR(200) NOT NULL,
+  name_normalized VARCHAR(200),
+  country VARCHAR(100),
+  city VARCHAR(100),
+  is_active BOOLEAN DEFAULT true,
+  created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS vanzari (
+  id SERIAL PRIMARY KEY,
+  firma_id INT REFERENCES firme(id),
+  data DATE NOT NULL,
+  year INT NOT NULL,
+  month INT NOT NULL,
+  numar_aviz VARCHAR(100),
+  tip_deseu VARCHAR(100),
+  cantitate_livrata NUMERIC(14,2),
+  pret_achizitie NUMERIC(12,4),
+  scazamant_kg NUMERIC(12,2),
+  scazamant_ron NUMERIC(12,2),
+  cantitate_receptionata NUMERIC(14,2),
+  pret_vanzare NUMERIC(12,4),
+  valoare_ron NUMERIC(14,2),
+  valoare_euro NUMERIC(14,2),
+  adaos NUMERIC(14,2),
+  transport_ron NUMERIC(12,2),
+  adaos_final NUMERIC(14,2),
+  serie_factura VARCHAR(50),
+  numar_factura VARCHAR(50),
+  data_factura DATE,
+  observatii TEXT,
+  numar_auto VARCHAR(100),
+  nume_sofer VARCHAR(100),
+  tara_destinatie VARCHAR(100),
+  transportator VARCHAR(100)
+);
+
+CREATE TABLE IF NOT EXISTS sumar_firme (
+  id SERIAL PRIMARY KEY,
+  year INT NOT NULL,
+  month INT NOT NULL,
+  firma_id INT REFERENCES firme(id),
+  cantitate_livrata NUMERIC(14,2),
+  pret_mediu_achizitie NUMERIC(12,4),
+  scazamant_kg NUMERIC(12,2),
+  scazamant_ron NUMERIC(12,2),
+  cantitate_receptionata NUMERIC(14,2),
+  pret_mediu_vanzare NUMERIC(12,4),
+  valoare_ron NUMERIC(14,2),
+  valoare_euro NUMERIC(14,2),
+  transport_ron NUMERIC(12,2),
+  adaos NUMERIC(14,2),
+  adaos_final NUMERIC(14,2)
+);
+
+CREATE TABLE IF NOT EXISTS sumar_deseuri (
+  id SERIAL PRIMARY KEY,
+  year INT NOT NULL,
+  month INT NOT NULL,
+  tip_deseu VARCHAR(100) NOT NULL,
+  cantitate_kg NUMERIC(14,2),
+  valoare_ron NUMERIC(14,2),
+  adaos_ron NUMERIC(14,2),
+  procent_vanzari NUMERIC(10,6),
+  procent_profit NUMERIC(10,6)
+);
+
+CREATE TABLE IF NOT EXISTS transporturi_firme (
+  id SERIAL PRIMARY KEY,
+  year INT NOT NULL,
+  month INT NOT NULL,
+  destinatie VARCHAR(200),
+  firma_name VARCHAR(200),
+  descriere VARCHAR(200),
+  suma_fara_tva NUMERIC(12,2),
+  tva NUMERIC(10,2),
+  total NUMERIC(12,2),
+  transportator VARCHAR(100)
+);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date);
+CREATE INDEX IF NOT EXISTS idx_transactions_cnp ON transactions(cnp);
+CREATE INDEX IF NOT EXISTS idx_items_document ON transaction_items(document_id);
+CREATE INDEX IF NOT EXISTS idx_items_waste_type ON transaction_items(waste_type_id);
+CREATE INDEX IF NOT EXISTS idx_vanzari_firma ON vanzari(firma_id);
+CREATE INDEX IF NOT EXISTS idx_vanzari_year_month ON vanzari(year, month);
@@ -0,0 +1,602 @@
+# scripts/benchmark.py
+"""Endpoint benchmark against a deterministic synthetic PAJU database (offline).
+
+  seed  - (re)creates a local Postgres DB with synthetic partners (valid CNPs),
+          transactions, items, weather, holidays, closures and B2B vanzari at
+          --scale x the current production volume, applies scripts/migrations/
+          and builds the rollups.
+  run   - invokes every api/*.py handler in-process (no HTTP, no Vercel) and
+          reports p50/p95 latency and query count per endpoint; --save writes a
+          JSON baseline, --baseline diffs against one (exit 1 on regressions).
+          It first checks that two fan-out tasks reuse one pooled connection.
+  serialize - no DB: times the fetch-time casts and JSON encoding of a synthetic
+          /api/weather residuals payload, with psycopg2's default types +
+          stdlib json vs the casters + shared serializer (api/_lib/serialize.py),
+          and the gzip / brotli sizes of the result.
+
+The benchmark DB URL comes from --db-url or BENCH_DATABASE_URL and its database
+name must contain 'bench' - .env.local / POSTGRES_URL are never read.
+
+Usage:
+  createdb paju_bench
+  python scripts/benchmark.py seed --scale 1
+  python scripts/benchmark.py run --repeat 7 --save bench_baseline.json
+  python scripts/benchmark.py run --baseline bench_baseline.json --only analytics
+  python scripts/benchmark.py serialize --days 1700
+"""
+import argparse, importlib.util, io, json, math, os, random, sys, time
+from datetime import date, timedelta
+from pathlib import Path
+from urllib.parse import quote, urlparse
+
+import psycopg2
+import psycopg2.extensions
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT / 'api'))
+from _lib import parallel, serialize, weatherdaily
+DEFAULT_DB_URL = 'postgresql://localhost/paju_bench'
+
+# Production volume (DB_SCHEMA_EXPORT.md) = scale 1
+BASE_PARTNERS = 30853
+BASE_TX_PER_DAY = 90
+BASE_VANZARI = 4390
+BASE_TRANSPORTURI = 39
+
+CATEGORIES = [
+    # (id, name, price RON/kg, share of items, typical kg)
+    (1, 'Acumulatori', 3.5, 0.04, 25), (2, 'Alama', 20.0, 0.04, 4), (3, 'Aluminiu', 6.0, 0.15, 8),
+    (4, 'Neferos Mix', 4.0, 0.02, 6), (5, 'Cablu Aluminiu', 3.0, 0.02, 5), (6, 'Cablu Cupru', 15.0, 0.03, 4),
+    (7, 'Carton', 0.4, 0.05, 40), (8, 'Cupru', 33.0, 0.08, 3), (9, 'Fier', 0.9, 0.40, 120),
+    (10, 'Plastic', 0.5, 0.04, 15), (11, 'Inox', 5.0, 0.03, 10), (12, 'Plumb', 6.0, 0.02, 6),
+    (13, 'Sticla', 0.1, 0.01, 30), (14, 'Zamac', 5.0, 0.01, 4), (15, 'Zinc', 6.0, 0.01, 4),
+    (16, 'DEEE', 1.0, 0.05, 20),
+]
+WASTE_TYPES = [
+    (1, 1, 'Deseu Acumulatori'), (2, 2, 'Deseu Alama'), (3, 2, 'Deseu Alama Radiator'), (4, 2, 'Deseu Alama Span'),
+    (5, 3, 'Deseu Aluminiu'), (6, 3, 'Deseu Aluminiu JANTE'), (7, 3, 'Deseu Aluminiu PREMIUM'),
+    (8, 3, 'Deseu Aluminiu Radiator'), (9, 3, 'Deseu Aluminiu Radiator cu CUPRU'), (10, 3, 'Deseu Aluminiu Span'),
+    (11, 4, 'Deseu Amestec NEFEROS'), (12, 5, 'Deseu Cablu Aluminiu'), (13, 6, 'Deseu Cablu Cupru'),
+    (14, 7, 'Deseu Carton'), (15, 7, 'Deseu Carton / Hartie'), (16, 8, 'Deseu Cupru'), (17, 8, 'Deseu Cupru Junkers'),
+    (18, 3, 'Deseu Doze Aluminiu'), (19, 9, 'Deseu Fier'), (20, 9, 'Deseu Fier (VSU)'), (21, 9, 'Deseu Fier Span'),
+    (22, 10, 'Deseu Folie'), (23, 11, 'Deseu Inox'), (24, 11, 'Deseu Inox Span'), (25, 10, 'Deseu PET'),
+    (26, 10, 'Deseu Plastic'), (27, 12, 'Deseu Plumb'), (28, 13, 'Deseu Sticla Ambalaj'), (29, 14, 'Deseu Zamac'),
+    (30, 15, 'Deseu Zinc'), (31, 16, 'Deseu DEEE Frigidere'), (32, 16, 'Deseu DEEE Mici'), (33, 16, 'Deseu DEEE Monitoare'),
+    (47, 10, 'Deseu Ambalaj Plastic (ladite si navete)'), (50, 9, 'Deseu Ambalaj Metalic'),
+]
+# (CNP county code, county, cities, share of partners); Bihor dominates like production
+COUNTIES = [
+    ('05', 'Bihor', ['Oradea', 'Mun. Oradea', 'Com. Sanmartin', 'Comuna Paleu', 'Oras Marghita', 'Sat Episcopia Bihor',
+                     'Salonta', 'Com. Bors', 'Municipiul Beius', 'Com. Osorhei'], 0.82),
+    ('02', 'Arad', ['Arad', 'Com. Pecica', 'Oras Chisineu-Cris'], 0.03),
+    ('12', 'Cluj', ['Cluj-Napoca', 'Com. Floresti', 'Huedin'], 0.03),
+    ('30', 'Satu Mare', ['Satu Mare', 'Com. Livada', 'Carei'], 0.02),
+    ('31', 'Salaj', ['Zalau', 'Com. Nusfalau'], 0.02),
+    ('35', 'Timis', ['Timisoara', 'Com. Dumbravita'], 0.02),
+    ('27', 'Neamt', ['Com Sagna', 'Piatra Neamt'], 0.02),
+    ('22', 'Iasi', ['Iasi', 'Pascani'], 0.02),
+    ('40', 'Bucuresti', ['Bucuresti'], 0.02),
+]
+FIRST_NAMES_M = ['Ion', 'Gheorghe', 'Vasile', 'Mihai', 'Florin', 'Adrian', 'Sandor', 'Istvan', 'Laszlo', 'Marius', 'Ionut', 'Cristian']
+FIRST_NAMES_F = ['Maria', 'Elena', 'Ana', 'Ioana', 'Erzsebet', 'Florica', 'Mariana', 'Gabriela']
+LAST_NAMES = ['Pop', 'Popa', 'Popescu', 'Nagy', 'Kovacs', 'Szabo', 'Ionescu', 'Rusu', 'Muresan', 'Toth', 'Horvath',
+              'Moldovan', 'Lazar', 'Balogh', 'Stan', 'Farkas', 'Cret', 'Bogdan', 'Dumitru', 'Varga']
+STREETS = ['Str. Republicii', 'Str. Principala', 'Str. Nufarului', 'Str. Independentei', 'Str. Morii', 'Str. Garii']
+COUNTRIES = ['Romania', 'Italia', 'Ungaria', 'Germania', 'Austria', 'Slovenia', 'Turcia']
+TRANSPORTERS = [f'TRANS {c} SRL' for c in 'ABCDEFGHIJKL']
+DRIVERS = [f'{ln} {fn}' for ln in LAST_NAMES[:8] for fn in FIRST_NAMES_M[:5]]
+
+# Every endpoint the SPAs call; {placeholders} are filled from the seeded data
+ENDPOINTS = [
+    ('analytics', '/api/analytics?type=overview'), ('analytics', '/api/analytics?type=yearly'),
+    ('analytics', '/api/analytics?type=monthly&year={year}'), ('analytics', '/api/analytics?type=county'),
+    ('analytics', '/api/analytics?type=city&county=Bihor'), ('analytics', '/api/analytics?type=weekday'),
+    ('analytics', '/api/analytics?type=age'), ('analytics', '/api/analytics?type=trends'),
+    ('analytics', '/api/analytics?type=tops'), ('analytics', '/api/analytics?type=holidays'),
+    ('analytics', '/api/analytics?type=waste_by_region'), ('analytics', '/api/analytics?type=waste_by_region&category=Cupru'),
+    ('analytics', '/api/analytics?type=all_cities'), ('analytics', '/api/analytics?type=city_details&city=Oradea'),
+    ('analytics', '/api/analytics?type=custom_compare&months=1,2,3'),
+    ('analytics', '/api/analytics?type=custom_compare&months=6,7,8&category=Cupru'),
+    ('data', '/api/data'),
+    ('monthly', '/api/monthly'), ('monthly', '/api/monthly?year={year}&month=5'),
+    ('partners', '/api/partners?q=Pop'), ('partners', '/api/partners?cnp={cnp}'),
+    ('partners', '/api/partners?inactive=90'), ('partners', '/api/partners?top=20'),
+    ('partners', '/api/partners?onetime'), ('partners', '/api/partners?filter&date_from={year}-01-01&date_to={year}-12-31'),
+    ('partners', '/api/partners?regulars=weekly'), ('partners', '/api/partners?same_address'),
+    ('partners', '/api/partners?same_family'), ('partners', '/api/partners?big_suppliers=Cupru'),
+    ('partners', '/api/partners?list=1'), ('partners', '/api/partners?list=1&category=Cupru&county=Bihor'),
+    ('transactions', '/api/transactions?document_id={document_id}'), ('transactions', '/api/transactions?cnp={cnp}'),
+    ('transactions', '/api/transactions?date_from={year}-01-01&date_to={year}-03-31'),
+    ('transactions', '/api/transactions?daily={busy_day}'),
+    ('waste', '/api/waste?type=categories'), ('waste', '/api/waste?type=types'),
+    ('waste', '/api/waste?type=prices&category=Cupru'), ('waste', '/api/waste?type=top&category=Cupru'),
+    ('waste', '/api/waste?type=monthly&year={year}'), ('waste', '/api/waste?type=search&waste=Cupru'),
+    ('waste', '/api/waste?type=analysis&categories=Cupru,Fier'),
+    ('calendar', '/api/calendar?type=holidays&year={year}'), ('calendar', '/api/calendar?type=closures'),
+    ('calendar', '/api/calendar?type=closure_candidates'), ('calendar', '/api/calendar?type=weekly_pattern'),
+    ('calendar', '/api/calendar?type=monthly_pattern&year={year}'),
+    ('calendar', '/api/calendar?type=working_days&date_from={year}-01-01&date_to={year}-12-31'),
+    ('calendar', '/api/calendar?type=holiday_effect'), ('calendar', '/api/calendar?type=bridge_days'),
+    ('calendar', '/api/calendar?type=illegal_workdays'),
+    ('weather', '/api/weather?type=residuals&metric=partners'), ('weather', '/api/weather?type=buckets&metric=kg'),
+    ('weather', '/api/weather?type=lag_curve&metric=transactions'), ('weather', '/api/weather?type=extreme_days&metric=ron'),
+    ('weather', '/api/weather?type=overview&metric=partners'),
+    ('firme', '/api/firme?type=overview'), ('firme', '/api/firme?type=list'), ('firme', '/api/firme?type=firma&id=1'),
+    ('firme', '/api/firme?type=vanzari&firma_id=1'), ('firme', '/api/firme?type=monthly&year={year}'),
+    ('firme', '/api/firme?type=deseuri&year={year}'), ('firme', '/api/firme?type=top'),
+    ('firme', '/api/firme?type=transporturi'), ('firme', '/api/firme?type=transporturi&year={year}'),
+    ('firme', '/api/firme?type=sofer_profile&sofer={sofer}'),
+    ('firme', '/api/firme?type=transportator_profile&transportator={transportator}'),
+    ('firme', '/api/firme?type=country_profile&country={country}'), ('firme', '/api/firme?type=yearly'),
+    ('firme', '/api/firme?type=profile&dim=firma&value=1'), ('firme', '/api/firme?type=profile&dim=deseu&value=CUPRU'),
+]
+
+
+def check_bench_url(url):
+    name = urlparse(url).path.lstrip('/')
+    if 'bench' not in name:
+        print(f"Refusing to use database '{name}': the benchmark DB name must contain 'bench'")
+        sys.exit(1)
+
+
+# ==== synthetic data ====
+
+def make_cnp(rng, sex, birth_year, county_code):
+    """Valid 13-digit CNP (control digit with weights 279146358279)."""
+    if birth_year >= 2000:
+        s = 5 if sex == 'M' else 6
+    else:
+        s = 1 if sex == 'M' else 2
+    body = f"{s}{birth_year % 100:02d}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{county_code}{rng.randint(1, 999):03d}"
+    total = sum(int(d) * int(w) for d, w in zip(body, '279146358279'))
+    control = total % 11
+    return body + str(1 if control == 10 else control)
+
+
+def _copy(cur, table, columns, rows):
+    """COPY rows into table (tab separated, None -> NULL)."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join('\\N' if v is None else str(v) for v in row))
+        buf.write('\n')
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+
+
+def gen_partners(rng, n):
+    partners, seen = [], set()
+    county_weights = [c[3] for c in COUNTIES]
+    while len(partners) < n:
+        code, county, cities, _ = rng.choices(COUNTIES, county_weights)[0]
+        sex = 'M' if rng.random() < 0.87 else 'F'
+        birth_year = rng.randint(1940, 2005)
+        cnp = make_cnp(rng, sex, birth_year, code)
+        if cnp in seen:
+            continue
+        seen.add(cnp)
+        first = rng.choice(FIRST_NAMES_M if sex == 'M' else FIRST_NAMES_F)
+        last = rng.choice(LAST_NAMES)
+        city = rng.choice(cities)
+        # A few partners share an address / family name on purpose
+        street = f"{rng.choice(STREETS)} nr. {rng.randint(1, 120 if rng.random() < 0.9 else 3)}"
+        partners.append((cnp, f'{last} {first}', city, county, street, birth_year, sex, code, county))
+    return partners
+
+
+def gen_weather(rng, d_from, d_to):
+    rows = []
+    d = d_from
+    while d <= d_to:
+        doy = d.timetuple().tm_yday
+        mean = 11 + 12 * math.sin(2 * math.pi * (doy - 110) / 365) + rng.gauss(0, 3)
+        wet = rng.random() < 0.3
+        rain = round(rng.expovariate(1 / 6), 2) if wet else 0.0
+        snow = round(rain * 0.7, 2) if wet and mean < 0 else 0.0
+        rain = 0.0 if snow else rain
+        code = 71 if snow else (63 if rain > 10 else 61 if rain > 0 else rng.choice([0, 1, 2, 3]))
+        rows.append((d, round(mean + 5, 2), round(mean - 5, 2), round(mean, 2), round(mean + 4, 2), round(mean - 7, 2),
+                     round(mean - 1, 2), round(rain + snow, 2), rain, snow, round(snow * 2, 2), round(min(24, rain), 1),
+                     round(rng.uniform(5, 40), 2), round(rng.uniform(10, 70), 2), rng.randint(0, 359),
+                     round(max(1, 12 + 10 * math.sin(2 * math.pi * (doy - 80) / 365)), 2),
+                     round(rng.uniform(0, 40000), 1), round(43200 + 15000 * math.sin(2 * math.pi * (doy - 80) / 365), 1),
+                     round(rng.uniform(0.5, 6), 2), round(rng.uniform(995, 1030), 2), round(rng.uniform(40, 95), 1),
+                     round(rng.uniform(0, 100), 1), code))
+        d += timedelta(days=1)
+    return rows
+
+
+def seed(args):
+    from seed_holidays import generate_holidays
+    from refresh_rollups import refresh
+
+    check_bench_url(args.db_url)
+    rng = random.Random(args.seed)
+    d_from = date(args.year_from, 1, 1)
+    d_to = date(args.year_to, 12, 31)
+    t0 = time.perf_counter()
+
+    conn = psycopg2.connect(args.db_url)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+        cur.execute((ROOT / 'scripts' / 'bench_schema.sql').read_text())
+        for sql_path in sorted((ROOT / 'scripts' / 'migrations').glob('*.sql')):
+            cur.execute(sql_path.read_text())
+            print(f"  migration {sql_path.name}")
+    conn.autocommit = False
+    cur = conn.cursor()
+
+    # Reference data
+    _copy(cur, 'waste_categories', ['id', 'name'], [(c[0], c[1]) for c in CATEGORIES])
+    _copy(cur, 'waste_types', ['id', 'category_id', 'name'], WASTE_TYPES)
+    cur.execute("SELECT setval('waste_categories_id_seq', 100), setval('waste_types_id_seq', 100)")
+
+    holidays = list(generate_holidays(args.year_from, args.year_to))
+    _copy(cur, 'holidays', ['date', 'name', 'type', 'is_official'], holidays)
+    closed = {h[0] for h in holidays if h[3]}
+    closures = [(date(y, 12, d), 'Inventar', 'true') for y in range(args.year_from, args.year_to + 1) for d in range(27, 32)]
+    _copy(cur, 'company_closures', ['date', 'reason', 'detected_automatically'], closures)
+    closed |= {c[0] for c in closures}
+
+    weather = gen_weather(rng, d_from, d_to)
+    _copy(cur, 'weather_oradea', [
+        'date', 'temp_max', 'temp_min', 'temp_mean', 'apparent_temp_max', 'apparent_temp_min', 'apparent_temp_mean',
+        'precipitation_sum', 'rain_sum', 'snowfall_sum', 'snow_depth_max', 'precipitation_hours',
+        'wind_speed_max', 'wind_gusts_max', 'wind_direction_dominant', 'shortwave_radiation_sum',
+        'sunshine_duration', 'daylight_duration', 'et0_evapotranspiration',
+        'pressure_mean', 'humidity_mean', 'cloudcover_mean', 'weather_code'], weather)
+    rain_by_day = {w[0]: w[8] for w in weather}
+
+    # Partners
+    partners = gen_partners(rng, int(BASE_PARTNERS * args.scale))
+    _copy(cur, 'partners', ['cnp', 'name', 'city', 'county', 'street', 'birth_year', 'sex', 'county_code_cnp', 'county_from_cnp'],
+          partners)
+    cnps = [p[0] for p in partners]
+    print(f"  {len(partners)} partners, {len(weather)} weather days, {len(holidays)} holidays")
+
+    # Transactions + items, day by day
+    cat_weights = [c[3] for c in CATEGORIES]
+    types_by_cat = {}
+    for wid, cid, _ in WASTE_TYPES:
+        types_by_cat.setdefault(cid, []).append(wid)
+    doc_no = 100000
+    n_tx = n_items = 0
+    d = d_from
+    while d <= d_to:
+        if d.weekday() == 6 or d in closed:
+            d += timedelta(days=1)
+            continue
+        factor = (0.6 if d.weekday() == 5 else 1.0) * (1 + 0.2 * math.sin(2 * math.pi * (d.timetuple().tm_yday - 100) / 365))
+        if rain_by_day.get(d, 0) > 5:
+            factor *= 0.8
+        n_day = max(1, int(rng.gauss(BASE_TX_PER_DAY * args.scale * factor, 8 * math.sqrt(args.scale))))
+        txs, items = [], []
+        for _ in range(n_day):
+            doc_no += 1
+            doc = f'PJ-{doc_no}'
+            # Skewed: a minority of regulars bring most of the material
+            cnp = cnps[int(len(cnps) * rng.random() ** 3)]
+            gross = 0.0
+            for _ in range(1 + (rng.random() < 0.7) + (rng.random() < 0.3)):
+                cid, _, price, _, kg = rng.choices(CATEGORIES, cat_weights)[0]
+                weight = round(max(0.5, rng.lognormvariate(math.log(kg), 0.8)), 2)
+                unit = round(price * rng.uniform(0.9, 1.1), 2)
+                value = round(weight * unit, 2)
+                gross += value
+                items.append((doc, rng.choice(types_by_cat[cid]), unit, weight, value))
+            gross = round(gross, 2)
+            env_tax = round(gross * 0.02, 2)
+            income_tax = round(gross * 0.01, 2)
+            txs.append((doc, d, cnp, 'Numerar' if rng.random() < 0.9 else 'Ordin plata', None,
+                        gross, env_tax, income_tax, round(gross - env_tax - income_tax, 2)))
+        _copy(cur, 'transactions', ['document_id', 'date', 'cnp', 'payment_type', 'iban', 'gross_value', 'env_tax', 'income_tax', 'net_paid'], txs)
+        _copy(cur, 'transaction_items', ['document_id', 'waste_type_id', 'price_per_kg', 'weight_kg', 'value'], items)
+        n_tx += len(txs)
+        n_items += len(items)
+        d += timedelta(days=1)
+    print(f"  {n_tx} transactions, {n_items} items")
+
+    # B2B: firme, vanzari, summaries, transports
+    firme = [(i, f'FIRMA {i:03d} SRL', f'FIRMA {i:03d}', rng.choice(COUNTRIES), None) for i in range(1, 78)]
+    _copy(cur, 'firme', ['id', 'name', 'name_normalized', 'country', 'city'], firme)
+    cur.execute("SELECT setval('firme_id_seq', 1000)")
+    days = [d_from + timedelta(days=i) for i in range((d_to - d_from).days + 1)]
+    vanzari = []
+    for i in range(int(BASE_VANZARI * args.scale)):
+        dv = rng.choice(days)
+        _, cat, price, _, _ = rng.choices(CATEGORIES, cat_weights)[0]
+        firma_id = int(77 * rng.random() ** 2) + 1
+        qty = round(rng.uniform(1000, 25000), 2)
+        loss = round(qty * rng.uniform(0, 0.02), 2)
+        received = round(qty - loss, 2)
+        buy = round(price * rng.uniform(0.95, 1.05), 4)
+        sell = round(buy * rng.uniform(1.03, 1.15), 4)
+        value = round(received * sell, 2)
+        margin = round(value - qty * buy, 2)
+        has_details = rng.random() < 0.6
+        transport = round(rng.uniform(500, 6000), 2) if has_details else None
+        vanzari.append((firma_id, dv, dv.year, dv.month, f'AV-{i + 1}', cat.upper(), qty, buy, loss, round(loss * buy, 2),
+                        received, sell, value, round(value / 4.97, 2), margin, transport,
+                        round(margin - (transport or 0), 2),
+                        f'BH-{rng.randint(10, 99)}-PAJ' if has_details else None,
+                        rng.choice(DRIVERS) if has_details else None,
+                        rng.choice(COUNTRIES) if has_details else None,
+                        rng.choice(TRANSPORTERS) if has_details else None))
+    _copy(cur, 'vanzari', ['firma_id', 'data', 'year', 'month', 'numar_aviz', 'tip_deseu', 'cantitate_livrata',
+                           'pret_achizitie', 'scazamant_kg', 'scazamant_ron', 'cantitate_receptionata', 'pret_vanzare',
+                           'valoare_ron', 'valoare_euro', 'adaos', 'transport_ron', 'adaos_final',
+                           'numar_auto', 'nume_sofer', 'tara_destinatie', 'transportator'], vanzari)
+    cur.execute("""
+        INSERT INTO sumar_deseuri (year, month, tip_deseu, cantitate_kg, valoare_ron, adaos_ron, procent_vanzari, procent_profit)
+        SELECT year, month, tip_deseu, SUM(cantitate_livrata), SUM(valoare_ron), SUM(adaos),
+               SUM(valoare_ron) / NULLIF(SUM(SUM(valoare_ron)) OVER (PARTITION BY year, month), 0),
+               SUM(adaos) / NULLIF(SUM(valoare_ron), 0)
+        FROM vanzari GROUP BY year, month, tip_deseu
+    """)
+    transports = []
+    for _ in range(int(BASE_TRANSPORTURI * args.scale)):
+        dv = rng.choice(days)
+        net = round(rng.uniform(1000, 8000), 2)
+        transports.append((dv.year, dv.month, rng.choice(['SLATINA', 'ARAD', 'CLUJ', 'BUDAPESTA']),
+                           f'FIRMA {rng.randint(1, 77):03d} SRL', 'Transport deseuri', net, round(net * 0.19, 2),
+                           round(net * 1.19, 2), rng.choice(TRANSPORTERS)))
+    _copy(cur, 'transporturi_firme', ['year', 'month', 'destinatie', 'firma_name', 'descriere', 'suma_fara_tva', 'tva', 'total', 'transportator'],
+          transports)
+    conn.commit()
+    print(f"  {len(vanzari)} vanzari, {len(transports)} transporturi")
+
+    print("Rollups:")
+    refresh(conn, args.year_from, args.year_to, b2b=True)
+    conn.commit()
+    conn.autocommit = True
+    with conn.cursor() as c2:
+        c2.execute("ANALYZE")
+    conn.close()
+    print(f"Seeded {args.db_url} (scale {args.scale}, seed {args.seed}) in {time.perf_counter() - t0:.1f}s")
+
+
+# ==== in-process handler runs ====
+
+def load_handler(name):
+    spec = importlib.util.spec_from_file_location(f'paju_api_{name}', ROOT / 'api' / f'{name}.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+
+def invoke(handler_cls, path):
+    """Run handler.do_GET for path without a socket. Returns (status, headers, body, ms)."""
+    h = handler_cls.__new__(handler_cls)
+    h.path = path
+    h.command = 'GET'
+    h.request_version = 'HTTP/1.1'
+    h.requestline = f'GET {path} HTTP/1.1'
+    h.client_address = ('127.0.0.1', 0)
+    h.close_connection = True
+    h.headers = {}
+    h.rfile = io.BytesIO()
+    h.wfile = io.BytesIO()
+    h.log_message = lambda *a, **k: None
+    t0 = time.perf_counter()
+    h.do_GET()
+    ms = (time.perf_counter() - t0) * 1000
+    head, _, body = h.wfile.getvalue().partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = dict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+    return status, headers, body, ms
+
+
+def query_count(headers):
+    """Number of queries from the Server-Timing header (db;dur=..;desc="N queries")."""
+    timing = headers.get('Server-Timing', '')
+    marker = 'desc="'
+    i = timing.find(marker)
+    if i < 0:
+        return None
+    return int(timing[i + len(marker):].split(' ', 1)[0])
+
+
+def placeholders(db_url):
+    conn = psycopg2.connect(db_url)
+    with conn.cursor() as cur:
+        cur.execute("SELECT cnp FROM transactions GROUP BY cnp ORDER BY COUNT(*) DESC, cnp LIMIT 1")
+        cnp = cur.fetchone()[0]
+        cur.execute("SELECT document_id FROM transactions WHERE cnp = %s ORDER BY date DESC LIMIT 1", (cnp,))
+        document_id = cur.fetchone()[0]
+        cur.execute("SELECT date FROM transactions GROUP BY date ORDER BY COUNT(*) DESC, date LIMIT 1")
+        busy_day = cur.fetchone()[0]
+        cur.execute("SELECT EXTRACT(YEAR FROM MAX(date))::int - 1 FROM transactions")
+        year = cur.fetchone()[0]
+        values = {'cnp': cnp, 'document_id': document_id, 'busy_day': busy_day, 'year': year}
+        for key, column in (('sofer', 'nume_sofer'), ('transportator', 'transportator'), ('country', 'tara_destinatie')):
+            cur.execute(f"SELECT {column} FROM vanzari WHERE {column} IS NOT NULL GROUP BY 1 ORDER BY COUNT(*) DESC, 1 LIMIT 1")
+            values[key] = cur.fetchone()[0]
+    conn.close()
+    return {k: quote(str(v)) for k, v in values.items()}
+
+
+def check_pool_reuse():
+    """Two fan-out tasks in a row must run on the same pooled backend, not reconnect."""
+    pid = lambda cur: (cur.execute("SELECT pg_backend_pid() AS pid"), cur.fetchone()['pid'])[1]
+    first, _ = parallel._run(pid)
+    second, _ = parallel._run(pid)
+    if first != second:
+        sys.exit(f"Fan-out pool reconnected between tasks (backend {first} -> {second})")
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile."""
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def run(args):
+    check_bench_url(args.db_url)
+    for var in ('DATABASE_URL', 'POSTGRES_URL_NO_SSL'):
+        os.environ.pop(var, None)
+    os.environ['POSTGRES_URL'] = args.db_url
+    os.environ.setdefault('PAJU_SLOW_QUERY_MS', '1e9')   # keep query_log writes out of the timings
+
+    check_pool_reuse()
+    values = placeholders(args.db_url)
+    handlers = {}
+    results = {}
+    for module, template in ENDPOINTS:
+        if args.only and not any(o in template for o in args.only):
+            continue
+        path = template.format(**values)
+        name = template.split('/api/', 1)[1]
+        if module not in handlers:
+            handlers[module] = load_handler(module)
+        timings = []
+        status = queries = None
+        error = None
+        for i in range(args.repeat + 1):     # first call warms the pool / caches
+            status, headers, body, ms = invoke(handlers[module], path)
+            if i:
+                timings.append(ms)
+            queries = query_count(headers)
+            if status != 200:
+                error = json.loads(body or b'{}').get('error')
+                break
+        timings.sort()
+        results[name] = {
+            'status': status,
+            'p50_ms': round(percentile(timings, 50), 1) if timings else None,
+            'p95_ms': round(percentile(timings, 95), 1) if timings else None,
+            'queries': queries,
+        }
+        if error:
+            results[name]['error'] = error
+        print(f"  {name[:70]:70} {results[name]['p50_ms'] or 0:9.1f} {results[name]['p95_ms'] or 0:9.1f} "
+              f"{queries if queries is not None else '-':>4}  {status}{' ' + error[:60] if error else ''}")
+
+    report = {
+        'meta': {'scale_hint': args.scale_hint, 'repeat': args.repeat, 'created': time.strftime('%Y-%m-%d %H:%M:%S')},
+        'endpoints': results,
+    }
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"Saved {args.save}")
+    if args.baseline:
+        sys.exit(compare(json.loads(Path(args.baseline).read_text()), report, args.tolerance))
+
+
+def compare(baseline, current, tolerance):
+    """Print p50 / query-count deltas; returns 1 if anything regressed."""
+    regressions = 0
+    print()
+    print(f"  {'endpoint':70} {'base p50':>9} {'now p50':>9} {'delta':>7}  queries")
+    for name, now in current['endpoints'].items():
+        base = baseline['endpoints'].get(name)
+        if not base or base.get('p50_ms') is None or now.get('p50_ms') is None:
+            continue
+        delta = (now['p50_ms'] - base['p50_ms']) / base['p50_ms'] * 100 if base['p50_ms'] else 0
+        # Ignore sub-5ms noise on fast endpoints
+        slower = delta > tolerance and now['p50_ms'] - base['p50_ms'] > 5
+        more_queries = (now.get('queries') or 0) > (base.get('queries') or 0)
+        flag = ' <-- REGRESSION' if slower or more_queries or now['status'] != 200 else ''
+        regressions += bool(flag)
+        print(f"  {name[:70]:70} {base['p50_ms']:9.1f} {now['p50_ms']:9.1f} {delta:+6.0f}%  "
+              f"{base.get('queries')}->{now.get('queries')}{flag}")
+    print(f"{regressions} regression(s) (tolerance {tolerance:.0f}%)")
+    return 1 if regressions else 0
+
+
+# ==== JSON serialization (offline) ====
+
+RESIDUAL_WEATHER = ['temp_max', 'temp_min', 'temp_mean', 'precipitation_sum', 'rain_sum', 'snowfall_sum',
+                    'snow_depth_max', 'wind_speed_max', 'wind_gusts_max', 'pressure_mean', 'humidity_mean',
+                    'cloudcover_mean']
+
+
+def residuals_wire(days, rng):
+    """The daily aggregate of /api/weather as Postgres sends it (text):
+    [(date, dow, kg, {weather field: value})] for `days` open days."""
+    out = []
+    d = date(2021, 1, 4)
+    while len(out) < days:
+        if d.isoweekday() != 7:
+            weather = {f: f'{rng.uniform(-15, 40):.2f}' for f in RESIDUAL_WEATHER}
+            out.append((d.isoformat(), d.isoweekday(), f'{rng.uniform(2000, 40000):.2f}', weather))
+        d += timedelta(days=1)
+    return out
+
+
+def residuals_payload(wire, numeric):
+    """Cast the wire rows with the NUMERIC caster `numeric` (DATE stays a date, like
+    the weather handler) and build the residuals response the way weatherdaily does."""
+    date_cast = psycopg2.extensions.PYDATE
+    rows = [{'date': date_cast(d, None), 'dow': dow, 'value': numeric(v, None), 'weather_code': 3,
+             **{f: numeric(t, None) for f, t in w.items()}} for d, dow, v, w in wire]
+    by_date = {r['date']: float(r['value']) for r in rows}
+    for r in rows:
+        r['baseline'] = baseline = weatherdaily.weekday_baseline(by_date, r['date'])
+        r['residual'] = float(r['value']) - baseline if baseline is not None else None
+        r['residual_pct'] = r['residual'] / baseline * 100.0 if baseline else None
+    return {'metric': 'kg', 'residuals': rows}
+
+
+def _median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return percentile(sorted(timings), 50), result
+
+
+def serialize_bench(args):
+    wire = residuals_wire(args.days, random.Random(args.seed))
+    stdlib = json.JSONEncoder(default=serialize.default, ensure_ascii=False, separators=(',', ':'))
+    paths = [
+        # (label, NUMERIC caster, encoder)
+        ('default types + json.dumps', psycopg2.extensions.DECIMAL,
+         lambda p: json.dumps(p, default=serialize.default).encode('utf-8')),
+        ('casters + stdlib fallback', serialize.NUMERIC_FLOAT, lambda p: stdlib.encode(p).encode('utf-8')),
+        (f"casters + serialize.dumps ({'orjson' if serialize.orjson else 'stdlib'})",
+         serialize.NUMERIC_FLOAT, serialize.dumps),
+    ]
+    print(f"Residuals payload: {args.days} days x {len(RESIDUAL_WEATHER) + 8} fields, median of {args.repeat}")
+    print(f"  {'path':42} {'rows ms':>9} {'encode ms':>10} {'total ms':>9} {'KB':>7}")
+    decoded = None
+    body = None
+    for label, numeric, encode in paths:
+        rows_ms, payload = _median_ms(lambda: residuals_payload(wire, numeric), args.repeat)
+        encode_ms, body = _median_ms(lambda: encode(payload), args.repeat)
+        if decoded is None:
+            decoded = json.loads(body)
+        elif json.loads(body) != decoded:
+            print(f"  {label}: output differs from the default path")
+            sys.exit(1)
+        print(f"  {label:42} {rows_ms:9.1f} {encode_ms:10.1f} {rows_ms + encode_ms:9.1f} {len(body) / 1024:7.0f}")
+    for encoding in ('gzip', 'br'):
+        if encoding == 'br' and serialize.brotli is None:
+            print("  br: brotli not installed")
+            continue
+        ms, (compressed, _) = _median_ms(lambda: serialize.encode(body, encoding), args.repeat)
+        print(f"  {encoding:42} {'':9} {ms:10.1f} {'':9} {len(compressed) / 1024:7.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db-url', default=os.environ.get('BENCH_DATABASE_URL', DEFAULT_DB_URL))
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_seed = sub.add_parser('seed', help='(Re)create the synthetic benchmark DB')
+    p_seed.add_argument('--scale', type=float, default=1.0, help='1 = production volume, e.g. 5 or 20')
+    p_seed.add_argument('--year-from', type=int, default=2022)
+    p_seed.add_argument('--year-to', type=int, default=2025)
+    p_seed.add_argument('--seed', type=int, default=42)
+    p_run = sub.add_parser('run', help='Benchmark every endpoint in-process')
+    p_run.add_argument('--repeat', type=int, default=5)
+    p_run.add_argument('--only', nargs='*', help='Substrings of endpoint paths to run')
+    p_run.add_argument('--save', help='Write the results as a JSON baseline')
+    p_run.add_argument('--baseline', help='Compare against a saved baseline')
+    p_run.add_argument('--tolerance', type=float, default=20.0, help='Allowed p50 slowdown in %%')
+    p_run.add_argument('--scale-hint', default='1x', help='Recorded in the JSON meta only')
+    p_ser = sub.add_parser('serialize', help='Benchmark fetch casts + JSON encoding of the residuals payload (no DB)')
+    p_ser.add_argument('--days', type=int, default=1700)
+    p_ser.add_argument('--repeat', type=int, default=7)
+    p_ser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    {'seed': seed, 'run': run, 'serialize': serialize_bench}[args.command](args)
@@ -1,22 +1,38 @@
 # scripts/fetch_weather.py
-"""Fetch historical daily weather for Oradea and upsert into weather_oradea.
+"""Fetch historical daily weather for Oradea and upsert into weather_oradea,
+or (--forecast) refresh the cached 7-day forecast in weather_forecast.
+
+The range is fetched in month-sized chunks, a few at a time, each chunk's
+daily and hourly requests in parallel, with retry and exponential backoff.
+OPEN_METEO_ARCHIVE_URL points the fetcher at a local fake server for tests.
 
 Usage:
   python scripts/fetch_weather.py --self-test
-  python scripts/fetch_weather.py
+  python scripts/fetch_weather.py                           # full backfill from 2022-01-01
+  python scripts/fetch_weather.py --incremental             # from MAX(date) in weather_oradea (nightly)
   python scripts/fetch_weather.py --date-from 2026-04-01 --date-to 2026-04-17
+  python scripts/fetch_weather.py --forecast
 """
-import argparse, json, os, sys
+import argparse, json, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
 from pathlib import Path
+from urllib.error import HTTPError
 from urllib.parse import urlencode
 from urllib.request import urlopen, Request
 
 import psycopg2
+from psycopg2.extras import execute_values
+
+sys.path.append(str(Path(__file__).parent.parent / "api"))
+from _lib import openmeteo, weatherparse
 
 LAT, LON = 47.0722, 21.9217
 TIMEZONE = "Europe/Bucharest"
-BASE = "https://archive-api.open-meteo.com/v1/archive"
+BASE = os.environ.get("OPEN_METEO_ARCHIVE_URL", "https://archive-api.open-meteo.com/v1/archive")
+WORKERS = 4          # chunks in flight (x2 requests each)
+RETRIES = 4
+BACKOFF = 2.0        # seconds, doubled after every failed attempt
 
 DAILY_FIELDS = [
     "temperature_2m_max", "temperature_2m_min", "temperature_2m_mean",
@@ -26,7 +42,7 @@ DAILY_FIELDS = [
     "shortwave_radiation_sum", "sunshine_duration", "daylight_duration",
     "et0_fao_evapotranspiration", "weather_code", "snow_depth_max",
 ]
-HOURLY_FIELDS = ["pressure_msl", "relativehumidity_2m", "cloudcover"]
+HOURLY_FIELDS = list(weatherparse.HOURLY_MEANS)
 
 COLUMN_MAP = {
     "temperature_2m_max": "temp_max",
@@ -61,11 +77,42 @@ def load_env_local():
             os.environ.setdefault(k, v.strip().strip('"').strip("'"))
 
 def _get_json(url):
-    req = Request(url, headers={"User-Agent": "paju-dashboard/1.0"})
-    with urlopen(req, timeout=60) as r:
-        return json.loads(r.read().decode("utf-8"))
-
-def fetch_range(date_from, date_to):
+    delay = BACKOFF
+    for attempt in range(RETRIES):
+        try:
+            req = Request(url, headers={"User-Agent": "paju-dashboard/1.0"})
+            with urlopen(req, timeout=60) as r:
+                return json.loads(r.read().decode("utf-8"))
+        except (HTTPError, OSError) as e:
+            # 4xx other than 429 (rate limit) will not succeed on retry
+            if isinstance(e, HTTPError) and 400 <= e.code < 500 and e.code != 429:
+                raise
+            if attempt == RETRIES - 1:
+                raise
+            time.sleep(delay)
+            delay *= 2
+
+def month_chunks(date_from, date_to):
+    """[(first, last)] calendar-month slices covering date_from..date_to."""
+    chunks = []
+    start = date_from
+    while start <= date_to:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        end = min(date_to, next_month - timedelta(days=1))
+        chunks.append((start, end))
+        start = next_month
+    return chunks
+
+def fetch_range(date_from, date_to, workers=WORKERS):
+    """Rows for date_from..date_to, fetched month by month with bounded parallelism."""
+    chunks = month_chunks(date_from, date_to)
+    if len(chunks) == 1:
+        return fetch_chunk(*chunks[0])
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as ex:
+        parts = list(ex.map(lambda c: fetch_chunk(*c), chunks))
+    return [row for part in parts for row in part]
+
+def fetch_chunk(date_from, date_to):
     daily_q = {
         "latitude": LAT, "longitude": LON, "timezone": TIMEZONE,
         "start_date": date_from.isoformat(), "end_date": date_to.isoformat(),
@@ -76,38 +123,13 @@ def fetch_range(date_from, date_to):
         "start_date": date_from.isoformat(), "end_date": date_to.isoformat(),
         "hourly": ",".join(HOURLY_FIELDS),
     }
-    daily_resp = _get_json(BASE + "?" + urlencode(daily_q))
-    hourly_resp = _get_json(BASE + "?" + urlencode(hourly_q))
-
-    d_dates = daily_resp["daily"]["time"]
-    per_day = {}
-    for api_field, col in COLUMN_MAP.items():
-        arr = daily_resp["daily"].get(api_field, [None] * len(d_dates))
-        for i, dstr in enumerate(d_dates):
-            per_day.setdefault(dstr, {})[col] = arr[i] if i < len(arr) else None
-
-    h_times = hourly_resp["hourly"]["time"]
-    h_by_day = {}
-    for api_field in HOURLY_FIELDS:
-        arr = hourly_resp["hourly"].get(api_field, [None] * len(h_times))
-        for i, tstr in enumerate(h_times):
-            day = tstr[:10]
-            if arr[i] is None:
-                continue
-            h_by_day.setdefault(day, {}).setdefault(api_field, []).append(arr[i])
-
-    hourly_col = {
-        "pressure_msl": "pressure_mean",
-        "relativehumidity_2m": "humidity_mean",
-        "cloudcover": "cloudcover_mean",
-    }
-    for dstr, fields in h_by_day.items():
-        target = per_day.setdefault(dstr, {})
-        for api_field, col in hourly_col.items():
-            vals = fields.get(api_field, [])
-            if vals:
-                target[col] = round(sum(vals) / len(vals), 2)
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        daily_f = ex.submit(_get_json, BASE + "?" + urlencode(daily_q))
+        hourly_f = ex.submit(_get_json, BASE + "?" + urlencode(hourly_q))
+        daily_resp, hourly_resp = daily_f.result(), hourly_f.result()
 
+    per_day = weatherparse.daily_values(daily_resp, COLUMN_MAP)
+    weatherparse.hourly_means(hourly_resp, weatherparse.HOURLY_MEANS, per_day)
     return [{"date": d, **per_day[d]} for d in sorted(per_day)]
 
 def upsert(rows):
@@ -122,10 +144,9 @@ def upsert(rows):
         "daylight_duration", "et0_evapotranspiration", "pressure_mean",
         "humidity_mean", "cloudcover_mean", "weather_code",
     ]
-    placeholders = ", ".join(["%s"] * len(cols))
     update_clauses = ", ".join([f"{c} = EXCLUDED.{c}" for c in cols if c != "date"])
     sql = (
-        f"INSERT INTO weather_oradea ({', '.join(cols)}) VALUES ({placeholders}) "
+        f"INSERT INTO weather_oradea ({', '.join(cols)}) VALUES %s "
         f"ON CONFLICT (date) DO UPDATE SET {update_clauses}, fetched_at = now()"
     )
     url = os.environ.get("POSTGRES_URL")
@@ -134,11 +155,34 @@ def upsert(rows):
     conn = psycopg2.connect(url)
     with conn.cursor() as cur:
         values = [tuple(row.get(c) for c in cols) for row in rows]
-        cur.executemany(sql, values)
+        execute_values(cur, sql, values, page_size=1000)
     conn.commit()
     conn.close()
     return len(rows)
 
+def last_fetched_date():
+    """MAX(date) in weather_oradea, None when the table is empty."""
+    url = os.environ.get("POSTGRES_URL")
+    if not url:
+        raise RuntimeError("POSTGRES_URL not set")
+    conn = psycopg2.connect(url)
+    with conn.cursor() as cur:
+        cur.execute("SELECT MAX(date) FROM weather_oradea")
+        last = cur.fetchone()[0]
+    conn.close()
+    return last
+
+def refresh_forecast():
+    url = os.environ.get("POSTGRES_URL")
+    if not url:
+        raise RuntimeError("POSTGRES_URL not set")
+    conn = psycopg2.connect(url)
+    with conn.cursor() as cur:
+        n = openmeteo.refresh(cur)
+    conn.commit()
+    conn.close()
+    return n
+
 def self_test():
     d = date.today() - timedelta(days=14)
     rows = fetch_range(d, d)
@@ -152,6 +196,9 @@ def self_test():
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--self-test", action="store_true")
+    p.add_argument("--forecast", action="store_true", help="refresh weather_forecast instead of the archive")
+    p.add_argument("--incremental", action="store_true", help="start from MAX(date) in weather_oradea")
+    p.add_argument("--workers", type=int, default=WORKERS, help="month chunks fetched concurrently")
     p.add_argument("--date-from", type=lambda s: datetime.fromisoformat(s).date(), default=date(2022, 1, 1))
     p.add_argument("--date-to", type=lambda s: datetime.fromisoformat(s).date(), default=date.today() - timedelta(days=1))
     args = p.parse_args()
@@ -161,8 +208,23 @@ def main():
         return
 
     load_env_local()
+    if args.forecast:
+        n = refresh_forecast()
+        if n is None:
+            print("Forecast fetch failed, cache left unchanged"); sys.exit(1)
+        print(f"Cached {n} forecast days")
+        return
+
+    if args.incremental:
+        # The last stored day is fetched again: the archive may have revised it
+        last = last_fetched_date()
+        if last is not None:
+            args.date_from = last
+    if args.date_from > args.date_to:
+        print(f"Up to date ({args.date_from} > {args.date_to})")
+        return
     print(f"Fetching {args.date_from} -> {args.date_to}")
-    rows = fetch_range(args.date_from, args.date_to)
+    rows = fetch_range(args.date_from, args.date_to, args.workers)
     n = upsert(rows)
     print(f"Upserted {n} weather rows")
 
@@ -24,6 +24,8 @@ import pandas as pd
 import psycopg2
 from psycopg2.extras import RealDictCursor, execute_values
 
+from refresh_rollups import refresh as refresh_rollups
+
 # ==== Romanian county code → name (positions 8-9 of CNP) ====
 COUNTY_BY_CODE = {
     "01": "Alba", "02": "Arad", "03": "Arges", "04": "Bacau", "05": "Bihor",
@@ -502,6 +504,7 @@ def main():
     total_txs = 0
     total_items = 0
     corrupted = []
+    touched_dates = set()
 
     pending_commit = 0
     for f in iter_xls_files(args.target):
@@ -531,6 +534,7 @@ def main():
             total_partners += n_p
             total_txs += n_t
             total_items += n_i
+            touched_dates.update(t["date"] for t in txs)
             pending_commit += 1
             if pending_commit >= args.commit_every:
                 conn.commit()
@@ -545,6 +549,15 @@ def main():
     if pending_commit > 0 and not args.dry_run:
         conn.commit()
 
+    if touched_dates:
+        try:
+            print("Rollups:")
+            refresh_rollups(conn, min(touched_dates).year, max(touched_dates).year)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"  [ROLLUP ERROR] {e} — ruleaza scripts/refresh_rollups.py")
+
     print()
     print("==== SUMMARY ====")
     print(f"Files processed: {total_files}")
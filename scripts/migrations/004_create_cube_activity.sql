@@ -0,0 +1,99 @@
+-- scripts/migrations/004_create_cube_activity.sql
+-- Pre-aggregated activity cube at (year, month, category, county, sex, age_group).
+-- category_id = 0 rows hold document-level totals across all categories; the
+-- other rows hold, per waste category, the documents that contain at least one
+-- item of that category. Unknown dimension values use sentinels ('Necunoscut',
+-- '') so they can be part of the primary key.
+CREATE TABLE IF NOT EXISTS cube_activity (
+  year SMALLINT NOT NULL,
+  month SMALLINT NOT NULL,
+  category_id INT NOT NULL,
+  county VARCHAR(100) NOT NULL,
+  sex CHAR(1) NOT NULL,
+  age_group VARCHAR(12) NOT NULL,          -- age at transaction time
+  transactions INT NOT NULL,
+  gross_value NUMERIC(14,2) NOT NULL,
+  net_paid NUMERIC(14,2) NOT NULL,
+  items INT NOT NULL,
+  weight_kg NUMERIC(14,2) NOT NULL,
+  item_value NUMERIC(14,2) NOT NULL,
+  price_sum NUMERIC(14,2) NOT NULL,        -- SUM(price_per_kg), AVG = price_sum / items
+  day_mask INT NOT NULL,                   -- bit (d - 1) set when day d had activity
+  partners VARCHAR(13)[] NOT NULL,         -- distinct CNPs, merged by union
+  PRIMARY KEY (year, month, category_id, county, sex, age_group)
+);
+
+CREATE INDEX IF NOT EXISTS idx_cube_activity_month ON cube_activity(month, category_id);
+
+-- Rebuild the cube for a year range. Called by scripts/import_xls.py for the
+-- years it touched and by scripts/refresh_rollups.py for a full rebuild.
+CREATE OR REPLACE FUNCTION refresh_cube_activity(p_year_from INT, p_year_to INT)
+RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+  n INT;
+BEGIN
+  DELETE FROM cube_activity WHERE year BETWEEN p_year_from AND p_year_to;
+
+  WITH tx AS (
+    SELECT t.document_id, t.cnp, t.date,
+           COALESCE(t.gross_value, 0) AS gross_value,
+           COALESCE(t.net_paid, 0) AS net_paid,
+           EXTRACT(YEAR FROM t.date)::int AS year,
+           EXTRACT(MONTH FROM t.date)::int AS month,
+           COALESCE(p.county, 'Necunoscut') AS county,
+           COALESCE(p.sex, '') AS sex,
+           CASE
+             WHEN p.birth_year IS NULL OR p.birth_year = 0 THEN 'Necunoscut'
+             WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 25 THEN '18-24'
+             WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 35 THEN '25-34'
+             WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 45 THEN '35-44'
+             WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 55 THEN '45-54'
+             WHEN EXTRACT(YEAR FROM t.date) - p.birth_year < 65 THEN '55-64'
+             ELSE '65+'
+           END AS age_group
+    FROM transactions t
+    LEFT JOIN partners p ON p.cnp = t.cnp
+    WHERE t.date >= make_date(p_year_from, 1, 1)
+      AND t.date < make_date(p_year_to + 1, 1, 1)
+  ),
+  cat_items AS (
+    SELECT ti.document_id, wt.category_id,
+           COUNT(*) AS items,
+           COALESCE(SUM(ti.weight_kg), 0) AS weight_kg,
+           COALESCE(SUM(ti.value), 0) AS item_value,
+           COALESCE(SUM(ti.price_per_kg), 0) AS price_sum
+    FROM transaction_items ti
+    JOIN waste_types wt ON wt.id = ti.waste_type_id
+    JOIN tx ON tx.document_id = ti.document_id
+    GROUP BY ti.document_id, wt.category_id
+  ),
+  doc_items AS (
+    SELECT document_id, SUM(items) AS items, SUM(weight_kg) AS weight_kg,
+           SUM(item_value) AS item_value, SUM(price_sum) AS price_sum
+    FROM cat_items
+    GROUP BY document_id
+  )
+  INSERT INTO cube_activity
+  SELECT tx.year, tx.month, 0, tx.county, tx.sex, tx.age_group,
+         COUNT(*), SUM(tx.gross_value), SUM(tx.net_paid),
+         COALESCE(SUM(di.items), 0), COALESCE(SUM(di.weight_kg), 0),
+         COALESCE(SUM(di.item_value), 0), COALESCE(SUM(di.price_sum), 0),
+         bit_or(1 << (EXTRACT(DAY FROM tx.date)::int - 1)),
+         COALESCE(array_agg(DISTINCT tx.cnp) FILTER (WHERE tx.cnp IS NOT NULL), '{}')
+  FROM tx
+  LEFT JOIN doc_items di ON di.document_id = tx.document_id
+  GROUP BY tx.year, tx.month, tx.county, tx.sex, tx.age_group
+  UNION ALL
+  SELECT tx.year, tx.month, ci.category_id, tx.county, tx.sex, tx.age_group,
+         COUNT(*), SUM(tx.gross_value), SUM(tx.net_paid),
+         SUM(ci.items), SUM(ci.weight_kg), SUM(ci.item_value), SUM(ci.price_sum),
+         bit_or(1 << (EXTRACT(DAY FROM tx.date)::int - 1)),
+         COALESCE(array_agg(DISTINCT tx.cnp) FILTER (WHERE tx.cnp IS NOT NULL), '{}')
+  FROM tx
+  JOIN cat_items ci ON ci.document_id = tx.document_id
+  GROUP BY tx.year, tx.month, ci.category_id, tx.county, tx.sex, tx.age_group;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END;
+$$;
@@ -0,0 +1,16 @@
+-- scripts/migrations/005_create_partner_sketches.sql
+-- Mergeable distinct-partner sketches (HyperLogLog, see api/_lib/hll.py) per
+-- day and per month, for the whole population (dim = 'all') and per county,
+-- sex and waste category. n_exact is the exact distinct count of the cell.
+-- Built in Python by scripts/refresh_rollups.py (api/_lib/sketches.py).
+CREATE TABLE IF NOT EXISTS partner_sketches (
+  period_kind VARCHAR(5) NOT NULL,        -- 'day' | 'month'
+  period_start DATE NOT NULL,
+  dim VARCHAR(20) NOT NULL,               -- 'all' | 'county' | 'sex' | 'category'
+  dim_value VARCHAR(100) NOT NULL,        -- '' for dim = 'all'
+  n_exact INT NOT NULL,
+  sketch BYTEA NOT NULL,
+  PRIMARY KEY (period_kind, dim, dim_value, period_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_partner_sketches_start ON partner_sketches(period_start);
@@ -0,0 +1,17 @@
+-- scripts/migrations/006_create_query_log.sql
+-- Slow / failed queries recorded by api/_lib/querylog.py (threshold PAJU_SLOW_QUERY_MS).
+-- params holds only numbers and dates; every string parameter is stored as '<str>'.
+CREATE TABLE IF NOT EXISTS query_log (
+  id BIGSERIAL PRIMARY KEY,
+  logged_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  endpoint VARCHAR(100) NOT NULL,          -- e.g. /api/analytics?type=tops
+  fingerprint CHAR(12) NOT NULL,           -- md5 of the normalized SQL
+  query TEXT NOT NULL,                     -- normalized SQL (literals -> ?)
+  params TEXT,                             -- redacted JSON
+  duration_ms NUMERIC(10,1) NOT NULL,
+  row_count INT,
+  error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_query_log_fingerprint ON query_log(fingerprint, logged_at);
+CREATE INDEX IF NOT EXISTS idx_query_log_logged_at ON query_log(logged_at);
@@ -0,0 +1,90 @@
+-- scripts/migrations/007_populate_sumar_firme.sql
+-- Turns the (so far empty) sumar_firme table into the monthly B2B rollup of
+-- vanzari: one row per (year, month, firma_id). Average prices are weighted by
+-- the delivered / received quantity. Statement-level triggers on vanzari
+-- rebuild the months a statement touched, so the table stays current without
+-- a separate job; scripts/refresh_rollups.py rebuilds whole years.
+ALTER TABLE sumar_firme ADD COLUMN IF NOT EXISTS nr_vanzari INT NOT NULL DEFAULT 0;
+ALTER TABLE sumar_firme ADD COLUMN IF NOT EXISTS first_sale DATE;
+ALTER TABLE sumar_firme ADD COLUMN IF NOT EXISTS last_sale DATE;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sumar_firme_cell ON sumar_firme(year, month, firma_id);
+CREATE INDEX IF NOT EXISTS idx_sumar_firme_firma ON sumar_firme(firma_id);
+
+-- Rebuild the given months; p_periods holds year * 100 + month.
+CREATE OR REPLACE FUNCTION refresh_sumar_firme_months(p_periods INT[])
+RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+  n INT;
+BEGIN
+  DELETE FROM sumar_firme WHERE year * 100 + month = ANY(p_periods);
+
+  INSERT INTO sumar_firme (year, month, firma_id, nr_vanzari, first_sale, last_sale,
+                           cantitate_livrata, pret_mediu_achizitie, scazamant_kg, scazamant_ron,
+                           cantitate_receptionata, pret_mediu_vanzare, valoare_ron, valoare_euro,
+                           transport_ron, adaos, adaos_final)
+  SELECT year, month, firma_id, COUNT(*), MIN(data), MAX(data),
+         COALESCE(SUM(cantitate_livrata), 0),
+         SUM(pret_achizitie * cantitate_livrata) / NULLIF(SUM(cantitate_livrata) FILTER (WHERE pret_achizitie IS NOT NULL), 0),
+         COALESCE(SUM(scazamant_kg), 0), COALESCE(SUM(scazamant_ron), 0),
+         COALESCE(SUM(cantitate_receptionata), 0),
+         SUM(pret_vanzare * cantitate_receptionata) / NULLIF(SUM(cantitate_receptionata) FILTER (WHERE pret_vanzare IS NOT NULL), 0),
+         COALESCE(SUM(valoare_ron), 0), COALESCE(SUM(valoare_euro), 0),
+         COALESCE(SUM(transport_ron), 0), COALESCE(SUM(adaos), 0), COALESCE(SUM(adaos_final), 0)
+  FROM vanzari
+  WHERE year * 100 + month = ANY(p_periods)
+  GROUP BY year, month, firma_id;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END;
+$$;
+
+-- Rebuild a year range (used by scripts/refresh_rollups.py).
+CREATE OR REPLACE FUNCTION refresh_sumar_firme(p_year_from INT, p_year_to INT)
+RETURNS INT LANGUAGE sql AS $$
+  SELECT refresh_sumar_firme_months(ARRAY(
+    SELECT y * 100 + m
+    FROM generate_series(p_year_from, p_year_to) y, generate_series(1, 12) m
+  ));
+$$;
+
+-- Transition tables are only allowed on single-event triggers, hence three
+-- triggers sharing one function; it rebuilds every month seen in old or new rows.
+CREATE OR REPLACE FUNCTION sumar_firme_sync()
+RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+  periods INT[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    periods := ARRAY(SELECT DISTINCT year * 100 + month FROM new_rows);
+  ELSIF TG_OP = 'DELETE' THEN
+    periods := ARRAY(SELECT DISTINCT year * 100 + month FROM old_rows);
+  ELSE
+    periods := ARRAY(SELECT year * 100 + month FROM new_rows
+                     UNION SELECT year * 100 + month FROM old_rows);
+  END IF;
+  IF cardinality(periods) > 0 THEN
+    PERFORM refresh_sumar_firme_months(periods);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_vanzari_sumar_insert ON vanzari;
+CREATE TRIGGER trg_vanzari_sumar_insert AFTER INSERT ON vanzari
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION sumar_firme_sync();
+
+DROP TRIGGER IF EXISTS trg_vanzari_sumar_update ON vanzari;
+CREATE TRIGGER trg_vanzari_sumar_update AFTER UPDATE ON vanzari
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION sumar_firme_sync();
+
+DROP TRIGGER IF EXISTS trg_vanzari_sumar_delete ON vanzari;
+CREATE TRIGGER trg_vanzari_sumar_delete AFTER DELETE ON vanzari
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION sumar_firme_sync();
+
+-- Build the existing months; the triggers keep them current from here on
+SELECT refresh_sumar_firme(MIN(year), MAX(year)) FROM vanzari;
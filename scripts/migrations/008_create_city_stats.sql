@@ -0,0 +1,68 @@
+-- scripts/migrations/008_create_city_stats.sql
+-- Canonical city names. normalize_city() strips administrative prefixes
+-- ("Com.", "Comuna", "Oras", "Sat", "Mun.", "Municipiul", "Loc."), folds
+-- Romanian / Hungarian diacritics and normalizes case and spacing;
+-- partners.normalized_city is generated from it, so every insert / update of
+-- partners.city keeps it current. city_stats is the per-city rollup behind the
+-- Orase tab, with the most common partner county as the canonical county.
+CREATE OR REPLACE FUNCTION normalize_city(p_city TEXT)
+RETURNS TEXT LANGUAGE sql IMMUTABLE AS $$
+  SELECT NULLIF(initcap(trim(regexp_replace(
+           regexp_replace(
+             translate(trim(p_city),
+                       'ăâîșşțţĂÂÎȘŞȚŢáéíóöőúüűÁÉÍÓÖŐÚÜŰ',
+                       'aaissttAAISSTTaeiooouuuAEIOOOUUU'),
+             '^(comuna|com|orasul|oras|satul|sat|municipiul|mun|localitatea|loc)\.?\s+', '', 'i'),
+           '\s+', ' ', 'g'))), '');
+$$;
+
+ALTER TABLE partners ADD COLUMN IF NOT EXISTS normalized_city VARCHAR(150)
+  GENERATED ALWAYS AS (normalize_city(city)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_partners_normalized_city ON partners(normalized_city);
+
+CREATE TABLE IF NOT EXISTS city_stats (
+  normalized_city VARCHAR(150) PRIMARY KEY,
+  county VARCHAR(100),                     -- most common partner county for the city
+  partners INT NOT NULL,                   -- partners with at least one transaction
+  transactions INT NOT NULL,
+  total_kg NUMERIC(14,2) NOT NULL,
+  total_value NUMERIC(14,2) NOT NULL       -- SUM(transaction_items.value)
+);
+
+-- One row per city over all years, so the year range is ignored and the whole
+-- table is rebuilt (called by scripts/refresh_rollups.py and the importer).
+CREATE OR REPLACE FUNCTION refresh_city_stats(p_year_from INT, p_year_to INT)
+RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+  n INT;
+BEGIN
+  DELETE FROM city_stats;
+
+  INSERT INTO city_stats
+  WITH best_county AS (
+    SELECT DISTINCT ON (normalized_city) normalized_city, county
+    FROM partners
+    WHERE normalized_city IS NOT NULL AND county IS NOT NULL
+    GROUP BY normalized_city, county
+    ORDER BY normalized_city, COUNT(*) DESC, county
+  ),
+  doc_items AS (
+    SELECT document_id, SUM(weight_kg) AS kg, SUM(value) AS value
+    FROM transaction_items
+    GROUP BY document_id
+  )
+  SELECT p.normalized_city, bc.county,
+         COUNT(DISTINCT p.cnp), COUNT(*),
+         COALESCE(SUM(di.kg), 0), COALESCE(SUM(di.value), 0)
+  FROM partners p
+  JOIN transactions t ON t.cnp = p.cnp
+  JOIN doc_items di ON di.document_id = t.document_id
+  LEFT JOIN best_county bc ON bc.normalized_city = p.normalized_city
+  WHERE p.normalized_city IS NOT NULL
+  GROUP BY p.normalized_city, bc.county;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END;
+$$;
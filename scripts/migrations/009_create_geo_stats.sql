@@ -0,0 +1,75 @@
+-- scripts/migrations/009_create_geo_stats.sql
+-- Geographic rollup at (year, county, normalized city, category). As in
+-- cube_activity, category_id = 0 rows hold document-level totals and the other
+-- rows the documents containing that category; unknown county / city use the
+-- 'Necunoscut' / '' sentinels so they can be part of the primary key.
+CREATE TABLE IF NOT EXISTS geo_stats (
+  year SMALLINT NOT NULL,
+  county VARCHAR(100) NOT NULL,
+  normalized_city VARCHAR(150) NOT NULL,
+  category_id INT NOT NULL,
+  transactions INT NOT NULL,
+  gross_value NUMERIC(14,2) NOT NULL,      -- SUM(transactions.gross_value)
+  weight_kg NUMERIC(14,2) NOT NULL,
+  item_value NUMERIC(14,2) NOT NULL,       -- SUM(transaction_items.value)
+  partners VARCHAR(13)[] NOT NULL,         -- distinct CNPs, merged by union
+  PRIMARY KEY (year, county, normalized_city, category_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_geo_stats_category ON geo_stats(category_id, county);
+CREATE INDEX IF NOT EXISTS idx_geo_stats_city ON geo_stats(normalized_city, category_id);
+
+-- Rebuild a year range. Called by scripts/import_xls.py (through
+-- refresh_rollups) for the years it touched and by scripts/refresh_rollups.py.
+CREATE OR REPLACE FUNCTION refresh_geo_stats(p_year_from INT, p_year_to INT)
+RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+  n INT;
+BEGIN
+  DELETE FROM geo_stats WHERE year BETWEEN p_year_from AND p_year_to;
+
+  WITH tx AS (
+    SELECT t.document_id, t.cnp,
+           COALESCE(t.gross_value, 0) AS gross_value,
+           EXTRACT(YEAR FROM t.date)::int AS year,
+           COALESCE(p.county, 'Necunoscut') AS county,
+           COALESCE(p.normalized_city, '') AS normalized_city
+    FROM transactions t
+    LEFT JOIN partners p ON p.cnp = t.cnp
+    WHERE t.date >= make_date(p_year_from, 1, 1)
+      AND t.date < make_date(p_year_to + 1, 1, 1)
+  ),
+  cat_items AS (
+    SELECT ti.document_id, wt.category_id,
+           COALESCE(SUM(ti.weight_kg), 0) AS weight_kg,
+           COALESCE(SUM(ti.value), 0) AS item_value
+    FROM transaction_items ti
+    JOIN waste_types wt ON wt.id = ti.waste_type_id
+    JOIN tx ON tx.document_id = ti.document_id
+    GROUP BY ti.document_id, wt.category_id
+  ),
+  doc_items AS (
+    SELECT document_id, SUM(weight_kg) AS weight_kg, SUM(item_value) AS item_value
+    FROM cat_items
+    GROUP BY document_id
+  )
+  INSERT INTO geo_stats
+  SELECT tx.year, tx.county, tx.normalized_city, 0,
+         COUNT(*), SUM(tx.gross_value),
+         COALESCE(SUM(di.weight_kg), 0), COALESCE(SUM(di.item_value), 0),
+         COALESCE(array_agg(DISTINCT tx.cnp) FILTER (WHERE tx.cnp IS NOT NULL), '{}')
+  FROM tx
+  LEFT JOIN doc_items di ON di.document_id = tx.document_id
+  GROUP BY tx.year, tx.county, tx.normalized_city
+  UNION ALL
+  SELECT tx.year, tx.county, tx.normalized_city, ci.category_id,
+         COUNT(*), SUM(tx.gross_value), SUM(ci.weight_kg), SUM(ci.item_value),
+         COALESCE(array_agg(DISTINCT tx.cnp) FILTER (WHERE tx.cnp IS NOT NULL), '{}')
+  FROM tx
+  JOIN cat_items ci ON ci.document_id = tx.document_id
+  GROUP BY tx.year, tx.county, tx.normalized_city, ci.category_id;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END;
+$$;
@@ -0,0 +1,102 @@
+-- scripts/migrations/010_create_age_groups.sql
+-- One definition of the partner age buckets. age_group(birth_year, year) is
+-- used for both the age at transaction time (cube_activity.age_group) and the
+-- age now (the new cube_activity.age_group_now dimension), so the demographic
+-- endpoints group pre-bucketed cube cells instead of running a CASE per joined row.
+-- age_group_now depends on the current year: age_as_of records the year the cell
+-- was built and refresh_cube_activity() also rebuilds any year that went stale.
+CREATE OR REPLACE FUNCTION age_group(p_birth_year INT, p_year INT)
+RETURNS TEXT LANGUAGE sql IMMUTABLE AS $$
+  SELECT CASE
+           WHEN p_birth_year IS NULL OR p_birth_year = 0 THEN 'Necunoscut'
+           WHEN p_year - p_birth_year < 25 THEN '18-24'
+           WHEN p_year - p_birth_year < 35 THEN '25-34'
+           WHEN p_year - p_birth_year < 45 THEN '35-44'
+           WHEN p_year - p_birth_year < 55 THEN '45-54'
+           WHEN p_year - p_birth_year < 65 THEN '55-64'
+           ELSE '65+'
+         END;
+$$;
+
+ALTER TABLE cube_activity ADD COLUMN IF NOT EXISTS age_group_now VARCHAR(12) NOT NULL DEFAULT 'Necunoscut';
+ALTER TABLE cube_activity ADD COLUMN IF NOT EXISTS age_as_of SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE cube_activity DROP CONSTRAINT IF EXISTS cube_activity_pkey;
+ALTER TABLE cube_activity ADD PRIMARY KEY (year, month, category_id, county, sex, age_group, age_group_now);
+
+CREATE OR REPLACE FUNCTION refresh_cube_activity(p_year_from INT, p_year_to INT)
+RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+  n INT;
+  this_year INT := EXTRACT(YEAR FROM CURRENT_DATE)::int;
+BEGIN
+  -- Widen the range to the years whose age_group_now was bucketed in an earlier year
+  SELECT LEAST(p_year_from, MIN(year)), GREATEST(p_year_to, MAX(year))
+    INTO p_year_from, p_year_to
+    FROM cube_activity WHERE age_as_of <> this_year;
+
+  DELETE FROM cube_activity WHERE year BETWEEN p_year_from AND p_year_to;
+
+  WITH tx AS (
+    SELECT t.document_id, t.cnp, t.date,
+           COALESCE(t.gross_value, 0) AS gross_value,
+           COALESCE(t.net_paid, 0) AS net_paid,
+           EXTRACT(YEAR FROM t.date)::int AS year,
+           EXTRACT(MONTH FROM t.date)::int AS month,
+           COALESCE(p.county, 'Necunoscut') AS county,
+           COALESCE(p.sex, '') AS sex,
+           age_group(p.birth_year, EXTRACT(YEAR FROM t.date)::int) AS age_group,
+           age_group(p.birth_year, this_year) AS age_group_now
+    FROM transactions t
+    LEFT JOIN partners p ON p.cnp = t.cnp
+    WHERE t.date >= make_date(p_year_from, 1, 1)
+      AND t.date < make_date(p_year_to + 1, 1, 1)
+  ),
+  cat_items AS (
+    SELECT ti.document_id, wt.category_id,
+           COUNT(*) AS items,
+           COALESCE(SUM(ti.weight_kg), 0) AS weight_kg,
+           COALESCE(SUM(ti.value), 0) AS item_value,
+           COALESCE(SUM(ti.price_per_kg), 0) AS price_sum
+    FROM transaction_items ti
+    JOIN waste_types wt ON wt.id = ti.waste_type_id
+    JOIN tx ON tx.document_id = ti.document_id
+    GROUP BY ti.document_id, wt.category_id
+  ),
+  doc_items AS (
+    SELECT document_id, SUM(items) AS items, SUM(weight_kg) AS weight_kg,
+           SUM(item_value) AS item_value, SUM(price_sum) AS price_sum
+    FROM cat_items
+    GROUP BY document_id
+  )
+  INSERT INTO cube_activity (year, month, category_id, county, sex, age_group, age_group_now,
+                             transactions, gross_value, net_paid, items, weight_kg, item_value,
+                             price_sum, day_mask, partners, age_as_of)
+  SELECT tx.year, tx.month, 0, tx.county, tx.sex, tx.age_group, tx.age_group_now,
+         COUNT(*), SUM(tx.gross_value), SUM(tx.net_paid),
+         COALESCE(SUM(di.items), 0), COALESCE(SUM(di.weight_kg), 0),
+         COALESCE(SUM(di.item_value), 0), COALESCE(SUM(di.price_sum), 0),
+         bit_or(1 << (EXTRACT(DAY FROM tx.date)::int - 1)),
+         COALESCE(array_agg(DISTINCT tx.cnp) FILTER (WHERE tx.cnp IS NOT NULL), '{}'),
+         this_year
+  FROM tx
+  LEFT JOIN doc_items di ON di.document_id = tx.document_id
+  GROUP BY tx.year, tx.month, tx.county, tx.sex, tx.age_group, tx.age_group_now
+  UNION ALL
+  SELECT tx.year, tx.month, ci.category_id, tx.county, tx.sex, tx.age_group, tx.age_group_now,
+         COUNT(*), SUM(tx.gross_value), SUM(tx.net_paid),
+         SUM(ci.items), SUM(ci.weight_kg), SUM(ci.item_value), SUM(ci.price_sum),
+         bit_or(1 << (EXTRACT(DAY FROM tx.date)::int - 1)),
+         COALESCE(array_agg(DISTINCT tx.cnp) FILTER (WHERE tx.cnp IS NOT NULL), '{}'),
+         this_year
+  FROM tx
+  JOIN cat_items ci ON ci.document_id = tx.document_id
+  GROUP BY tx.year, tx.month, ci.category_id, tx.county, tx.sex, tx.age_group, tx.age_group_now;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END;
+$$;
+
+-- Bucket the existing cells (age_group_now is still the column default)
+SELECT refresh_cube_activity(EXTRACT(YEAR FROM MIN(date))::int, EXTRACT(YEAR FROM MAX(date))::int)
+FROM transactions;
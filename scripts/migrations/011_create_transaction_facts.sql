@@ -0,0 +1,52 @@
+-- scripts/migrations/011_create_transaction_facts.sql
+-- One row per document with its items pre-summed. Daily metrics that joined
+-- transactions to transaction_items counted gross_value (and COUNT(*)) once per
+-- item; reading this table gives document-level totals without the wide join.
+CREATE TABLE IF NOT EXISTS transaction_facts (
+  document_id VARCHAR(50) PRIMARY KEY,
+  date DATE NOT NULL,
+  cnp VARCHAR(13),
+  gross_value NUMERIC(12,2) NOT NULL,
+  net_paid NUMERIC(12,2) NOT NULL,
+  items INT NOT NULL,
+  weight_kg NUMERIC(12,2) NOT NULL,
+  item_value NUMERIC(12,2) NOT NULL,
+  category_ids INT[] NOT NULL              -- distinct waste categories on the document
+);
+
+CREATE INDEX IF NOT EXISTS idx_transaction_facts_date ON transaction_facts(date);
+CREATE INDEX IF NOT EXISTS idx_transaction_facts_cnp ON transaction_facts(cnp, date);
+
+-- Rebuild a year range. Called by scripts/import_xls.py (through
+-- refresh_rollups) for the years it touched and by scripts/refresh_rollups.py.
+CREATE OR REPLACE FUNCTION refresh_transaction_facts(p_year_from INT, p_year_to INT)
+RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+  n INT;
+BEGIN
+  DELETE FROM transaction_facts
+  WHERE date >= make_date(p_year_from, 1, 1) AND date < make_date(p_year_to + 1, 1, 1);
+
+  INSERT INTO transaction_facts
+  SELECT t.document_id, t.date, t.cnp,
+         COALESCE(t.gross_value, 0), COALESCE(t.net_paid, 0),
+         COALESCE(di.items, 0), COALESCE(di.weight_kg, 0), COALESCE(di.item_value, 0),
+         COALESCE(di.category_ids, '{}')
+  FROM transactions t
+  LEFT JOIN (
+    SELECT ti.document_id, COUNT(*) AS items,
+           COALESCE(SUM(ti.weight_kg), 0) AS weight_kg,
+           COALESCE(SUM(ti.value), 0) AS item_value,
+           array_agg(DISTINCT wt.category_id) FILTER (WHERE wt.category_id IS NOT NULL) AS category_ids
+    FROM transaction_items ti
+    JOIN transactions tx ON tx.document_id = ti.document_id
+    LEFT JOIN waste_types wt ON wt.id = ti.waste_type_id
+    WHERE tx.date >= make_date(p_year_from, 1, 1) AND tx.date < make_date(p_year_to + 1, 1, 1)
+    GROUP BY ti.document_id
+  ) di ON di.document_id = t.document_id
+  WHERE t.date >= make_date(p_year_from, 1, 1) AND t.date < make_date(p_year_to + 1, 1, 1);
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END;
+$$;
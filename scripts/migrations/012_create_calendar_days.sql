@@ -0,0 +1,109 @@
+-- scripts/migrations/012_create_calendar_days.sql
+-- Calendar dimension: one row per day with the flags every calendar endpoint
+-- used to recompute from holidays / company_closures / transactions.
+--   is_open           not a Sunday, official holiday or confirmed company closure
+--   is_bridge         open day with a closed day on both sides
+--   holiday_block_id  YYYYMMDD of the block start for days inside a holiday
+--                     block: a run of days without trading (no transactions,
+--                     Sunday or official holiday) containing an official holiday
+-- Rebuilt by refresh_calendar_days(), called from scripts/seed_holidays.py, the
+-- calendar POST handler and the importer (through refresh_rollups).
+CREATE TABLE IF NOT EXISTS calendar_days (
+  date DATE PRIMARY KEY,
+  isodow SMALLINT NOT NULL,
+  is_sunday BOOLEAN NOT NULL,
+  is_official_holiday BOOLEAN NOT NULL,
+  holiday_names TEXT,                      -- official holiday names, ', '-separated
+  is_company_closure BOOLEAN NOT NULL,     -- in company_closures, not '__ignored__'
+  is_bridge BOOLEAN NOT NULL,
+  is_open BOOLEAN NOT NULL,
+  holiday_block_id INT,
+  tx_count INT NOT NULL,
+  partners INT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_calendar_days_open ON calendar_days(date) WHERE is_open;
+CREATE INDEX IF NOT EXISTS idx_calendar_days_block ON calendar_days(holiday_block_id) WHERE holiday_block_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_calendar_days_trading ON calendar_days(date) WHERE tx_count > 0;
+
+-- Rebuilds the whole calendar (holiday blocks and bridges span year boundaries),
+-- covering every year with transactions or holidays plus the requested range.
+CREATE OR REPLACE FUNCTION refresh_calendar_days(p_year_from INT, p_year_to INT)
+RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+  n INT;
+  y_from INT;
+  y_to INT;
+  tx_from DATE;
+  tx_to DATE;
+BEGIN
+  SELECT MIN(date), MAX(date) INTO tx_from, tx_to FROM transactions;
+  SELECT LEAST(p_year_from, EXTRACT(YEAR FROM tx_from)::int, EXTRACT(YEAR FROM MIN(date))::int),
+         GREATEST(p_year_to, EXTRACT(YEAR FROM tx_to)::int, EXTRACT(YEAR FROM MAX(date))::int)
+    INTO y_from, y_to
+    FROM holidays;
+
+  DELETE FROM calendar_days;
+  IF y_from IS NULL THEN
+    RETURN 0;
+  END IF;
+
+  INSERT INTO calendar_days
+  WITH days AS (
+    SELECT generate_series(make_date(y_from, 1, 1), make_date(y_to, 12, 31), '1 day'::interval)::date AS d
+  ),
+  official AS (
+    SELECT date, STRING_AGG(DISTINCT name, ', ') AS names
+    FROM holidays WHERE is_official GROUP BY date
+  ),
+  closures AS (
+    SELECT date FROM company_closures WHERE reason IS DISTINCT FROM '__ignored__'
+  ),
+  tx AS (
+    SELECT date, COUNT(*) AS tx_count, COUNT(DISTINCT cnp) AS partners
+    FROM transactions GROUP BY date
+  ),
+  marked AS (
+    SELECT days.d, EXTRACT(ISODOW FROM days.d)::int AS isodow,
+           o.date IS NOT NULL AS is_official, o.names,
+           c.date IS NOT NULL AS is_closure,
+           COALESCE(tx.tx_count, 0) AS tx_count, COALESCE(tx.partners, 0) AS partners
+    FROM days
+    LEFT JOIN official o ON o.date = days.d
+    LEFT JOIN closures c ON c.date = days.d
+    LEFT JOIN tx ON tx.date = days.d
+  ),
+  flagged AS (
+    SELECT *,
+           (isodow = 7 OR is_official OR is_closure) AS is_closed,
+           (tx_count > 0 AND isodow <> 7 AND NOT is_official) AS is_trading
+    FROM marked
+  ),
+  islands AS (
+    SELECT *,
+           SUM(CASE WHEN is_trading THEN 1 ELSE 0 END) OVER (ORDER BY d) AS grp,
+           LAG(is_closed) OVER (ORDER BY d) AS prev_closed,
+           LEAD(is_closed) OVER (ORDER BY d) AS next_closed
+    FROM flagged
+  ),
+  blocks AS (
+    SELECT grp, to_char(MIN(d), 'YYYYMMDD')::int AS block_id
+    FROM islands
+    WHERE NOT is_trading AND d BETWEEN tx_from AND tx_to
+    GROUP BY grp
+    HAVING bool_or(is_official)
+  )
+  SELECT i.d, i.isodow, i.isodow = 7, i.is_official, i.names, i.is_closure,
+         NOT i.is_closed AND COALESCE(i.prev_closed, false) AND COALESCE(i.next_closed, false),
+         NOT i.is_closed,
+         CASE WHEN NOT i.is_trading AND i.d BETWEEN tx_from AND tx_to THEN b.block_id END,
+         i.tx_count, i.partners
+  FROM islands i
+  LEFT JOIN blocks b ON b.grp = i.grp;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END;
+$$;
+
+SELECT refresh_calendar_days(EXTRACT(YEAR FROM CURRENT_DATE)::int, EXTRACT(YEAR FROM CURRENT_DATE)::int);
@@ -0,0 +1,64 @@
+-- scripts/migrations/013_create_holiday_blocks.sql
+-- One row per holiday block (see calendar_days.holiday_block_id) with the
+-- nearest trading days on each side, nearest first, up to p_max_window days.
+-- The calendar holiday_effect and analytics holidays views slice these arrays
+-- for their window instead of re-deriving blocks and ranking every trading
+-- day against every block. Rebuilt after calendar_days by seed_holidays.py,
+-- the calendar POST actions and refresh_rollups.
+CREATE TABLE IF NOT EXISTS holiday_blocks (
+  block_id INT PRIMARY KEY,                -- YYYYMMDD of block_start
+  block_start DATE NOT NULL,
+  block_end DATE NOT NULL,
+  year SMALLINT NOT NULL,                  -- year of block_start
+  year_label VARCHAR(7) NOT NULL,          -- '2024' or '2024/25' across New Year
+  block_name TEXT NOT NULL,                -- official holiday names, ' + '-separated
+  days_total INT NOT NULL,
+  before_dates DATE[] NOT NULL,
+  before_partners INT[] NOT NULL,
+  after_dates DATE[] NOT NULL,
+  after_partners INT[] NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_holiday_blocks_year ON holiday_blocks(year);
+
+CREATE OR REPLACE FUNCTION refresh_holiday_blocks(p_year_from INT, p_year_to INT, p_max_window INT DEFAULT 20)
+RETURNS INT LANGUAGE plpgsql AS $$
+DECLARE
+  n INT;
+BEGIN
+  -- Blocks can shift whenever a day changes anywhere, so the year range is ignored
+  DELETE FROM holiday_blocks;
+
+  INSERT INTO holiday_blocks
+  WITH blocks AS (
+    SELECT holiday_block_id, MIN(date) AS block_start, MAX(date) AS block_end,
+           STRING_AGG(holiday_names, ' + ' ORDER BY date) AS block_name
+    FROM calendar_days
+    WHERE holiday_block_id IS NOT NULL
+    GROUP BY holiday_block_id
+  )
+  SELECT b.holiday_block_id, b.block_start, b.block_end,
+         EXTRACT(YEAR FROM b.block_start)::int,
+         CASE
+           WHEN EXTRACT(YEAR FROM b.block_start) = EXTRACT(YEAR FROM b.block_end)
+             THEN EXTRACT(YEAR FROM b.block_start)::text
+           ELSE EXTRACT(YEAR FROM b.block_start)::text || '/' || RIGHT(EXTRACT(YEAR FROM b.block_end)::text, 2)
+         END,
+         b.block_name,
+         b.block_end - b.block_start + 1,
+         ARRAY(SELECT c.date FROM calendar_days c WHERE c.tx_count > 0 AND c.date < b.block_start
+               ORDER BY c.date DESC LIMIT p_max_window),
+         ARRAY(SELECT c.partners FROM calendar_days c WHERE c.tx_count > 0 AND c.date < b.block_start
+               ORDER BY c.date DESC LIMIT p_max_window),
+         ARRAY(SELECT c.date FROM calendar_days c WHERE c.tx_count > 0 AND c.date > b.block_end
+               ORDER BY c.date LIMIT p_max_window),
+         ARRAY(SELECT c.partners FROM calendar_days c WHERE c.tx_count > 0 AND c.date > b.block_end
+               ORDER BY c.date LIMIT p_max_window)
+  FROM blocks b;
+
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END;
+$$;
+
+SELECT refresh_holiday_blocks(NULL, NULL);
@@ -0,0 +1,9 @@
+-- scripts/migrations/014_create_weather_forecast.sql
+-- Cached Open-Meteo 7-day forecast, one row per forecast day with the same
+-- columns as weather_oradea (as JSON). Filled by scripts/fetch_weather.py
+-- --forecast and, when older than the TTL, by /api/weather?type=forecast itself.
+CREATE TABLE IF NOT EXISTS weather_forecast (
+  date DATE PRIMARY KEY,
+  weather JSONB NOT NULL,
+  fetched_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
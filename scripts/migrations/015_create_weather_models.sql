@@ -0,0 +1,22 @@
+-- scripts/migrations/015_create_weather_models.sql
+-- Weather-traffic ridge model per metric (api/_lib/weathermodel.py), fitted
+-- offline by scripts/train_weather_model.py and applied by
+-- /api/weather?type=forecast. Coefficients act on standardized features
+-- ((x - mean) / scale, in the order of features); the fit statistics are in
+-- residual percentage points on the training days.
+CREATE TABLE IF NOT EXISTS weather_models (
+  metric VARCHAR(20) PRIMARY KEY,          -- partners | transactions | kg | ron
+  trained_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  data_from DATE NOT NULL,
+  data_to DATE NOT NULL,
+  features TEXT[] NOT NULL,
+  intercept DOUBLE PRECISION NOT NULL,
+  coefficients DOUBLE PRECISION[] NOT NULL,
+  means DOUBLE PRECISION[] NOT NULL,
+  scales DOUBLE PRECISION[] NOT NULL,
+  ridge_lambda DOUBLE PRECISION NOT NULL,
+  n INT NOT NULL,
+  r2 DOUBLE PRECISION,
+  rmse DOUBLE PRECISION,
+  mae DOUBLE PRECISION
+);
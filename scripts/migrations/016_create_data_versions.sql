@@ -0,0 +1,35 @@
+-- scripts/migrations/016_create_data_versions.sql
+-- Change counter per source table of the in-memory caches in api/_lib
+-- (weatherdaily: transaction_facts + weather_oradea, columnar: vanzari + firme).
+-- Statement-level triggers bump the row of the table a statement wrote to, so
+-- a warm instance checks one primary-key lookup per request instead of
+-- COUNT(*) / MAX(xmin) over the whole table.
+CREATE TABLE IF NOT EXISTS data_versions (
+  table_name VARCHAR(63) PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0,
+  changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION bump_data_version()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO data_versions (table_name, version, changed_at)
+  VALUES (TG_TABLE_NAME, 1, now())
+  ON CONFLICT (table_name) DO UPDATE
+    SET version = data_versions.version + 1, changed_at = EXCLUDED.changed_at;
+  RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+  t TEXT;
+BEGIN
+  FOREACH t IN ARRAY ARRAY['transaction_facts', 'weather_oradea', 'vanzari', 'firme'] LOOP
+    INSERT INTO data_versions (table_name) VALUES (t) ON CONFLICT DO NOTHING;
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_data_version ON %1$I', t);
+    EXECUTE format('CREATE TRIGGER trg_%1$s_data_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %1$I '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()', t);
+  END LOOP;
+END;
+$$;
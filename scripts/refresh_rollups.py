@@ -0,0 +1,88 @@
+# scripts/refresh_rollups.py
+"""Rebuild the pre-aggregated rollup tables from transactions / transaction_items.
+scripts/import_xls.py already refreshes the years it touched; run this after
+applying a rollup migration or after editing partners by hand. sumar_firme is
+kept current by its triggers on vanzari and is only rebuilt with --b2b.
+
+Usage:
+  python scripts/refresh_rollups.py --self-test              # HLL sketch checks
+  python scripts/refresh_rollups.py                          # all years with data
+  python scripts/refresh_rollups.py --year-from 2025 --year-to 2026
+  python scripts/refresh_rollups.py --b2b                    # also sumar_firme
+"""
+import argparse, os, sys
+import psycopg2, psycopg2.extensions
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / 'api'))
+from _lib import hll, sketches
+
+# (rollup table, builder): builder is the name of an SQL function(year_from, year_to)
+# or a Python callable(cur, year_from, year_to); both return the number of rows written.
+ROLLUPS = [
+    ('transaction_facts', 'refresh_transaction_facts'),
+    ('calendar_days', 'refresh_calendar_days'),
+    ('holiday_blocks', 'refresh_holiday_blocks'),
+    ('cube_activity', 'refresh_cube_activity'),
+    ('partner_sketches', sketches.build),
+    ('city_stats', 'refresh_city_stats'),
+    ('geo_stats', 'refresh_geo_stats'),
+]
+# Built from vanzari, not transactions: only on request (--b2b)
+B2B_ROLLUPS = [
+    ('sumar_firme', 'refresh_sumar_firme'),
+]
+
+def load_env_local():
+    env = Path(__file__).parent.parent / '.env.local'
+    if env.exists():
+        for line in env.read_text().splitlines():
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            k, v = line.split('=', 1)
+            os.environ.setdefault(k, v.strip().strip('"').strip("'"))
+
+def refresh(conn, year_from, year_to, b2b=False):
+    """Rebuild every rollup (plus B2B_ROLLUPS if b2b) for the year range (caller commits)."""
+    with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+        for table, builder in ROLLUPS + (B2B_ROLLUPS if b2b else []):
+            if callable(builder):
+                n = builder(cur, year_from, year_to)
+            else:
+                cur.execute(f"SELECT {builder}(%s, %s)", (year_from, year_to))
+                n = cur.fetchone()[0]
+            print(f"  {table}: {n} rows for {year_from}-{year_to}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--year-from', type=int)
+    parser.add_argument('--year-to', type=int)
+    parser.add_argument('--b2b', action='store_true', help='Also rebuild sumar_firme from vanzari')
+    parser.add_argument('--self-test', action='store_true')
+    args = parser.parse_args()
+    if args.self_test:
+        hll.self_test()
+        sys.exit(0)
+    load_env_local()
+    url = os.environ.get('POSTGRES_URL')
+    if not url:
+        print("POSTGRES_URL not set"); sys.exit(1)
+    conn = psycopg2.connect(url)
+    with conn.cursor() as cur:
+        year_from, year_to = args.year_from, args.year_to
+        if year_from is None or year_to is None:
+            cur.execute("SELECT EXTRACT(YEAR FROM MIN(date))::int, EXTRACT(YEAR FROM MAX(date))::int FROM transactions")
+            lo, hi = cur.fetchone()
+            if args.b2b:
+                cur.execute("SELECT MIN(year), MAX(year) FROM vanzari")
+                v_lo, v_hi = cur.fetchone()
+                lo = min((y for y in (lo, v_lo) if y is not None), default=None)
+                hi = max((y for y in (hi, v_hi) if y is not None), default=None)
+            year_from = year_from if year_from is not None else lo
+            year_to = year_to if year_to is not None else hi
+    if year_from is None:
+        print("No transactions"); sys.exit(0)
+    refresh(conn, year_from, year_to, args.b2b)
+    conn.commit()
+    conn.close()
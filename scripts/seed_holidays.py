@@ -1,5 +1,6 @@
 # scripts/seed_holidays.py
-"""Seed the holidays table for a year range. Computes Catholic and Orthodox Easter.
+"""Seed the holidays table for a year range (and rebuild calendar_days /
+holiday_blocks). Computes Catholic and Orthodox Easter.
 
 Usage:
   python scripts/seed_holidays.py --self-test              # just run algorithm checks
@@ -125,6 +126,9 @@ def upsert_holidays(year_from: int, year_to: int):
             """,
             rows,
         )
+        # calendar_days carries the holiday flags, holiday_blocks the blocks
+        cur.execute("SELECT refresh_calendar_days(%s, %s)", (year_from, year_to))
+        cur.execute("SELECT refresh_holiday_blocks(%s, %s)", (year_from, year_to))
     conn.commit()
     conn.close()
     return len(rows)
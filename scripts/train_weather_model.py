@@ -0,0 +1,85 @@
+# scripts/train_weather_model.py
+"""Fit the weather-traffic ridge model (api/_lib/weathermodel.py) for each
+metric on the full history and store it in weather_models, where
+/api/weather?type=forecast picks it up. Meant to run nightly, after
+fetch_weather.py --incremental.
+
+Usage:
+  python scripts/train_weather_model.py --self-test          # fit on synthetic data
+  python scripts/train_weather_model.py                      # all metrics
+  python scripts/train_weather_model.py --metric kg --lambda 5
+"""
+import argparse, os, random, sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+sys.path.append(str(Path(__file__).parent.parent / 'api'))
+from _lib import weatherdaily, weathermodel
+
+def load_env_local():
+    env = Path(__file__).parent.parent / '.env.local'
+    if env.exists():
+        for line in env.read_text().splitlines():
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            k, v = line.split('=', 1)
+            os.environ.setdefault(k, v.strip().strip('"').strip("'"))
+
+def train(cur, metrics, ridge_lambda):
+    daily = weatherdaily.daily_residuals(cur, None, None)
+    holidays = weathermodel.official_holidays(cur)
+    for metric in metrics:
+        dates, X, y = weathermodel.training_set(daily['residuals'][metric], holidays)
+        if len(X) < 2 * len(weathermodel.FEATURES):
+            print(f"  {metric}: only {len(X)} days, skipped")
+            continue
+        model = weathermodel.fit(X, y, ridge_lambda)
+        weathermodel.store(cur, metric, model, dates[0], dates[-1])
+        print(f"  {metric}: n={model['n']} r2={model['r2']:.3f} "
+              f"rmse={model['rmse']:.1f}pp mae={model['mae']:.1f}pp ({dates[0]}..{dates[-1]})")
+
+def self_test():
+    """The fit recovers a known rain / holiday effect from noisy synthetic days."""
+    rng = random.Random(7)
+    holidays = {date(2024, 5, 1), date(2024, 12, 25)}
+    rows = []
+    d = date(2024, 1, 1)
+    while d < date(2025, 1, 1):
+        if d.isoweekday() != 7:
+            rain = rng.choice([0, 0, 0, 2, 8, 25])
+            w = {'temp_max': 10 + 15 * rng.random(), 'precipitation_sum': rain, 'snowfall_sum': 0,
+                 'wind_gusts_max': 30, 'humidity_mean': 70, 'cloudcover_mean': 50}
+            pct = -1.2 * rain + (15 if d - timedelta(days=1) in holidays else 0) + rng.gauss(0, 3)
+            rows.append({'date': d, 'residual_pct': pct, **w})
+        d += timedelta(days=1)
+    dates, X, y = weathermodel.training_set(rows, holidays)
+    model = weathermodel.fit(X, y, ridge_lambda=0.1)
+    dry = weathermodel.features(date(2024, 6, 4), {**rows[0], 'precipitation_sum': 0}, holidays)
+    wet = weathermodel.features(date(2024, 6, 4), {**rows[0], 'precipitation_sum': 20}, holidays)
+    rain_effect = weathermodel.predict(model, wet) - weathermodel.predict(model, dry)
+    assert abs(rain_effect - (-24)) < 2, rain_effect
+    assert model['r2'] > 0.8, model['r2']
+    print(f"Self-test OK: rain effect {rain_effect:.1f}pp for 20mm (expected -24), r2={model['r2']:.3f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--self-test', action='store_true')
+    parser.add_argument('--metric', choices=list(weatherdaily.METRICS))
+    parser.add_argument('--lambda', dest='ridge_lambda', type=float, default=weathermodel.DEFAULT_LAMBDA)
+    args = parser.parse_args()
+    if args.self_test:
+        self_test()
+        sys.exit(0)
+    load_env_local()
+    url = os.environ.get('POSTGRES_URL')
+    if not url:
+        print("POSTGRES_URL not set"); sys.exit(1)
+    conn = psycopg2.connect(url, cursor_factory=RealDictCursor)
+    with conn.cursor() as cur:
+        train(cur, [args.metric] if args.metric else list(weatherdaily.METRICS), args.ridge_lambda)
+    conn.commit()
+    conn.close()